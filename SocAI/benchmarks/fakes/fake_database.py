@@ -0,0 +1,129 @@
+"""
+In-memory stand-in for CassandraDBOperations.
+
+Rows are kept in a dict and the similarity query is a brute force cosine scan over the most recent `scan_limit`
+vectors, reported like Astra's similarity_cosine, (1 + cosine) / 2. Every request waits `latency` seconds, the
+asynchronous insert calls its callbacks from a timer thread as the driver does from its event loop. The time at
+which each row was written is kept so a load test can tell when an alert completed.
+"""
+import json
+import operator
+import threading
+import time
+
+from SocAI.models.database.cassandradboperations import Neighbour, SimilarityResult
+
+
+class FakeResponseFuture:
+    def __init__(self, function, latency):
+        """Run the function after `latency` seconds, like a driver request, and hand its outcome to callbacks."""
+        self.function = function
+        self.callbacks = []
+        self.errbacks = []
+        self.outcome = None
+        self.lock = threading.Lock()
+        timer = threading.Timer(latency, self._complete)
+        timer.daemon = True
+        timer.start()
+
+    def add_callback(self, fn, *args):
+        self.add_callbacks(fn, lambda error: None, callback_args=args)
+
+    def add_callbacks(self, callback, errback, callback_args=(), errback_args=()):
+        # Like the driver, callbacks added once the request completed run right away in the caller's thread
+        with self.lock:
+            if self.outcome is None:
+                self.callbacks.append((callback, callback_args))
+                self.errbacks.append((errback, errback_args))
+                return
+        self._call(self.outcome, [(callback, callback_args)], [(errback, errback_args)])
+
+    def _complete(self):
+        try:
+            outcome = (True, self.function())
+        except Exception as e:
+            outcome = (False, e)
+        with self.lock:
+            self.outcome = outcome
+            callbacks, errbacks = self.callbacks, self.errbacks
+        self._call(outcome, callbacks, errbacks)
+
+    @staticmethod
+    def _call(outcome, callbacks, errbacks):
+        success, value = outcome
+        for function, args in callbacks if success else errbacks:
+            function(value, *args)
+
+
+class InMemoryCassandraDBOperations:
+    def __init__(self, latency=0.005, scan_limit=5000):
+        self.latency = latency
+        self.scan_limit = scan_limit
+        self.rows = {}
+        self.vectors = []
+        self.stored_at = {}
+        self.condition = threading.Condition()
+
+    def create_table(self):
+        pass
+
+    def prepare_statements(self, fields):
+        pass
+
+    def insert_data(self, fields, values):
+        time.sleep(self.latency)
+        self._write(fields, values)
+        return True
+
+    def insert_data_async(self, fields, values):
+        return FakeResponseFuture(lambda: self._write(fields, values), self.latency)
+
+    def _write(self, fields, values):
+        row = dict(zip(fields, values))
+        with self.condition:
+            if row['id'] not in self.rows and row.get('alert_body_vector'):
+                self.vectors.append((row['id'], row['alert_body_vector']))
+            self.rows[row['id']] = row
+            self.stored_at[row['id']] = time.perf_counter()
+            self.condition.notify_all()
+
+    def query_similar(self, value, threshold=0.9, top_k=100, neighbours=3):
+        time.sleep(self.latency)
+        with self.condition:
+            candidates = self.vectors[-self.scan_limit:]
+        scored = sorted(((1 + sum(map(operator.mul, value, vector))) / 2, row_id) for row_id, vector in candidates)
+        similar = []
+        for similarity, row_id in reversed(scored[-top_k:]):
+            if similarity < threshold:
+                break
+            row = self.rows[row_id]
+            similar.append(Neighbour(row_id, similarity, row.get('evaluation'), row.get('ti_signature')))
+        return SimilarityResult(len(similar), similar[:neighbours])
+
+    def scan_vectors(self, since=None, limit=None):
+        with self.condition:
+            rows = [row for row in self.rows.values() if row.get('alert_body_vector') and row.get('stored_at')
+                    and (since is None or row['stored_at'].timestamp() >= since)]
+        for row in rows[:limit]:
+            yield (row['id'], row.get('evaluation'), row.get('ti_signature'), row['alert_body_vector'],
+                   row['stored_at'].timestamp())
+
+    def get_verdict(self, id):
+        time.sleep(self.latency)
+        row = self.rows.get(id)
+        if row is None or row.get('evaluation') is None:
+            return None
+        return {'classification': row['evaluation'],
+                'reasoning': json.loads(row['reasoning']),
+                'next_steps': json.loads(row['next_steps'])}
+
+    def wait_for(self, ids, timeout):
+        """Wait until every id is stored or `timeout` seconds passed, return the ids still missing."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                missing = [row_id for row_id in ids if row_id not in self.stored_at]
+                remaining = deadline - time.monotonic()
+                if not missing or remaining <= 0:
+                    return missing
+                self.condition.wait(min(remaining, 1))
@@ -0,0 +1,117 @@
+"""
+Local HTTP stand-in for the OpenAI chat completions and embeddings endpoints.
+
+Every request waits `latency` seconds. A `rate_limit_ratio` share of the requests is answered with a 429 and a
+Retry-After header. Chat completions always classify the alert as a "standard alert"; when the prompt contains a
+batch of alerts keyed by id, every id gets a classification. Embeddings are the deterministic vectors of
+FakeEmbeddingBackend.
+
+Point the clients at it with api_base=stub.api_base (ChatGPT) or OPENAI_API_BASE (embeddings).
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from SocAI.utils.embedings import FakeEmbeddingBackend
+
+CLASSIFICATION = {
+    "classification": "standard alert",
+    "reasoning": ["The stub classifies every alert as a standard alert."],
+    "next_steps": [{"step": 1, "action": "None", "details": "Generated by the OpenAI stub."}],
+}
+ALERT_ID_PATTERN = re.compile(r'^### Alert (\S+)$', re.MULTILINE)
+
+
+class OpenAIStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        time.sleep(self.server.latency)
+
+        if self.server.should_rate_limit():
+            return self._answer(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                                "code": "rate_limit_exceeded"}},
+                                {'Retry-After': str(self.server.retry_after)})
+
+        if self.path.endswith('/chat/completions'):
+            return self._answer(200, self._chat_completion(request))
+        if self.path.endswith('/embeddings'):
+            return self._answer(200, self._embeddings(request))
+        return self._answer(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _chat_completion(self, request):
+        prompt = request['messages'][-1]['content']
+        alert_ids = ALERT_ID_PATTERN.findall(prompt)
+        content = json.dumps({alert_id: CLASSIFICATION for alert_id in alert_ids} if alert_ids else CLASSIFICATION)
+        prompt_tokens = sum(len(message['content']) for message in request['messages']) // 4
+        completion_tokens = len(content) // 4
+        self.server.count_tokens(prompt_tokens, completion_tokens)
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": request['model'],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _embeddings(self, request):
+        texts = request['input'] if isinstance(request['input'], list) else [request['input']]
+        # langchain sends token ids when it splits long texts, embed their textual form
+        texts = [text if isinstance(text, str) else json.dumps(text) for text in texts]
+        vectors = self.server.embedding_backend.embed_documents(texts)
+        return {
+            "object": "list", "model": request.get('model', 'text-embedding-ada-002'),
+            "data": [{"object": "embedding", "index": index, "embedding": vector}
+                     for index, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def _answer(self, status, payload, headers=None):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OpenAIStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.5, rate_limit_ratio=0.0, retry_after=1, host='127.0.0.1', port=0, seed=0):
+        super().__init__((host, port), OpenAIStubHandler)
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.embedding_backend = FakeEmbeddingBackend()
+        self.counters = {'requests': 0, 'rate_limited': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}/v1'
+
+    def should_rate_limit(self):
+        with self._lock:
+            self.counters['requests'] += 1
+            limited = self._random.random() < self.rate_limit_ratio
+            self.counters['rate_limited'] += limited
+            return limited
+
+    def count_tokens(self, prompt_tokens, completion_tokens):
+        with self._lock:
+            self.counters['prompt_tokens'] += prompt_tokens
+            self.counters['completion_tokens'] += completion_tokens
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
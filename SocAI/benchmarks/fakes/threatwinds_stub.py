@@ -0,0 +1,63 @@
+"""
+Local HTTP stand-in for the ThreatWinds entity search API.
+
+Entities whose value ends with an odd digit are reported with a bad reputation, every other entity is unknown
+(404). Each request waits `latency` seconds before answering.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENTITY_PATH = '/api/search/v1/entity'
+
+
+class ThreatWindsStubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients reusing connections can be told apart from clients that do not
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        self.server.count_request()
+
+        if self.path != ENTITY_PATH:
+            return self._answer(404, {})
+
+        entity = json.loads(body)
+        if entity['value'][-1:] in '13579':
+            return self._answer(200, {'reputation': -2, '@timestamp': '2023-06-01T00:00:00Z', 'tags': ['stub']})
+        return self._answer(404, {'message': 'not found'})
+
+    def _answer(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreatWindsStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, host='127.0.0.1', port=0):
+        super().__init__((host, port), ThreatWindsStubHandler)
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}{ENTITY_PATH}'
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
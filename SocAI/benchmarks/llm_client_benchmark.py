@@ -0,0 +1,49 @@
+"""
+Benchmark of ChatGPT against a local OpenAI stub with latency and injected 429 responses.
+
+Classifies the same alerts with one request at a time and with several concurrent requests, through the rate
+limited client, and reports the throughput and how many requests were rate limited and retried.
+
+Usage: python -m SocAI.benchmarks.llm_client_benchmark [--alerts 40] [--latency 0.5] [--rate-limit-ratio 0.1]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from SocAI.benchmarks.fakes.openai_stub import OpenAIStub
+from SocAI.models.chatgpt.chatgpt import ChatGPT
+from SocAI.models.chatgpt.llm_client import RateLimitedChatClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests-per-minute', type=int, default=3500)
+    parser.add_argument('--tokens-per-minute', type=int, default=180000)
+    args = parser.parse_args()
+
+    alerts = [f'{{"rule": "ssh brute force", "attempt": {i}}}' for i in range(args.alerts)]
+
+    print(f"{'concurrency':>12}{'alerts/s':>10}{'requests':>10}{'429s':>8}")
+    for concurrency in (1, args.concurrency):
+        stub = OpenAIStub(latency=args.latency, rate_limit_ratio=args.rate_limit_ratio).start()
+        client = RateLimitedChatClient('stub-key', requests_per_minute=args.requests_per_minute,
+                                       tokens_per_minute=args.tokens_per_minute, max_concurrency=concurrency,
+                                       base_delay=0.1, api_base=stub.api_base)
+        chatgpt = ChatGPT('stub-key', client=client)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(chatgpt.ask, alerts))
+        elapsed = time.perf_counter() - started
+        stub.shutdown()
+
+        print(f"{concurrency:>12}{len(alerts) / elapsed:>10.2f}{stub.counters['requests']:>10}"
+              f"{stub.counters['rate_limited']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+End-to-end load test of the alert pipeline against local stand-ins.
+
+The ingest API and a QueueWorker run in this process, wired to the ThreatWinds and OpenAI stubs and to an
+in-memory Cassandra. A corpus of alerts (NDJSON, one alert per line, or generated) is replayed into /process by
+concurrent clients, and every alert is followed until its verdict is stored.
+
+Reports the throughput in alerts per second, the p50/p95/p99 latency from the POST to the stored verdict, and
+the time spent per stage. With --output the report is also written as JSON, to compare runs.
+
+Usage: python -m SocAI.benchmarks.load_test [--alerts 500] [--corpus alerts.ndjson] [--clients 16] [--rate 0]
+                                            [--llm-latency 0.5] [--rate-limit-ratio 0] [--prompt-compaction]
+                                            [--batch-size 1] [--output report.json]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from SocAI.benchmarks.fakes.fake_database import InMemoryCassandraDBOperations
+from SocAI.benchmarks.fakes.openai_stub import OpenAIStub
+from SocAI.benchmarks.fakes.threatwinds_stub import ThreatWindsStub
+
+RULES = ('SSH brute force', 'Port scan detected', 'Malware signature match', 'Suspicious PowerShell execution',
+         'Login from unusual location', 'DNS query to newly registered domain')
+
+
+def generate_corpus(count, seed=0):
+    """Alerts built from a few rules with varying hosts, users and payloads, like a SIEM would forward them."""
+    generator = random.Random(seed)
+    alerts = []
+    for index in range(count):
+        ip = f"185.{generator.randint(1, 254)}.{generator.randint(0, 255)}.{generator.randint(1, 254)}"
+        alert = {
+            "id": index,
+            "rule": generator.choice(RULES),
+            "severity": generator.choice(('low', 'medium', 'high', 'critical')),
+            "timestamp": f"2023-06-01T{index // 3600 % 24:02d}:{index // 60 % 60:02d}:{index % 60:02d}Z",
+            "source_ip": ip,
+            "destination_ip": f"10.0.{generator.randint(0, 255)}.{generator.randint(1, 254)}",
+            "user": f"user{generator.randint(1, 50)}@example.com",
+            "domain": f"host{generator.randint(1, 200)}.example.net",
+            "log": "\n".join(f"sshd[{generator.randint(1000, 9999)}]: Failed password for invalid user "
+                             f"admin from {ip} port {generator.randint(1024, 65535)}"
+                             for _ in range(generator.randint(1, 20))),
+        }
+        alerts.append(json.dumps(alert))
+    return alerts
+
+
+def load_corpus(path):
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of the values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def post_alert(url, alert):
+    """POST the alert to /process, return its id, or None if the API rejected it."""
+    request = urllib.request.Request(f"{url}/process?{urllib.parse.urlencode({'data': alert})}", method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())['id']
+    except urllib.error.HTTPError:
+        return None
+
+
+def replay(url, alerts, clients, rate):
+    """Send the alerts with `clients` concurrent clients, at most `rate` per second (0 for no limit)."""
+    submitted_at = {}
+    rejected = []
+    started = time.perf_counter()
+
+    def send(index_alert):
+        index, alert = index_alert
+        if rate:
+            time.sleep(max(0.0, started + index / rate - time.perf_counter()))
+        sent = time.perf_counter()
+        item_id = post_alert(url, alert)
+        if item_id is None:
+            rejected.append(index)
+        else:
+            submitted_at.setdefault(item_id, sent)
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(send, enumerate(alerts)))
+    return submitted_at, len(rejected)
+
+
+def stage_report(stage_histogram):
+    """Calls, mean and total seconds per stage, from the histogram of QueueWorker."""
+    stages = {}
+    for (stage,), sample in stage_histogram.snapshot():
+        total, count = sample[-2], sample[-1]
+        stages[stage] = {'calls': count, 'mean_ms': total / count * 1000 if count else 0, 'total_s': total}
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=500, help='Alerts generated when no corpus is given.')
+    parser.add_argument('--corpus', help='NDJSON file of alerts to replay.')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=0, help='Alerts per second, 0 sends as fast as possible.')
+    parser.add_argument('--workers', type=int, default=8, help='QueueWorker concurrency.')
+    parser.add_argument('--poll-interval', type=float, default=0.1)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0)
+    parser.add_argument('--ti-latency', type=float, default=0.05)
+    parser.add_argument('--db-latency', type=float, default=0.005)
+    parser.add_argument('--embeddings', choices=('fake', 'stub'), default='fake',
+                        help='fake computes vectors locally, stub goes through langchain and the OpenAI stub.')
+    parser.add_argument('--verdict-cache-threshold', type=float)
+    parser.add_argument('--local-index', action='store_true',
+                        help='Answer the similarity queries from a local vector index, as LOCAL_VECTOR_INDEX does.')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Alerts per ChatGPT request, as CLASSIFICATION_BATCH_SIZE does. 1 disables batching.')
+    parser.add_argument('--prompt-compaction', action='store_true',
+                        help='Compact the alerts before prompting them, as PROMPT_COMPACTION does.')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', help='Write the report as JSON to this file.')
+    parser.add_argument('--label', default='', help='Name of the run in the JSON report.')
+    args = parser.parse_args()
+
+    alerts = load_corpus(args.corpus) if args.corpus else generate_corpus(args.alerts)
+    output = os.path.abspath(args.output) if args.output else None
+
+    openai_stub = OpenAIStub(latency=args.llm_latency, rate_limit_ratio=args.rate_limit_ratio).start()
+    threatwinds_stub = ThreatWindsStub(latency=args.ti_latency).start()
+    os.environ.setdefault('OPENAI_API_KEY', 'stub-key')
+    os.environ['OPENAI_API_BASE'] = openai_stub.api_base
+
+    # The API module creates queue.db in the working directory when it is imported
+    os.chdir(tempfile.mkdtemp(prefix='socai-load-test-'))
+    import uvicorn
+    from SocAI import main as api
+    from SocAI.controllers.queue_worker import STAGE_SECONDS, QueueWorker
+    from SocAI.models.chatgpt.chatgpt import ChatGPT, count_tokens
+    from SocAI.models.chatgpt.llm_client import LLM_TOKENS_TOTAL, RateLimitedChatClient
+    from SocAI.models.threat_intelligence.cached_threat_intelligence import CachedThreatIntelligence
+    from SocAI.models.threat_intelligence.threat_intelligence_checker import ThreatIntelligenceChecker
+    from SocAI.models.threat_intelligence.threat_winds import ThreatWinds
+    from SocAI.utils.compactor import AlertCompactor
+    from SocAI.utils.embedings import (EmbeddingCache, EmbeddingService, FakeEmbeddingBackend,
+                                       OpenAIEmbeddingBackend)
+
+    database = InMemoryCassandraDBOperations(latency=args.db_latency)
+    if args.local_index:
+        from SocAI.models.database.local_vector_index import LocallyIndexedDatabase, LocalVectorIndex
+
+        database = LocallyIndexedDatabase(database, LocalVectorIndex())
+        database.warm_up()
+    checker = ThreatIntelligenceChecker(CachedThreatIntelligence(
+        ThreatWinds('stub-key', 'stub-secret', base_url=threatwinds_stub.url)))
+    chatgpt = ChatGPT('stub-key', client=RateLimitedChatClient('stub-key', base_delay=0.1,
+                                                              api_base=openai_stub.api_base))
+    classifier = chatgpt
+    if args.batch_size > 1:
+        from SocAI.models.classifier.batching_classifier import BatchingClassifier
+
+        classifier = BatchingClassifier(chatgpt, max_batch_size=args.batch_size)
+    backend = FakeEmbeddingBackend() if args.embeddings == 'fake' else OpenAIEmbeddingBackend()
+    worker = QueueWorker(api.queue, database, checker, classifier, max_workers=args.workers,
+                         stage_limits={'llm': chatgpt.client.max_concurrency},
+                         poll_interval=args.poll_interval,
+                         embedding_service=EmbeddingService(backend, EmbeddingCache()),
+                         verdict_cache_threshold=args.verdict_cache_threshold, normalizer=api.normalizer,
+                         compactor=AlertCompactor(normalizer=api.normalizer, token_counter=count_tokens)
+                         if args.prompt_compaction else None)
+
+    server = uvicorn.Server(uvicorn.Config(api.fastapi_instance, host='127.0.0.1', port=0, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    worker.start()
+
+    started = time.perf_counter()
+    submitted_at, rejected = replay(f'http://127.0.0.1:{port}', alerts, args.clients, args.rate)
+    submitted = time.perf_counter() - started
+    missing = database.wait_for(list(submitted_at), args.timeout)
+    worker.stop(timeout=5)
+    server.should_exit = True
+
+    latencies = [database.stored_at[item_id] - sent for item_id, sent in submitted_at.items()
+                 if item_id in database.stored_at]
+    last_stored = max((database.stored_at[item_id] for item_id in submitted_at if item_id in database.stored_at),
+                      default=started)
+    tokens = dict((direction, value) for (direction,), value in LLM_TOKENS_TOTAL.snapshot())
+    report = {
+        'label': args.label,
+        'alerts': len(alerts),
+        'accepted': len(submitted_at),
+        'rejected': rejected,
+        'completed': len(latencies),
+        'missing': len(missing),
+        'ingest_alerts_per_second': len(submitted_at) / submitted if submitted else 0,
+        'alerts_per_second': len(latencies) / (last_stored - started) if latencies else 0,
+        'latency_seconds': {'p50': percentile(latencies, 0.50), 'p95': percentile(latencies, 0.95),
+                            'p99': percentile(latencies, 0.99)},
+        'stages': stage_report(STAGE_SECONDS),
+        'llm': {**openai_stub.counters, 'tokens_in': tokens.get('in', 0), 'tokens_out': tokens.get('out', 0)},
+        'threat_intelligence_requests': threatwinds_stub.requests,
+    }
+
+    print(f"alerts: {report['alerts']}, accepted: {report['accepted']}, rejected: {rejected}, "
+          f"completed: {report['completed']}, missing: {report['missing']}")
+    print(f"ingest: {report['ingest_alerts_per_second']:.1f} alerts/s, "
+          f"processing: {report['alerts_per_second']:.2f} alerts/s")
+    if latencies:
+        print("latency: " + ", ".join(f"{name} {value * 1000:.0f} ms"
+                                      for name, value in report['latency_seconds'].items()))
+    print(f"{'stage':<32}{'calls':>8}{'mean (ms)':>12}{'total (s)':>12}")
+    for stage, values in sorted(report['stages'].items(), key=lambda stage: -stage[1]['total_s']):
+        print(f"{stage:<32}{values['calls']:>8}{values['mean_ms']:>12.1f}{values['total_s']:>12.2f}")
+    print(f"OpenAI requests: {report['llm']['requests']} ({report['llm']['rate_limited']} rate limited), "
+          f"tokens in/out: {report['llm']['tokens_in']}/{report['llm']['tokens_out']}, "
+          f"ThreatWinds requests: {report['threat_intelligence_requests']}")
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    openai_stub.shutdown()
+    threatwinds_stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of the SQLite queue.
+
+Compares the connection-per-call, rollback-journal access pattern the queue used to have against the current
+QueueSystem (long-lived WAL connection, batched enqueue).
+
+Usage: python -m SocAI.benchmarks.queue_benchmark [--items 2000] [--batch 100]
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+
+from SocAI.utils.queue_manager import QueueSystem
+
+
+def _alerts(count, prefix):
+    return [f'{{"rule": "{prefix}", "event_id": {i}, "src_ip": "203.0.113.{i % 255}"}}' for i in range(count)]
+
+
+def _legacy_enqueue(path, data):
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO queue (id, data) VALUES (?, ?)", (hashlib.sha256(data.encode()).hexdigest(), data))
+
+
+def _legacy_dequeue_and_delete(path, limit):
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT id, data FROM queue LIMIT ?", (limit,)).fetchall()
+    for row in rows:
+        with sqlite3.connect(path) as conn:
+            conn.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+    return rows
+
+
+def _rate(count, started):
+    return count / (time.perf_counter() - started)
+
+
+def run_legacy(path, alerts, batch):
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS queue (id TEXT PRIMARY KEY, data TEXT)")
+
+    started = time.perf_counter()
+    for data in alerts:
+        _legacy_enqueue(path, data)
+    enqueue_rate = _rate(len(alerts), started)
+
+    started = time.perf_counter()
+    while _legacy_dequeue_and_delete(path, batch):
+        pass
+    dequeue_rate = _rate(len(alerts), started)
+
+    return {'enqueue': enqueue_rate, 'enqueue_many': None, 'dequeue+delete': dequeue_rate}
+
+
+def run_current(path, alerts, batch):
+    queue = QueueSystem(path)
+
+    half = len(alerts) // 2
+    started = time.perf_counter()
+    for data in alerts[:half]:
+        queue.enqueue(data)
+    enqueue_rate = _rate(half, started)
+
+    started = time.perf_counter()
+    for i in range(half, len(alerts), batch):
+        queue.enqueue_many(alerts[i:i + batch])
+    enqueue_many_rate = _rate(len(alerts) - half, started)
+
+    started = time.perf_counter()
+    while rows := queue.dequeue(batch):
+        for row in rows:
+            queue.delete_processed([row[0]])
+    dequeue_rate = _rate(len(alerts), started)
+
+    queue.close()
+    return {'enqueue': enqueue_rate, 'enqueue_many': enqueue_many_rate, 'dequeue+delete': dequeue_rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            'before': run_legacy(os.path.join(directory, 'legacy.db'), _alerts(args.items, 'legacy'), args.batch),
+            'after': run_current(os.path.join(directory, 'current.db'), _alerts(args.items, 'current'), args.batch),
+        }
+
+    print(f"{'':8}{'enqueue':>14}{'enqueue_many':>16}{'dequeue+delete':>18}  (ops/sec)")
+    for name, result in results.items():
+        cells = [f"{value:.0f}" if value else '-' for value in result.values()]
+        print(f"{name:8}{cells[0]:>14}{cells[1]:>16}{cells[2]:>18}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the redaction of alerts with many sensitive entities.
+
+"before" dumps the alert to JSON, calls str.replace once per entity with a new Faker per alert and loads the JSON
+back, as redactron used to. "after" is the single-pass RedactionEngine behind replace_with_fake_elements and
+restore_original_values. Both directions (redaction and restoration) are measured.
+
+Usage: python -m SocAI.benchmarks.redaction_benchmark [--repeat 20] [--lines 2000]
+"""
+import argparse
+import json
+import time
+
+from faker import Faker
+
+from SocAI.utils.redactron import replace_with_fake_elements, restore_original_values
+
+ENTITY_COUNTS = (10, 100, 500)
+
+
+def _alert(entities, lines):
+    ips = [f'198.51.{i // 250}.{i % 250}' for i in range(entities // 2)]
+    emails = [f'user{i}@corp{i}.example.com' for i in range(entities // 4)]
+    domains = [f'corp{i}.example.com' for i in range(entities - len(ips) - len(emails))]
+    log = '\n'.join(f'conn from {ips[i % len(ips)]} user {emails[i % len(emails)]} to {domains[i % len(domains)]}'
+                    for i in range(lines))
+    return {'data': log, 'ti_result': []}, {'ip': ips, 'email': emails, 'domain': domains}
+
+
+def _legacy_round_trip(alert, sensitive_information):
+    fake = Faker()
+    replaces = {}
+    string_format = json.dumps(alert)
+    for match in sensitive_information['ip']:
+        replaces[match] = fake.ipv4_public()
+    for match in sensitive_information['email']:
+        replaces[match] = fake.safe_email()
+    for match in sensitive_information['domain']:
+        replaces[match] = fake.domain_name()
+    for key, value in replaces.items():
+        string_format = string_format.replace(key, value)
+    redacted = json.loads(string_format)
+
+    string_format = json.dumps(redacted)
+    for original, value in replaces.items():
+        string_format = string_format.replace(value, original)
+    return json.loads(string_format)
+
+
+def _round_trip(alert, sensitive_information):
+    redacted, replaces = replace_with_fake_elements(alert, sensitive_information)
+    return restore_original_values(redacted, replaces)
+
+
+def _milliseconds(function, alert, sensitive_information, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(alert, sensitive_information)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--lines', type=int, default=2000, help='log lines per alert')
+    args = parser.parse_args()
+
+    print(f"{'entities':>10}{'before ms':>12}{'after ms':>12}{'speedup':>10}{'restored':>10}")
+    for entities in ENTITY_COUNTS:
+        alert, sensitive_information = _alert(entities, args.lines)
+        before = _milliseconds(_legacy_round_trip, alert, sensitive_information, args.repeat)
+        after = _milliseconds(_round_trip, alert, sensitive_information, args.repeat)
+        # The legacy code corrupts values that contain other values (domains inside emails)
+        restored = _round_trip(alert, sensitive_information) == alert
+        print(f"{entities:>10}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x{str(restored):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of the startup of the ingest API.
+
+Measures, each in a fresh interpreter, the import time of SocAI.main and of the client stacks it no longer imports
+at startup, then the time from launching `python -m SocAI.main` until /ping answers. Stacks that are not installed
+are reported as such.
+
+Usage: python -m SocAI.benchmarks.startup_benchmark [--runs 3] [--port 8090]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Stacks imported lazily by the worker
+WORKER_MODULES = ('openai', 'tiktoken', 'regex', 'faker', 'langchain.embeddings', 'cassandra.cluster', 'requests',
+                  'transformers')
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_time(module, runs):
+    """Median seconds to import the module in a fresh interpreter, None when it cannot be imported."""
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=ROOT)
+        if result.returncode != 0:
+            return None
+        times.append(float(result.stdout))
+    return statistics.median(times)
+
+
+def time_to_ping(port, timeout=60):
+    """Seconds from launching the application until /ping answers, None when it never does."""
+    environment = {**os.environ, 'API_PORT': str(port), 'PYTHONPATH': ROOT}
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-m', 'SocAI.main'], cwd=directory, env=environment,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while time.perf_counter() - started < timeout and process.poll() is None:
+                try:
+                    urllib.request.urlopen(f'http://127.0.0.1:{port}/ping', timeout=1)
+                    return time.perf_counter() - started
+                except OSError:
+                    time.sleep(0.01)
+            return None
+        finally:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args()
+
+    print(f"{'module':<24}{'import (ms)':>12}")
+    for module in ('SocAI.main',) + WORKER_MODULES:
+        seconds = import_time(module, args.runs)
+        print(f"{module:<24}{'not installed' if seconds is None else f'{seconds * 1000:.1f}':>12}")
+
+    seconds = time_to_ping(args.port)
+    print(f"time to first /ping: {'no answer' if seconds is None else f'{seconds * 1000:.0f} ms'}")
+
+
+if __name__ == '__main__':
+    main()
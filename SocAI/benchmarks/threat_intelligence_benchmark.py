@@ -0,0 +1,76 @@
+"""
+Benchmark of the per-alert threat intelligence lookups against a local ThreatWinds stub.
+
+"before" looks every extracted entity up sequentially with a new session per lookup, as the checker used to.
+"after" uses the pooled ThreatWinds client and the concurrent, deduplicating ThreatIntelligenceChecker.
+
+Usage: python -m SocAI.benchmarks.threat_intelligence_benchmark [--alerts 20] [--entities 12] [--latency 0.05]
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from SocAI.benchmarks.fakes.threatwinds_stub import ThreatWindsStub
+from SocAI.models.threat_intelligence.threat_intelligence_checker import ThreatIntelligenceChecker
+from SocAI.models.threat_intelligence.threat_winds import ThreatWinds
+
+
+def _alert_entities(alert, count):
+    # Every entity appears twice, as re.findall returns repeated matches
+    ips = [f'198.51.{alert}.{i}' for i in range(count // 2)]
+    domains = [f'host{i}.example.com' for i in range(count - count // 2)]
+    return {'ip': ips * 2, 'domain': domains * 2, 'email': []}
+
+
+def _legacy_check(url, entities):
+    results = []
+    for entity_type, entity_values in entities.items():
+        for entity in entity_values:
+            with requests.Session() as session:
+                response = session.post(url, json={'type': entity_type, 'value': entity})
+                if response.status_code == 200:
+                    results.append(response.json())
+    return results
+
+
+def _measure(check, alerts):
+    latencies = []
+    for entities in alerts:
+        started = time.perf_counter()
+        check(entities)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=20)
+    parser.add_argument('--entities', type=int, default=12, help='distinct entities per alert')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the stub waits per request')
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    stub = ThreatWindsStub(latency=args.latency).start()
+    alerts = [_alert_entities(alert, args.entities) for alert in range(args.alerts)]
+
+    results = {}
+
+    stub.requests = 0
+    results['before'] = (_measure(lambda entities: _legacy_check(stub.url, entities), alerts), stub.requests)
+
+    stub.requests = 0
+    checker = ThreatIntelligenceChecker(ThreatWinds('key', 'secret', base_url=stub.url),
+                                        max_concurrency=args.concurrency)
+    results['after'] = (_measure(checker.check_in_threat_intelligence, alerts), stub.requests)
+
+    stub.shutdown()
+
+    print(f"{'':8}{'mean ms/alert':>16}{'max ms/alert':>16}{'requests':>10}")
+    for name, (latencies, request_count) in results.items():
+        print(f"{name:8}{statistics.mean(latencies) * 1000:>16.1f}{max(latencies) * 1000:>16.1f}{request_count:>10}")
+
+
+if __name__ == '__main__':
+    main()
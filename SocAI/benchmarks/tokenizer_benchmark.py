@@ -0,0 +1,66 @@
+"""
+Benchmark of the prompt preparation done by ChatGPT.ask before calling OpenAI, for small and large alerts.
+
+"before" loads the encoding on every call, re-encodes the system instruction and encodes the whole alert to
+truncate it, as ChatGPT.ask used to. "after" is ChatGPT.build_messages.
+
+Usage: python -m SocAI.benchmarks.tokenizer_benchmark [--repeat 20]
+"""
+import argparse
+import json
+import time
+
+import tiktoken
+
+from SocAI.models.chatgpt.chatgpt import ChatGPT
+from SocAI.models.chatgpt.instruction import instruction
+
+ALERT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+
+def _alert(size):
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(json.dumps({'timestamp': f'2023-06-01T10:{len(lines) % 60:02d}:00Z', 'event_id': len(lines),
+                                 'src_ip': f'203.0.113.{len(lines) % 255}', 'message': 'Failed password for root'}))
+    return '\n'.join(lines)[:size]
+
+
+def _legacy_build_messages(question, model='gpt-3.5-turbo-16k', maxtokens=16384, tokens_by_reponse=500):
+    messages = [{"role": "system", "content": instruction}, {"role": "user", "content": ''}]
+    encoding = tiktoken.encoding_for_model(model)
+    messages_tokens = 3 + sum(4 + sum(len(encoding.encode(value)) for value in message.values())
+                              for message in messages)
+    question_length = maxtokens - tokens_by_reponse - messages_tokens
+    encoding = tiktoken.encoding_for_model(model)
+    messages[1]["content"] = encoding.decode(encoding.encode(question.replace('\\', ''))[:question_length])
+    return messages
+
+
+def _milliseconds(function, question, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(question)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    chatgpt = ChatGPT(api_key=None)
+    # Warm up both paths so loading the BPE files is not measured
+    _legacy_build_messages('warm up')
+    chatgpt.build_messages('warm up')
+
+    print(f"{'alert bytes':>12}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for size in ALERT_SIZES:
+        alert = _alert(size)
+        before = _milliseconds(_legacy_build_messages, alert, args.repeat)
+        after = _milliseconds(chatgpt.build_messages, alert, args.repeat)
+        print(f"{size:>12}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
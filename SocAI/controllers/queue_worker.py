@@ -1,105 +1,395 @@
 import logging
-import time
 import json
-from threading import Thread
-
-from opensearchpy.exceptions import NotFoundError
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from threading import BoundedSemaphore, Condition, Event, Lock, Thread
 
-from SocAI.models.chatgpt.chatgpt import ChatGPT, ChatGPTResponseParsingError
+from SocAI.models.chatgpt.chatgpt import ChatGPTResponseParsingError
+from SocAI.models.classifier.classifier_backend import ClassifierBackend
+from SocAI.utils.compactor import AlertCompactor
 from SocAI.utils.formatter import summarize
 from SocAI.models.database.cassandradboperations import CassandraDBOperations
 
 from SocAI.models.threat_intelligence.threat_intelligence_checker import ThreatIntelligenceChecker
-from SocAI.utils.embedings import create_vector
-from SocAI.utils.redactron import extract_sensitive_information
+from SocAI.utils.embedings import EmbeddingService, create_vector
+from SocAI.utils.metrics import registry
+from SocAI.utils.normalizer import AlertNormalizer
+from SocAI.utils.redactron import extract_sensitive_information, restore_original_values
+
+
+# Columns written for every processed alert
+RESULT_FIELDS = ('id', 'alert_body', 'domain_list', 'ip_list', 'email_list', 'evaluation', 'reasoning', 'next_steps',
+                 'alert_body_vector', 'ti_signature', 'verdict_source', 'stored_at')
+
+STAGE_SECONDS = registry.histogram('socai_stage_duration_seconds',
+                                   'Seconds spent by an alert in each stage of the pipeline.', ('stage',))
+ALERT_SECONDS = registry.histogram('socai_alert_duration_seconds',
+                                   'Seconds from the dequeue of an alert to its acknowledgement.')
+ALERTS_TOTAL = registry.counter('socai_alerts_total', 'Alerts handled by the worker, by outcome.', ('outcome',))
+ALERTS_IN_FLIGHT = registry.gauge('socai_alerts_in_flight', 'Alerts being processed by the worker pool.')
+VERDICT_CACHE_TOTAL = registry.counter('socai_verdict_cache_total', 'Verdict cache lookups, by outcome.',
+                                       ('outcome',))
+PROMPT_ALERT_TOKENS_TOTAL = registry.counter('socai_prompt_alert_tokens_total',
+                                             'Tokens of the alerts put in prompts, before and after compaction.',
+                                             ('stage',))
+
+# Maximum number of alerts allowed inside each pipeline stage at the same time. The llm limit should match the
+# concurrency of the classifier client, a lower one leaves its connections idle.
+DEFAULT_STAGE_LIMITS = {
+    'redaction': 4,
+    'threat_intelligence': 8,
+    'embedding': 8,
+    'similarity': 8,
+    'llm': 4,
+    'storage': 8,
+}
 
 
 class QueueWorker(Thread):
     """Thread for processing items from the queue."""
 
     def __init__(self, queue, database: CassandraDBOperations, threatintelligencechecker: ThreatIntelligenceChecker,
-                 chatgpt_instance:ChatGPT):
+                 classifier: ClassifierBackend, max_workers=8, stage_limits=None, poll_interval=10, retry_delay=30,
+                 embedding_service: EmbeddingService = None, similarity_threshold=0.9, similarity_top_k=100,
+                 verdict_cache_threshold=None, normalizer: AlertNormalizer = None,
+                 compactor: AlertCompactor = None):
         super().__init__(daemon=True)
         self.queue = queue
         self.database = database
         self.threatintelligencechecker = threatintelligencechecker
-        self.chatgpt_instance = chatgpt_instance
+        self.classifier = classifier
+        self.embedding_service = embedding_service
+        self.similarity_threshold = similarity_threshold
+        self.similarity_top_k = similarity_top_k
+        # Reuse the verdict of a stored alert at least this similar instead of asking the LLM, None disables it
+        self.verdict_cache_threshold = verdict_cache_threshold
+        self.verdict_cache_stats = {'hits': 0, 'no_neighbour': 0, 'below_threshold': 0,
+                                    'threat_intelligence_mismatch': 0, 'threat_intelligence_unavailable': 0,
+                                    'verdict_not_found': 0}
+        self.verdict_cache_lock = Lock()
+        self.normalizer = normalizer
+        # Shrinks the alerts before they are put in the prompt, None prompts the normalized alert as it is
+        self.compactor = compactor
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.consumer_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        limits = {**DEFAULT_STAGE_LIMITS, **(stage_limits or {})}
+        self.stage_semaphores = {stage: BoundedSemaphore(limit) for stage, limit in limits.items()}
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='queue-worker')
+        # Outcomes of the writes are handed over here by the driver callbacks, which run on its event loop thread
+        # and must not wait for the SQLite write lock
+        self.acknowledger = ThreadPoolExecutor(max_workers=1, thread_name_prefix='queue-acknowledger')
+        self.in_flight = set()
+        # Alerts whose verdict is being written, they are acknowledged once the write succeeds
+        self.storing = set()
+        self.in_flight_condition = Condition()
+        self.stopping = Event()
 
     def run(self):
-        """Start processing items from the queue."""
-        while True:
+        """Start processing items from the queue, until stop is called."""
+        # Leases are renewed well before they expire, alerts can take longer than a lease (e.g. LLM retries)
+        renewal_interval = self.queue.lease_seconds / 3
+        renewed_at = time.monotonic()
+        while not self.stopping.is_set():
             try:
-                items = self.queue.dequeue(20)
-                if items:
+                if time.monotonic() - renewed_at >= renewal_interval:
+                    self._renew_leases()
+                    renewed_at = time.monotonic()
+
+                with self.in_flight_condition:
+                    in_flight = set(self.in_flight)
+                    busy = in_flight | self.storing
+                    free_slots = self.max_workers - len(in_flight)
+
+                items = self.queue.dequeue(free_slots, consumer=self.consumer_id) if free_slots > 0 else []
+                # A lease may expire while its item is still being processed or written, do not run it twice.
+                items = [item for item in items if item[0] not in busy]
+
+                if items and self.stopping.is_set():
+                    self.queue.release([item[0] for item in items], refund_attempt=True, consumer=self.consumer_id)
+                elif items:
                     for item in items:
-                        self._process_item(item, self.chatgpt_instance)
+                        self._submit(item)
                 else:
-                    time.sleep(10)
+                    with self.in_flight_condition:
+                        self.in_flight_condition.wait(timeout=min(self.poll_interval, renewal_interval))
             except Exception as e:
                 logging.error(f"Error: {str(e)}")
 
-    def _process_item(self, item, chatgpt_instance):
+    def _renew_leases(self):
+        """Extend the leases of the alerts being processed or written, so no other consumer claims them."""
+        with self.in_flight_condition:
+            held = list(self.in_flight | self.storing)
+        if held:
+            lost = self.queue.extend_lease(held, self.consumer_id)
+            if lost:
+                logging.warning(f"{len(lost)} alert(s) were claimed by another consumer while being processed")
+
+    def stop(self, timeout=None):
+        """
+        Stop dequeuing and wait up to `timeout` seconds for the alerts in flight to be processed and stored. The
+        leases of the alerts still unfinished are released, so another worker picks them up right away instead of
+        waiting for the lease to expire.
+
+        Returns:
+        - drained (bool): Whether every alert in flight finished in time.
+        """
+        self.stopping.set()
+        with self.in_flight_condition:
+            self.in_flight_condition.notify_all()
+            drained = self.in_flight_condition.wait_for(lambda: not self.in_flight and not self.storing, timeout)
+            unfinished = list(self.in_flight | self.storing)
+
+        if unfinished:
+            logging.error(f"{len(unfinished)} alert(s) did not finish in time, releasing them to the queue")
+            self.queue.release(unfinished, refund_attempt=True, consumer=self.consumer_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.acknowledger.shutdown(wait=True)
+        logging.info(f"Queue worker {self.consumer_id} stopped")
+        return drained
+
+    def _submit(self, item):
+        """Hand an item over to the worker pool."""
+        with self.in_flight_condition:
+            self.in_flight.add(item[0])
+        ALERTS_IN_FLIGHT.inc()
+        try:
+            future = self.executor.submit(self._process_item, item, time.perf_counter())
+        except RuntimeError:
+            # stop shut the pool down meanwhile
+            self._release(item[0])
+            self.queue.release([item[0]], refund_attempt=True, consumer=self.consumer_id)
+            return
+        future.add_done_callback(lambda _: self._release(item[0]))
+
+    def _release(self, item_id):
+        ALERTS_IN_FLIGHT.dec()
+        with self.in_flight_condition:
+            self.in_flight.discard(item_id)
+            self.in_flight_condition.notify_all()
+
+    def _stage(self, name):
+        """Semaphore bounding the number of alerts inside the given stage."""
+        return self.stage_semaphores[name]
+
+    def _process_item(self, item, dequeued_at):
         """Process an item from the queue."""
         try:
             logging.info(f"Processing item: {item[0]}")
 
-            sensitive_information = self._extract_sensitive_information(item[1])
+            with self._stage('redaction'):
+                sensitive_information = self._extract_sensitive_information(item[1])
+                normalized_item = self._normalize(item[1])
 
-            results_threat_intelligence_search = self._check_threat_intelligence(sensitive_information)
+            with self._stage('threat_intelligence'):
+                results_threat_intelligence_search = self._check_threat_intelligence(sensitive_information)
 
-            vector = self._create_vector(item[1])
-            vector_count = len(self.database.query_vector(vector))
+            with self._stage('embedding'):
+                vector = self._create_vector(normalized_item)
 
-            prompt, replaces = self._create_prompt(item[1], results_threat_intelligence_search, sensitive_information,
-                                                   vector_count)
+            with self._stage('similarity'):
+                similarity = self._query_similar(vector)
 
-            chatgpt_dict_format_response = chatgpt_instance.ask(prompt)
+            ti_signature = self.threatintelligencechecker.signature(results_threat_intelligence_search)
+            chatgpt_dict_format_response = self._cached_verdict(similarity, ti_signature)
+            verdict_source = 'cache' if chatgpt_dict_format_response else 'llm'
 
-            if replaces:
-                chatgpt_dict_format_response = self._replace_fake_values(chatgpt_dict_format_response, replaces)
+            if not chatgpt_dict_format_response:
+                with self._stage('redaction'):
+                    prompt_item = self._compact(item, normalized_item)
+                    prompt, replaces = self._create_prompt(prompt_item, results_threat_intelligence_search,
+                                                           sensitive_information, similarity, item[2])
 
-            self._store_data(item, sensitive_information, chatgpt_dict_format_response, vector)
+                llm_stage = nullcontext() if self.classifier.batches_requests else self._stage('llm')
+                with llm_stage, STAGE_SECONDS.time(stage='classify'):
+                    chatgpt_dict_format_response = self.classifier.classify(prompt)
 
-            self.queue.delete_processed([item[0]])
-        except (NotFoundError, IndexError, ChatGPTResponseParsingError) as e:
-            self.queue.delete_processed([item[0]])
+                if replaces:
+                    chatgpt_dict_format_response = self._replace_fake_values(chatgpt_dict_format_response, replaces)
+
+            # The item is acknowledged once the write succeeded, see _on_stored
+            self._store_data(item, sensitive_information, chatgpt_dict_format_response, vector, ti_signature,
+                             verdict_source, dequeued_at)
+        except (IndexError, ChatGPTResponseParsingError) as e:
+            ALERTS_TOTAL.inc(outcome='dropped')
+            self.queue.delete_processed([item[0]], consumer=self.consumer_id)
             logging.error(f"Error: The alert cannot be processed. Deleting from the queue.{str(e)}")
         except Exception as e:
+            ALERTS_TOTAL.inc(outcome='retried')
+            self.queue.release([item[0]], error=str(e), delay=self.retry_delay, consumer=self.consumer_id)
             logging.error(f"Error: {str(e)}")
 
     def _extract_sensitive_information(self, item):
         logging.info(f"Extracting sensitive information")
-        return extract_sensitive_information(item)
+        with STAGE_SECONDS.time(stage='extract_sensitive_information'):
+            return extract_sensitive_information(item)
+
+    def _normalize(self, item):
+        if not self.normalizer:
+            return item
+        logging.info(f"Normalizing the alert")
+        with STAGE_SECONDS.time(stage='normalize'):
+            return self.normalizer.normalize(item)
+
+    def _compact(self, item, normalized_item):
+        if not self.compactor:
+            return normalized_item
+        logging.info(f"Compacting the alert")
+        with STAGE_SECONDS.time(stage='compact'):
+            compaction = self.compactor.compact(item[1], original=normalized_item)
+        if compaction.original_tokens is not None:
+            PROMPT_ALERT_TOKENS_TOTAL.inc(compaction.original_tokens, stage='original')
+            PROMPT_ALERT_TOKENS_TOTAL.inc(compaction.compacted_tokens, stage='compacted')
+            logging.info(f"Compacted the alert {item[0]} ({compaction.schema or 'no schema'}) from "
+                         f"{compaction.original_tokens} to {compaction.compacted_tokens} tokens")
+        return compaction.text
 
     def _check_threat_intelligence(self, sensitive_information):
         logging.info(f"Searching for the sensitive information in the Threat Intelligence")
-        results = self.threatintelligencechecker.check_in_threat_intelligence(sensitive_information)
+        with STAGE_SECONDS.time(stage='check_threat_intelligence'):
+            results = self.threatintelligencechecker.check_in_threat_intelligence(sensitive_information)
         logging.info(f"Was found {len(results)} elements in the ThreatIntelligence Platform")
         return results
 
     def _create_vector(self, item):
         logging.info('Creating a vector to find similarities')
-        return create_vector(item)
+        with STAGE_SECONDS.time(stage='create_vector'):
+            return create_vector(item, self.embedding_service)
+
+    def _query_similar(self, vector):
+        logging.info('Searching for similar alerts')
+        with STAGE_SECONDS.time(stage='query_similar'):
+            similarity = self.database.query_similar(vector, threshold=self.similarity_threshold,
+                                                     top_k=self.similarity_top_k)
+        if similarity is None:
+            raise ValueError("The similar alerts could not be queried")
+        logging.info(f"Was found {similarity.count} similar alerts")
+        return similarity
+
+    def _cached_verdict(self, similarity, ti_signature):
+        """
+        Return the verdict of the most similar stored alert when it is above the verdict cache threshold and its
+        threat intelligence findings agree with the ones of the alert, None otherwise. Alerts with a failed
+        threat intelligence lookup (no signature) always go to the LLM.
+        """
+        if self.verdict_cache_threshold is None:
+            return None
+
+        nearest = similarity.neighbours[0] if similarity.neighbours else None
+        verdict = None
+        if ti_signature is None:
+            outcome = 'threat_intelligence_unavailable'
+        elif nearest is None:
+            outcome = 'no_neighbour'
+        elif nearest.similarity < self.verdict_cache_threshold:
+            outcome = 'below_threshold'
+        elif nearest.ti_signature is None or nearest.ti_signature != ti_signature:
+            outcome = 'threat_intelligence_mismatch'
+        else:
+            with STAGE_SECONDS.time(stage='get_verdict'):
+                verdict = self.database.get_verdict(nearest.id)
+            outcome = 'hits' if verdict else 'verdict_not_found'
+
+        VERDICT_CACHE_TOTAL.inc(outcome=outcome)
+
+        with self.verdict_cache_lock:
+            self.verdict_cache_stats[outcome] += 1
+            stats = dict(self.verdict_cache_stats)
+        if nearest is not None:
+            logging.info(f"Nearest stored alert {nearest.id} has similarity {nearest.similarity:.4f} "
+                         f"(verdict cache threshold {self.verdict_cache_threshold}): {outcome}")
+        logging.info(f"Verdict cache: {stats}")
+        return verdict
 
-    def _create_prompt(self, item, results, sensitive_information, vector_count):
+    def _create_prompt(self, item, results, sensitive_information, similarity, occurrences=1):
         logging.info(f"Creating the prompt")
-        return summarize({'data': item, 'ti_result': results}, sensitive_information, vector_count)
+        previous_verdicts = [neighbour.evaluation for neighbour in similarity.neighbours if neighbour.evaluation]
+        with STAGE_SECONDS.time(stage='create_prompt'):
+            return summarize({'data': item, 'ti_result': results}, sensitive_information, similarity.count,
+                             previous_verdicts, occurrences, compact_threat_intelligence=self.compactor is not None)
 
     def _replace_fake_values(self, chatgpt_dict_format_response, replaces):
         logging.info(f"Replacement of fake values by the original ones.")
-        chatgpt_string_format_response = json.dumps(chatgpt_dict_format_response)
-        for original, fake in replaces.items():
-            chatgpt_string_format_response = chatgpt_string_format_response.replace(fake, original)
-        return json.loads(chatgpt_string_format_response)
+        with STAGE_SECONDS.time(stage='replace_fake_values'):
+            return restore_original_values(chatgpt_dict_format_response, replaces)
 
-    def _store_data(self, item, sensitive_information, chatgpt_dict_format_response, vector):
-        fields = ('id', 'alert_body', 'domain_list', 'ip_list', 'email_list', 'evaluation', 'reasoning', 'next_steps',
-                  'alert_body_vector')
-
-        values = (item[0], item[1], sensitive_information['domain'], sensitive_information['ip'],
+    def _store_data(self, item, sensitive_information, chatgpt_dict_format_response, vector, ti_signature,
+                    verdict_source, dequeued_at):
+        values = (item[0], item[1], sensitive_information['domain'],
+                  sensitive_information['ip'] + sensitive_information.get('private_ip', []),
                   sensitive_information['email'],
                   chatgpt_dict_format_response['classification'],
                   json.dumps(chatgpt_dict_format_response['reasoning']),
-                  json.dumps(chatgpt_dict_format_response['next_steps']), vector)
+                  json.dumps(chatgpt_dict_format_response['next_steps']), vector, ti_signature, verdict_source,
+                  datetime.now(timezone.utc))
+
+        # The write runs in the background so the next alert can start, the storage stage bounds pending writes
+        storage = self._stage('storage')
+        storage.acquire()
+        self._set_storing(item[0], True)
+        started = time.perf_counter()
+        try:
+            future = self.database.insert_data_async(RESULT_FIELDS, values)
+        except Exception:
+            storage.release()
+            self._set_storing(item[0], False)
+            raise
+        result = {'classification': chatgpt_dict_format_response['classification'],
+                  'reasoning': chatgpt_dict_format_response['reasoning'],
+                  'next_steps': chatgpt_dict_format_response['next_steps'], 'verdict_source': verdict_source}
+        future.add_callbacks(callback=self._on_stored, callback_args=(item, started, dequeued_at, result),
+                             errback=self._on_store_failed, errback_args=(item,))
+
+    def _set_storing(self, item_id, storing):
+        with self.in_flight_condition:
+            if storing:
+                self.storing.add(item_id)
+            else:
+                self.storing.discard(item_id)
+                self.in_flight_condition.notify_all()
+
+    def _on_stored(self, _, item, started, dequeued_at, result):
+        self._stage('storage').release()
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - started, stage='store_data')
+        ALERT_SECONDS.observe(now - dequeued_at)
+        ALERTS_TOTAL.inc(outcome='stored')
+        self._hand_over(item, self._acknowledge, item, result)
 
-        self.database.insert_data(fields, values)
+    def _on_store_failed(self, error, item):
+        self._stage('storage').release()
+        ALERTS_TOTAL.inc(outcome='store_failed')
+        logging.error(f"An error occurred while inserting data: {str(error)}")
+        self._hand_over(item, self._retry_later, item, error)
+
+    def _hand_over(self, item, function, *args):
+        try:
+            self.acknowledger.submit(function, *args)
+        except RuntimeError:
+            # stop already released the alerts that were still being written
+            self._set_storing(item[0], False)
+
+    def _acknowledge(self, item, result):
+        try:
+            # The item leaves the queue and its result is published to /results at once
+            self.queue.complete(item[0], result, consumer=self.consumer_id)
+        except Exception as e:
+            logging.error(f"Error: {str(e)}")
+        finally:
+            self._set_storing(item[0], False)
+
+    def _retry_later(self, item, error):
+        try:
+            self.queue.release([item[0]], error=str(error), delay=self.retry_delay, consumer=self.consumer_id)
+        except Exception as e:
+            logging.error(f"Error: {str(e)}")
+        finally:
+            self._set_storing(item[0], False)
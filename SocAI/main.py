@@ -1,20 +1,31 @@
 # main.py
+import asyncio
+import codecs
+import contextlib
 import os
+import multiprocessing
+import shutil
+import signal
+import sys
+import tempfile
+import time
 
-from threading import Thread
+from threading import Event, Thread
+import json
 import logging
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from SocAI.models.threat_intelligence.threat_intelligence_checker import ThreatIntelligenceChecker
-from SocAI.models.threat_intelligence.threat_winds import ThreatWinds
-from SocAI.models.database.databaseengine import CassandraDBEngine
-from SocAI.models.database.cassandradboperations import CassandraDBOperations
-
-from utils.queue_manager import QueueSystem
-from SocAI.models.chatgpt.chatgpt import ChatGPT
-from SocAI.controllers.queue_worker import QueueWorker
+# Only the ingest API is imported at startup, the clients of the worker are imported once it is created
+from SocAI.utils.admission_control import AdmissionController
+from SocAI.utils.metrics import SnapshotWriter, registry
+from SocAI.utils.normalizer import AlertNormalizer
+from SocAI.utils.priority import severity_priority
+from SocAI.utils.queue_manager import QueueSystem
+from SocAI.utils.results import ResultBuffer, ResultPoller
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -25,16 +36,250 @@ class NoAPIKeyFoundError(Exception):
 
 
 fastapi_instance = FastAPI()
-queue = QueueSystem(path="queue.db")
+normalizer = AlertNormalizer() if os.getenv("ALERT_NORMALIZATION", "true") == "true" else None
+queue = QueueSystem(path="queue.db",
+                    lease_seconds=int(os.getenv("QUEUE_LEASE_SECONDS", "300")),
+                    max_attempts=int(os.getenv("QUEUE_MAX_ATTEMPTS", "5")),
+                    priority_function=severity_priority if os.getenv("QUEUE_PRIORITY_LANES") == "true" else None,
+                    normalizer=normalizer,
+                    coalesce_window=int(os.getenv("QUEUE_COALESCE_WINDOW", "0")))
+admission_controller = AdmissionController(queue,
+                                           high_watermark=int(os.getenv("QUEUE_HIGH_WATERMARK", "10000")),
+                                           low_watermark=int(os.getenv("QUEUE_LOW_WATERMARK", "8000")),
+                                           retry_after=int(os.getenv("QUEUE_RETRY_AFTER", "30")))
+registry.gauge("socai_queue_depth", "Alerts in the queue, including the ones being processed.",
+               function=lambda: queue.stats()["depth"])
+registry.gauge("socai_queue_oldest_item_age_seconds", "Seconds since the oldest alert in the queue was enqueued.",
+               function=lambda: queue.stats()["oldest_age"])
+registry.gauge("socai_dead_letter_depth", "Alerts moved to the dead-letter table.",
+               function=lambda: queue.stats()["dead_letter"])
+# Recent verdicts served by /results, copied from the queue where the workers record them
+result_buffer = ResultBuffer(capacity=int(os.getenv("RESULTS_BUFFER_SIZE", "10000")))
+result_poller = ResultPoller(queue, result_buffer,
+                             interval=float(os.getenv("RESULTS_POLL_INTERVAL", "0.1")),
+                             retention=int(os.getenv("RESULTS_RETENTION_SECONDS", "86400")))
+# Directory where the worker processes write their metrics, set by Application
+fastapi_instance.state.metrics_directory = None
+# Backends of the worker and whether they are warmed up, reported by /ready
+readiness = {"queue": True, "database": False, "threat_intelligence": False, "classifier": False,
+             "embeddings": False, "worker": False}
+
+
+# Number of alerts written to the queue per transaction by /process/batch
+BATCH_CHUNK_SIZE = 500
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+STATUS_COUNTERS = {"accepted": "accepted", "duplicate": "duplicates", "coalesced": "coalesced"}
+# Maximum number of results returned by a page of /results
+RESULTS_PAGE_LIMIT = 1000
+# Seconds between two comments sent by /results/stream while there are no new results, so proxies keep it open
+RESULTS_STREAM_KEEP_ALIVE = 15
+
+
+def _queue_full_response(summary=None):
+    return JSONResponse(status_code=503,
+                        content={"message": "The queue is full, retry later.", **(summary or {})},
+                        headers={"Retry-After": str(admission_controller.retry_after)})
 
 
 @fastapi_instance.post("/process")
 async def process(data: str):
     try:
-        queue.enqueue(data)
-        return {"message": "Items added to queue."}
+        if not await run_in_threadpool(admission_controller.admit):
+            return _queue_full_response()
+        item_id = await run_in_threadpool(queue.enqueue, data)
+        return {"message": "Items added to queue.", "id": item_id}
     except Exception as e:
         logging.error(f"Error occurred during queue insertion: {str(e)}")
+        return JSONResponse(status_code=500, content={"message": "Error occurred during queue insertion."})
+
+
+async def _read_ndjson(request: Request):
+    """Yield the alerts of a NDJSON body as the lines arrive, False for lines that are not valid JSON."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if (alert := _parse_ndjson_line(line)) is not None:
+                yield alert
+    if (alert := _parse_ndjson_line(buffer)) is not None:
+        yield alert
+
+
+def _parse_ndjson_line(line):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        value = json.loads(line)
+    except json.JSONDecodeError:
+        return False
+    # Keep the raw line for documents so the dedupe key matches the one /process would compute
+    return value if isinstance(value, str) else line.decode()
+
+
+async def _read_json_array(request: Request):
+    """Yield the alerts of a JSON array body as they arrive, without holding the whole body in memory."""
+    invalid = HTTPException(status_code=400, detail="The body must be a JSON array or NDJSON.")
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    chunks = request.stream().__aiter__()
+    buffer, opened, ended = "", False, False
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,") if opened else buffer.lstrip()
+        if buffer and not opened:
+            if buffer[0] != "[":
+                raise invalid
+            buffer, opened = buffer[1:], True
+            continue
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                end = None
+            # A value reaching the end of the buffer may go on in the next chunk, e.g. a number
+            if end is not None and (end < len(buffer) or ended):
+                # Keep the raw text of documents so the dedupe key matches the one /process would compute
+                yield value if isinstance(value, str) else buffer[:end]
+                buffer = buffer[end:]
+                continue
+        if ended:
+            raise invalid
+        try:
+            buffer += text.decode(await chunks.__anext__())
+        except StopAsyncIteration:
+            buffer += text.decode(b"", final=True)
+            ended = True
+        except UnicodeDecodeError:
+            raise invalid
+
+
+async def _read_alerts(request: Request):
+    """Yield the alerts of a /process/batch body in chunks of BATCH_CHUNK_SIZE. Invalid NDJSON lines are None."""
+    chunk = []
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+        async for alert in _read_ndjson(request):
+            chunk.append(alert or None)
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    else:
+        async for alert in _read_json_array(request):
+            chunk.append(alert)
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+@fastapi_instance.post("/process/batch")
+async def process_batch(request: Request):
+    """
+    Enqueue many alerts at once. The body is either a JSON array of alerts or NDJSON (one alert per line,
+    Content-Type: application/x-ndjson). Alerts already in the queue are reported as duplicates, alerts merged
+    into a waiting alert with the same template as coalesced. Both formats are read as they arrive, a malformed
+    JSON array is rejected when the parser reaches the error, after the chunks before it were queued.
+
+    Every chunk is admitted with its number of alerts. When the queue fills up during the upload the response is
+    a 503 reporting the alerts queued so far, the following ones have to be sent again.
+    """
+    summary = {"accepted": 0, "duplicates": 0, "coalesced": 0, "invalid": 0, "items": []}
+    async for chunk in _read_alerts(request):
+        valid_alerts = [alert for alert in chunk if alert is not None]
+        if not await run_in_threadpool(admission_controller.admit, len(valid_alerts)):
+            return _queue_full_response(summary if summary["items"] else None)
+        try:
+            # The SQLite write must not block the event loop
+            results = iter(await run_in_threadpool(queue.enqueue_many, valid_alerts))
+        except ValueError as e:
+            logging.error(f"Error occurred during queue insertion: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error occurred during queue insertion.")
+
+        for alert in chunk:
+            if alert is None:
+                summary["invalid"] += 1
+                summary["items"].append({"id": None, "status": "invalid"})
+                continue
+            item_id, status = next(results)
+            summary[STATUS_COUNTERS[status]] += 1
+            summary["items"].append({"id": item_id, "status": status})
+    return summary
+
+
+async def _results_since(cursor, limit):
+    results = result_buffer.since(cursor, limit)
+    if results is None:
+        # Evicted from the buffer, or not loaded yet
+        results = await run_in_threadpool(queue.results_since, cursor, limit)
+    return results
+
+
+@fastapi_instance.get("/results")
+async def results(cursor: int = 0, limit: int = 100):
+    """
+    Results recorded after the cursor, oldest first. Pass the returned cursor to get the next page, an empty page
+    means there are no newer results yet.
+    """
+    try:
+        page = await _results_since(cursor, max(1, min(limit, RESULTS_PAGE_LIMIT)))
+    except ValueError as e:
+        logging.error(f"Error occurred while reading the results: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error occurred while reading the results.")
+    return {"results": page, "cursor": page[-1]["cursor"] if page else cursor}
+
+
+@fastapi_instance.get("/results/stream")
+async def stream_results(request: Request, cursor: int = None):
+    """
+    Server-Sent Events stream of the results recorded after the cursor, or after the Last-Event-ID header of a
+    reconnecting client. Without either, only the results recorded from now on are sent.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if cursor is None and last_event_id.isdigit():
+        cursor = int(last_event_id)
+    elif cursor is None:
+        cursor = result_buffer.cursor if result_buffer.floor is not None \
+            else await run_in_threadpool(queue.last_result_cursor)
+    return StreamingResponse(_result_events(request, cursor), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _result_events(request: Request, cursor):
+    sent_at = time.monotonic()
+    while not result_poller.stopping.is_set() and not await request.is_disconnected():
+        try:
+            page = await _results_since(cursor, RESULTS_PAGE_LIMIT)
+        except ValueError as e:
+            logging.error(f"Error occurred while reading the results: {str(e)}")
+            return
+        for result in page:
+            yield f"id: {result['cursor']}\nevent: result\ndata: {json.dumps(result)}\n\n"
+            cursor = result["cursor"]
+        if page:
+            sent_at = time.monotonic()
+            continue
+        if time.monotonic() - sent_at > RESULTS_STREAM_KEEP_ALIVE:
+            yield ": keep-alive\n\n"
+            sent_at = time.monotonic()
+        await asyncio.sleep(result_poller.interval)
+
+
+@fastapi_instance.get("/results/{item_id}")
+async def result(item_id: str):
+    """The latest result of an alert, by the id returned by /process. 202 while it is still in the queue."""
+    try:
+        item_result = result_buffer.get(item_id) or await run_in_threadpool(queue.result, item_id)
+        if item_result:
+            return item_result
+        if await run_in_threadpool(queue.is_queued, item_id):
+            return JSONResponse(status_code=202, content={"id": item_id, "status": "pending"})
+    except ValueError as e:
+        logging.error(f"Error occurred while reading the result: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error occurred while reading the result.")
+    raise HTTPException(status_code=404, detail="No result for this id.")
 
 
 @fastapi_instance.get("/ping")
@@ -42,54 +287,284 @@ def ping():
     return "OK"
 
 
+@fastapi_instance.get("/metrics")
+def metrics():
+    """Metrics of the API and of the workers in the Prometheus text format."""
+    return PlainTextResponse(registry.render(fastapi_instance.state.metrics_directory),
+                             media_type="text/plain; version=0.0.4")
+
+
+@fastapi_instance.get("/ready")
+def ready():
+    """Readiness, as opposed to the /ping liveness: 503 until the worker and all its backends are warmed up."""
+    return JSONResponse(status_code=200 if all(readiness.values()) else 503, content=readiness)
+
+
+# Seconds between two attempts to start the worker
+WORKER_START_RETRY_DELAY = 30
+# Exit code of a worker process that cannot start, it is not restarted
+WORKER_CONFIGURATION_ERROR = 2
+
+
 # Main application class
 class Application:
     """Main application class."""
 
-    def __init__(self, db_engine: CassandraDBEngine, chatgpt: ChatGPT, threat_checker: ThreatIntelligenceChecker):
+    def __init__(self, worker_processes=0, drain_timeout=25):
+        self.server = None
         self.server_thread = None
+        self.worker_thread = None
         self.queue_worker = None
-        self.cassandra_db = db_engine
-        self.cassandra_operations = CassandraDBOperations(db_engine, os.getenv("TABLE_NAME"))
-        self.chatgpt_instance = chatgpt
-        self.threat_intelligence_system = threat_checker
+        # With worker processes, the alerts are processed outside of the API process
+        self.worker_processes = worker_processes
+        self.drain_timeout = drain_timeout
+        self.processes = []
+        self.metrics_directory = None
+        self.stopping = Event()
 
     def start(self,):
         logger.info("Starting application...")
-        try:
-            self.cassandra_operations.create_table()
-            self.queue_worker = QueueWorker(queue, self.cassandra_operations, self.threat_intelligence_system,
-                                            self.chatgpt_instance)
-            self.queue_worker.start()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signal_number, lambda *_: self.stopping.set())
 
-            self.server_thread = Thread(target=uvicorn.run, args=(fastapi_instance,), kwargs={"host": "0.0.0.0", "port": 8080})
-            self.server_thread.start()
+        self.server = uvicorn.Server(uvicorn.Config(fastapi_instance, host="0.0.0.0",
+                                                    port=int(os.getenv("API_PORT", "8080"))))
+        self.server_thread = Thread(target=self.server.run, name="api")
+        self.server_thread.start()
+        result_poller.start()
 
-        except Exception as e:
-            logging.error(f"Error: {str(e)}")
+        if self.worker_processes:
+            self.metrics_directory = tempfile.mkdtemp(prefix="socai-metrics-")
+            fastapi_instance.state.metrics_directory = self.metrics_directory
+            self.processes = [self._spawn_worker_process() for _ in range(self.worker_processes)]
+        else:
+            # The API answers and queues alerts while the worker connects to its backends
+            self.worker_thread = Thread(target=self.start_worker, name="worker-startup", daemon=True)
+            self.worker_thread.start()
 
+        while not self.stopping.wait(1):
+            self._supervise_worker_processes()
+        self.stop()
 
-# Instantiate and run the application with the required dependencies
-if __name__ == "__main__":
+    def stop(self):
+        """Stop the API, then let the workers finish or release the alerts in flight."""
+        logger.info("Stopping application...")
+        self.server.should_exit = True
+        # Also ends the /results/stream responses, the server waits for them
+        result_poller.stop()
+        for process, _ in self.processes:
+            process.terminate()
+        self.stop_worker()
+
+        deadline = time.monotonic() + self.drain_timeout + 5
+        for process, _ in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logging.error(f"Worker process {process.pid} did not drain in time, killing it")
+                process.kill()
+        self.server_thread.join()
+        if self.metrics_directory:
+            shutil.rmtree(self.metrics_directory, ignore_errors=True)
+
+    def start_worker(self):
+        while self.queue_worker is None and not self.stopping.is_set():
+            try:
+                self.queue_worker = create_queue_worker()
+                self.queue_worker.start()
+                readiness["worker"] = True
+                logger.info("Queue worker started")
+            except NoAPIKeyFoundError:
+                logging.error("No API key found in the database.")
+                return
+            except Exception as e:
+                logging.error(f"Error: {str(e)}")
+                self.stopping.wait(WORKER_START_RETRY_DELAY)
+
+    def stop_worker(self):
+        self.stopping.set()
+        if self.queue_worker:
+            self.queue_worker.stop(self.drain_timeout)
+
+    def _spawn_worker_process(self):
+        # Spawned rather than forked, threads and connections of the API process are not inherited
+        context = multiprocessing.get_context("spawn")
+        ready = context.Event()
+        process = context.Process(target=run_worker_process, args=(ready, self.drain_timeout, self.metrics_directory),
+                                  name="queue-worker")
+        process.start()
+        return process, ready
+
+    def _supervise_worker_processes(self):
+        """Restart the worker processes that died and report their readiness."""
+        if not self.processes:
+            return
+        for index, (process, _) in enumerate(self.processes):
+            if not process.is_alive() and process.exitcode != WORKER_CONFIGURATION_ERROR:
+                logging.error(f"Worker process {process.pid} exited with code {process.exitcode}, restarting it")
+                # Its gauges are stale
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.metrics_directory, f"{process.pid}.json"))
+                self.processes[index] = self._spawn_worker_process()
+
+        ready = all(event.is_set() for _, event in self.processes)
+        for backend in readiness:
+            if backend != "queue":
+                readiness[backend] = ready
+
+
+def run_worker_process(ready, drain_timeout, metrics_directory):
+    """Entry point of the worker processes: process alerts until SIGTERM, then drain."""
+    application = Application(drain_timeout=drain_timeout)
+    signal.signal(signal.SIGTERM, lambda *_: application.stopping.set())
+    # Ctrl-C reaches the whole process group, the API process stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    application.start_worker()
+    if application.queue_worker is None:
+        sys.exit(0 if application.stopping.is_set() else WORKER_CONFIGURATION_ERROR)
+
+    snapshot_writer = SnapshotWriter(registry, metrics_directory)
+    snapshot_writer.start()
+    ready.set()
+    application.stopping.wait()
+    application.stop_worker()
+    snapshot_writer.stop()
+
+
+def create_queue_worker():
+    """Connect to and warm up every backend of the worker, importing their clients only now."""
+    from SocAI.controllers.queue_worker import QueueWorker, RESULT_FIELDS
+    from SocAI.models.database.cassandradboperations import CassandraDBOperations
+    from SocAI.utils.embedings import default_embedding_service
+
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        raise NoAPIKeyFoundError
+
+    engine = create_database_engine()
+    # The engine logs the connection errors and has no session, the start is retried until Cassandra is reachable
+    if engine.session is None:
+        raise ConnectionError("Could not connect to the database")
+    database = CassandraDBOperations(engine, os.getenv("TABLE_NAME"))
     try:
-        db = CassandraDBEngine(secure_connect_bundle=os.getenv('SECURE_CONNECT_BUNDLE_PATH'),
-                               token=os.getenv("CASSANDRA_DATABASE_TOKEN"),
-                               keyspace=os.getenv('CASSANDRA_DATABASE_KEYSPACE'))
+        database.create_table()
+        database.prepare_statements(RESULT_FIELDS)
+    except Exception:
+        # The next attempt opens a new connection
+        engine.disconnect()
+        raise
+    if os.getenv("LOCAL_VECTOR_INDEX") == "true":
+        from SocAI.models.database.local_vector_index import LocallyIndexedDatabase, LocalVectorIndex
 
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        if not openai_api_key:
-            raise NoAPIKeyFoundError
+        max_age = os.getenv("LOCAL_VECTOR_INDEX_MAX_AGE")
+        warm_up_rows = os.getenv("LOCAL_VECTOR_INDEX_WARM_UP_ROWS")
+        database = LocallyIndexedDatabase(database, LocalVectorIndex(
+            max_memory_bytes=int(os.getenv("LOCAL_VECTOR_INDEX_MAX_MEMORY_MB", "1024")) << 20,
+            max_age=float(max_age) if max_age else None),
+            max_warm_up_rows=int(warm_up_rows) if warm_up_rows else None)
+        database.warm_up()
+    readiness["database"] = True
 
-        chatgpt = ChatGPT(openai_api_key)
+    threat_checker = create_threat_intelligence_checker()
+    readiness["threat_intelligence"] = True
 
-        threat_intelligence_system = ThreatWinds(os.getenv('THREATWINDS_API_KEY'), os.getenv('THREATWINDS_API_SECRET'))
-        threat_checker = ThreatIntelligenceChecker(threat_intelligence_system)
+    classifier = create_classifier(openai_api_key)
+    classifier.warm_up()
+    readiness["classifier"] = True
 
-        app = Application(db, chatgpt, threat_checker)
-        app.start()
+    embedding_service = default_embedding_service()
+    embedding_service.warm_up()
+    readiness["embeddings"] = True
 
-    except NoAPIKeyFoundError:
-        logging.error("No API key found in the database.")
+    compactor = None
+    if os.getenv("PROMPT_COMPACTION") == "true":
+        from SocAI.models.chatgpt.chatgpt import count_tokens
+        from SocAI.utils.compactor import DEFAULT_SCHEMAS, AlertCompactor, load_schemas
 
-    except Exception as e:
-        logging.error(f"Error: {str(e)}")
\ No newline at end of file
+        schemas_path = os.getenv("PROMPT_COMPACTION_SCHEMAS")
+        compactor = AlertCompactor(schemas=load_schemas(schemas_path) + DEFAULT_SCHEMAS if schemas_path
+                                   else DEFAULT_SCHEMAS, normalizer=normalizer, token_counter=count_tokens)
+
+    return QueueWorker(queue, database, threat_checker, classifier,
+                       max_workers=int(os.getenv("QUEUE_WORKER_CONCURRENCY", "8")),
+                       stage_limits={'llm': int(os.getenv("OPENAI_CONCURRENCY", "8"))},
+                       embedding_service=embedding_service,
+                       similarity_threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.9")),
+                       similarity_top_k=int(os.getenv("SIMILARITY_TOP_K", "100")),
+                       verdict_cache_threshold=float(os.environ["VERDICT_CACHE_THRESHOLD"])
+                       if os.getenv("VERDICT_CACHE_THRESHOLD") else None,
+                       normalizer=normalizer, compactor=compactor)
+
+
+def create_database_engine():
+    from SocAI.models.database.databaseengine import CassandraDBEngine
+
+    return CassandraDBEngine(secure_connect_bundle=os.getenv('SECURE_CONNECT_BUNDLE_PATH'),
+                             token=os.getenv("CASSANDRA_DATABASE_TOKEN"),
+                             keyspace=os.getenv('CASSANDRA_DATABASE_KEYSPACE'),
+                             connect_timeout=float(os.getenv("CASSANDRA_CONNECT_TIMEOUT", "10")),
+                             request_timeout=float(os.getenv("CASSANDRA_REQUEST_TIMEOUT", "10")),
+                             consistency_level=os.getenv("CASSANDRA_CONSISTENCY_LEVEL", "LOCAL_QUORUM"),
+                             executor_threads=int(os.getenv("CASSANDRA_EXECUTOR_THREADS", "2")))
+
+
+def create_threat_intelligence_checker():
+    from SocAI.models.threat_intelligence.cached_threat_intelligence import CachedThreatIntelligence
+    from SocAI.models.threat_intelligence.threat_intelligence_checker import ThreatIntelligenceChecker
+    from SocAI.models.threat_intelligence.threat_winds import ThreatWinds
+
+    threat_intelligence_system = CachedThreatIntelligence(
+        ThreatWinds(os.getenv('THREATWINDS_API_KEY'), os.getenv('THREATWINDS_API_SECRET')),
+        max_entries=int(os.getenv("THREAT_INTELLIGENCE_CACHE_SIZE", "10000")),
+        hit_ttl=int(os.getenv("THREAT_INTELLIGENCE_CACHE_HIT_TTL", "3600")),
+        miss_ttl=int(os.getenv("THREAT_INTELLIGENCE_CACHE_MISS_TTL", "600")),
+        persistent_path=os.getenv("THREAT_INTELLIGENCE_CACHE_PATH"))
+    return ThreatIntelligenceChecker(
+        threat_intelligence_system,
+        max_concurrency=int(os.getenv("THREAT_INTELLIGENCE_CONCURRENCY", "8")),
+        entity_types=tuple(os.getenv("THREAT_INTELLIGENCE_ENTITY_TYPES", "ip,domain,email").split(",")))
+
+
+def create_classifier(openai_api_key):
+    """Classifier selected by CLASSIFIER_BACKEND: openai (default), local, tiered or fake."""
+    from SocAI.models.chatgpt.chatgpt import ChatGPT
+    from SocAI.models.chatgpt.llm_client import RateLimitedChatClient
+    from SocAI.models.classifier.classifier_backend import FakeClassifierBackend
+    from SocAI.models.classifier.tiered_classifier import TieredClassifierBackend
+    from SocAI.models.classifier.transformers_classifier import TransformersClassifierBackend
+
+    backend = os.getenv("CLASSIFIER_BACKEND", "openai")
+    if backend == "fake":
+        return FakeClassifierBackend()
+
+    chatgpt = ChatGPT(openai_api_key, client=RateLimitedChatClient(
+        openai_api_key,
+        requests_per_minute=int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "3500")),
+        tokens_per_minute=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "180000")),
+        max_concurrency=int(os.getenv("OPENAI_CONCURRENCY", "8"))))
+    if backend == "openai":
+        batch_size = int(os.getenv("CLASSIFICATION_BATCH_SIZE", "1"))
+        if batch_size > 1:
+            from SocAI.models.classifier.batching_classifier import BatchingClassifier
+
+            return BatchingClassifier(chatgpt, max_batch_size=batch_size,
+                                      max_latency=float(os.getenv("CLASSIFICATION_BATCH_MAX_LATENCY", "0.2")),
+                                      max_prompt_tokens=int(os.getenv("CLASSIFICATION_BATCH_MAX_ALERT_TOKENS", "2000")),
+                                      concurrency=int(os.getenv("OPENAI_CONCURRENCY", "8")))
+        return chatgpt
+
+    local = TransformersClassifierBackend(model=os.getenv("LOCAL_CLASSIFIER_MODEL",
+                                                          "typeform/distilbert-base-uncased-mnli"))
+    if backend == "local":
+        return local
+    if backend == "tiered":
+        return TieredClassifierBackend(local, chatgpt,
+                                       min_confidence=float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.9")))
+    raise ValueError(f"Unknown classifier backend: {backend}")
+
+
+# Instantiate and run the application, the worker is created in the background
+if __name__ == "__main__":
+    app = Application(worker_processes=int(os.getenv("WORKER_PROCESSES", "0")),
+                      drain_timeout=float(os.getenv("WORKER_DRAIN_TIMEOUT", "25")))
+    app.start()
@@ -1,3 +1,4 @@
+import functools
 import json
 import logging
 
@@ -6,45 +7,101 @@ import openai
 import regex
 import tiktoken
 
-from SocAI.models.chatgpt.instruction import instruction
+from SocAI.models.chatgpt.instruction import batch_instruction, instruction
+from SocAI.models.chatgpt.llm_client import RateLimitedChatClient
+from SocAI.models.classifier.classifier_backend import ClassifierBackend
 
 
 class ChatGPTResponseParsingError(Exception):
     pass
 
 
-class ChatGPT:
-    def __init__(self, api_key):
+class ChatGPT(ClassifierBackend):
+    name = 'openai'
+    model = 'gpt-3.5-turbo-16k'
+    maxtokens = 16384
+    tokens_by_reponse = 500
+
+    def __init__(self, api_key, client: RateLimitedChatClient = None):
         openai.api_key = api_key
+        self.client = client or RateLimitedChatClient(api_key)
 
-    @backoff.on_exception(backoff.expo,
-                          ChatGPTResponseParsingError,
-                          max_time=3)
-    def ask(self, question):
+    def build_messages(self, question):
+        """Return the messages sent for the question, truncated to fit in the context of the model."""
+        question_length = self.maxtokens - self.tokens_by_reponse - instruction_tokens(self.model)
+
+        return [
+            {"role": "system", "content": instruction},
+            {"role": "user", "content": truncated_string(question.replace('\\', ''), question_length, self.model)},
+        ]
 
-        model = 'gpt-3.5-turbo-16k'
+    def estimate_tokens(self, messages):
+        """Cheap estimate of the prompt tokens for the rate limiter, corrected with the real usage afterwards."""
+        question_length = self.maxtokens - self.tokens_by_reponse - instruction_tokens(self.model)
+        return instruction_tokens(self.model) + min(question_length, len(messages[1]["content"]) // 4 + 1)
 
-        maxtokens = 16384
-        tokens_by_reponse = 500
+    def classify(self, prompt):
+        return self.ask(prompt)
 
+    def batch_tokens(self, prompt, max_tokens=None):
+        """
+        Tokens taken by a prompt in a batch request, including the response allocated to it. Prompts taking more
+        than `max_tokens` are only partly tokenized and reported as max_tokens + 1.
+        """
+        overhead = batch_section_tokens(self.model) + self.tokens_by_reponse
+        limit = None if max_tokens is None else max(0, max_tokens - overhead)
+        tokens = count_tokens(prompt.replace('\\', ''), self.model, limit=limit)
+        return overhead + tokens if limit is None or tokens <= limit else max_tokens + 1
 
+    def max_batch_tokens(self):
+        """Tokens of the context left for the prompts and responses of a batch request."""
+        return self.maxtokens - batch_instruction_tokens(self.model)
+
+    def classify_many(self, prompts):
+        """
+        Classify several prompts with a single request, answered with one JSON object keyed by alert id.
+
+        Parameters:
+        - prompts (dict): The prompts by alert id, their batch_tokens should add up to at most max_batch_tokens.
+
+        Returns:
+        - verdicts (dict): The verdict of every alert id, or the ChatGPTResponseParsingError of its part of the
+          answer.
+        """
         messages = [
-            {"role": "system", "content": instruction},
-            {"role": "user", "content": ''},
+            {"role": "system", "content": batch_instruction},
+            {"role": "user", "content": batch_question(prompts)},
         ]
+        estimated_tokens = batch_instruction_tokens(self.model) + len(messages[1]["content"]) // 4 + 1
+
+        try:
+            response = self.client.complete(messages, self.model, self.tokens_by_reponse * len(prompts),
+                                            estimated_tokens)
+
+            message = response.choices[0]['message']['content']
+            return parse_batch_response(message, prompts)
 
-        messages_tokens = num_tokens_from_messages(messages)
+        except openai.error.AuthenticationError as e:
+            raise openai.error.AuthenticationError("Error during OpenAI authentication: Failed to authenticate the "
+                                                   "API credentials.") from e
 
-        question_length = maxtokens - tokens_by_reponse - messages_tokens
+        except Exception as e:
+            raise Exception("Error asking chatgpt", e)
 
-        messages[1]["content"] = truncated_string(question.replace('\\', ''), question_length, model)
+    def warm_up(self):
+        # Loads the tiktoken encoding
+        instruction_tokens(self.model)
+
+    @backoff.on_exception(backoff.expo,
+                          ChatGPTResponseParsingError,
+                          max_time=3)
+    def ask(self, question):
+
+        messages = self.build_messages(question)
 
         try:
-            response = openai.ChatCompletion.create(
-                model=model,
-                n=1,
-                max_tokens=tokens_by_reponse,
-                messages=messages)
+            response = self.client.complete(messages, self.model, self.tokens_by_reponse,
+                                            self.estimate_tokens(messages))
 
             message = response.choices[0]['message']['content']
             return parse_chatgpt_response(message)
@@ -71,11 +128,7 @@ def parse_chatgpt_response(chatgpt_string_response):
 
         chatgpt_dict_response = json.loads(extracted_dict)
 
-        required_keys = ["classification", "reasoning", "next_steps"]
-        if not all(key in chatgpt_dict_response for key in required_keys):
-            raise Exception("Response does not have all the required keys.")
-
-        return chatgpt_dict_response
+        return validate_chatgpt_response(chatgpt_dict_response)
 
     except json.JSONDecodeError:
         error_message = "Failed parsing ChatGPT response: Invalid JSON format."
@@ -88,13 +141,97 @@ def parse_chatgpt_response(chatgpt_string_response):
         raise ChatGPTResponseParsingError(error_message)
 
 
-def num_tokens_from_messages(messages, model="gpt-3.5-turbo-16k"):
-    """Returns the number of tokens used by a list of messages."""
+def validate_chatgpt_response(chatgpt_dict_response):
+    """Return the parsed answer for an alert, if it has every key of the response format."""
+    required_keys = ["classification", "reasoning", "next_steps"]
+    if not isinstance(chatgpt_dict_response, dict) or not all(key in chatgpt_dict_response for key in required_keys):
+        raise ChatGPTResponseParsingError("Response does not have all the required keys.")
+    return chatgpt_dict_response
+
+
+def batch_question(prompts):
+    """The question of a batch request, one section per prompt starting with its alert id."""
+    return '\n\n'.join(f"### Alert {alert_id}\n{prompt}" for alert_id, prompt in prompts.items()).replace('\\', '')
+
+
+def parse_batch_response(chatgpt_string_response, alert_ids):
+    """
+    Split the answer of a batch request by alert id. Every part is validated like a single response, the parts
+    that are missing or invalid are returned as a ChatGPTResponseParsingError.
+    """
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        pattern = regex.compile(r'{(?:[^{}]|(?R))*}')
+
+        if not (matches := pattern.findall(chatgpt_string_response)):
+            raise ChatGPTResponseParsingError(f"No dictionary found in the ChatGPT response: {chatgpt_string_response}")
+        answers = json.loads(matches[0])
+
+    except (json.JSONDecodeError, ChatGPTResponseParsingError) as e:
+        error = ChatGPTResponseParsingError(f"Failed parsing ChatGPT batch response: {e}")
+        logging.error(str(error))
+        return {alert_id: error for alert_id in alert_ids}
+
+    verdicts = {}
+    for alert_id in alert_ids:
+        try:
+            verdicts[alert_id] = validate_chatgpt_response(answers.get(alert_id))
+        except ChatGPTResponseParsingError as e:
+            logging.error(f"Failed parsing the answer for the alert {alert_id} of a ChatGPT batch response: {e}")
+            verdicts[alert_id] = e
+    return verdicts
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """Returns the encoding of the model, loaded once per model."""
+    try:
+        return tiktoken.encoding_for_model(model)
     except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+        logging.warning("Warning: model not found. Using cl100k_base encoding.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model="gpt-3.5-turbo-16k", limit=None):
+    """
+    Returns the number of tokens of a text. With a limit, a text taking more tokens is only partly encoded, like
+    in truncated_string, and limit + 1 is returned.
+    """
+    encoding = get_encoding(model)
+    prefix_length = None if limit is None else limit * TRUNCATION_PREFIX_CHARS_PER_TOKEN
+    if prefix_length is not None and len(text) > prefix_length:
+        if len(encoding.encode(text[:prefix_length], disallowed_special=())) > limit:
+            return limit + 1
+    tokens = len(encoding.encode(text, disallowed_special=()))
+    return tokens if limit is None else min(tokens, limit + 1)
+
+
+@functools.lru_cache(maxsize=None)
+def instruction_tokens(model="gpt-3.5-turbo-16k"):
+    """Returns the tokens used by the system instruction and an empty question, it never changes."""
+    return num_tokens_from_messages([
+        {"role": "system", "content": instruction},
+        {"role": "user", "content": ''},
+    ], model)
+
+
+@functools.lru_cache(maxsize=None)
+def batch_section_tokens(model="gpt-3.5-turbo-16k"):
+    """Returns the tokens used by the section of an empty prompt in a batch question, its alert id included."""
+    return num_tokens_from_messages([{"role": "user", "content": batch_question({'alert-00': ''})}], model)
+
+
+@functools.lru_cache(maxsize=None)
+def batch_instruction_tokens(model="gpt-3.5-turbo-16k"):
+    """Returns the tokens used by the batch instruction and an empty question."""
+    return num_tokens_from_messages([
+        {"role": "system", "content": batch_instruction},
+        {"role": "user", "content": ''},
+    ], model)
+
+
+def num_tokens_from_messages(messages, model="gpt-3.5-turbo-16k"):
+    """Returns the number of tokens used by a list of messages."""
+    encoding = get_encoding(model)
     if model == "gpt-3.5-turbo":
         return num_tokens_from_messages(messages, model="gpt-3.5-turbo-16k")
     elif model == "gpt-4":
@@ -118,6 +255,10 @@ def num_tokens_from_messages(messages, model="gpt-3.5-turbo-16k"):
     return num_tokens
 
 
+# Characters encoded per token budget before truncating, logs rarely average more than 4 characters per token
+TRUNCATION_PREFIX_CHARS_PER_TOKEN = 8
+
+
 def truncated_string(
         string: str,
         max_tokens: int,
@@ -125,6 +266,21 @@ def truncated_string(
         print_warning: bool = True,
 ) -> str:
     """Truncate a string to a maximum number of tokens."""
-    encoding = tiktoken.encoding_for_model(model)
+    # Every token is at least one byte long, a string with no more bytes than max_tokens always fits
+    if len(string) <= max_tokens and len(string.encode()) <= max_tokens:
+        return string
+
+    encoding = get_encoding(model)
+
+    # Only the head of the string survives, encode a prefix first and fall back to the whole string when the
+    # prefix turns out to be shorter than the budget
+    prefix_length = max_tokens * TRUNCATION_PREFIX_CHARS_PER_TOKEN
+    if len(string) > prefix_length:
+        encoded_prefix = encoding.encode(string[:prefix_length])
+        if len(encoded_prefix) > max_tokens:
+            return encoding.decode(encoded_prefix[:max_tokens])
+
     encoded_string = encoding.encode(string)
+    if len(encoded_string) <= max_tokens:
+        return string
     return encoding.decode(encoded_string[:max_tokens])
@@ -8,4 +8,12 @@ to stop an imminent or ongoing cybersecurity incident.
 Your answer should be provided using the following JSON format and the total number of characters in your answer must not exceed [x number of characters]. Your entire answer must be inside this json format.
 
 {"classification":"<classification>","reasoning":["<reasoning_point_1>","<reasoning_point_2>"],"next_steps":[{"step":1,"action":"<action_1>","details":"<action_1_details>"},{"step":2,"action":"<action_2>","details":"<action_2_details>"}]}
-"""
\ No newline at end of file
+"""
+
+# Instruction of the requests classifying several alerts at once, see ChatGPT.classify_many
+batch_instruction = instruction + """
+You will receive several alerts, each one starting with a line "### Alert <id>". Analyze every alert on its own and 
+answer with a single JSON object whose keys are the alert ids and whose values are your answers for each alert in the 
+format above: {"<id_1>":{"classification":"<classification>","reasoning":[...],"next_steps":[...]},"<id_2>":{...}}
+Your entire answer must be inside this JSON object and must contain every alert id.
+"""
@@ -0,0 +1,132 @@
+import logging
+import random
+import threading
+import time
+
+import openai
+
+from SocAI.utils.metrics import registry
+
+LLM_TOKENS_TOTAL = registry.counter('socai_llm_tokens_total', 'Tokens reported by OpenAI, by direction.',
+                                    ('direction',))
+LLM_REQUESTS_TOTAL = registry.counter('socai_llm_requests_total', 'Chat completion requests, by outcome.',
+                                      ('outcome',))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        """
+        Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+        Takers are never refused: the bucket goes into debt and each taker is told how long to wait, so callers are
+        served in the order they asked and the long-term rate never exceeds the budget.
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Take `amount` tokens and return the seconds to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount):
+        """Give back (negative amount) or take more tokens once the real cost is known, without waiting."""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+    def acquire(self, amount=1):
+        time.sleep(self.reserve(amount))
+
+
+# Errors worth retrying: the request may succeed later
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.ServiceUnavailableError, openai.error.Timeout,
+                    openai.error.APIConnectionError, openai.error.TryAgain)
+
+
+class RateLimitedChatClient:
+    def __init__(self, api_key=None, requests_per_minute=3500, tokens_per_minute=180000, max_concurrency=8,
+                 max_retries=6, base_delay=1, max_delay=60, api_base=None, request_timeout=120):
+        """
+        Chat completion client enforcing the requests and tokens per minute budgets of the account.
+
+        Each request reserves its estimated tokens (prompt plus max_tokens) before being sent and the reservation
+        is corrected with the usage reported by OpenAI. At most `max_concurrency` requests are in flight. Rate
+        limit, timeout, connection and 5xx errors are retried with jittered exponential backoff, honoring the
+        Retry-After header.
+        """
+        self.api_key = api_key
+        self.api_base = api_base
+        self.request_timeout = request_timeout
+        self.requests_bucket = TokenBucket(requests_per_minute)
+        self.tokens_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _request_arguments(self, model, messages, max_tokens):
+        arguments = {'model': model, 'n': 1, 'max_tokens': max_tokens, 'messages': messages,
+                     'request_timeout': self.request_timeout}
+        if self.api_key:
+            arguments['api_key'] = self.api_key
+        if self.api_base:
+            arguments['api_base'] = self.api_base
+        return arguments
+
+    def _is_retryable(self, error):
+        if isinstance(error, RETRYABLE_ERRORS):
+            return True
+        return isinstance(error, openai.error.APIError) and (error.http_status or 500) >= 500
+
+    def _retry_delay(self, error, attempt):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        headers = getattr(error, 'headers', None) or {}
+        retry_after = headers.get('retry-after') or headers.get('Retry-After')
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def _reconcile(self, response, estimated_tokens):
+        LLM_REQUESTS_TOTAL.inc(outcome='success')
+        usage = response.get('usage') if hasattr(response, 'get') else None
+        if usage and 'total_tokens' in usage:
+            self.tokens_bucket.adjust(usage['total_tokens'] - estimated_tokens)
+            LLM_TOKENS_TOTAL.inc(usage.get('prompt_tokens', 0), direction='in')
+            LLM_TOKENS_TOTAL.inc(usage.get('completion_tokens', 0), direction='out')
+
+    def complete(self, messages, model, max_tokens, prompt_tokens):
+        """
+        Send a chat completion request and return the response, retrying transient errors.
+
+        Parameters:
+        - prompt_tokens (int): Estimated tokens of the messages, used for the tokens per minute budget.
+        """
+        estimated_tokens = prompt_tokens + max_tokens
+        for attempt in range(self.max_retries + 1):
+            self.requests_bucket.acquire()
+            self.tokens_bucket.acquire(estimated_tokens)
+            try:
+                with self.semaphore:
+                    response = openai.ChatCompletion.create(**self._request_arguments(model, messages, max_tokens))
+                self._reconcile(response, estimated_tokens)
+                return response
+            except Exception as e:
+                # A failed request consumed no tokens
+                self.tokens_bucket.adjust(-estimated_tokens)
+                if not self._is_retryable(e) or attempt == self.max_retries:
+                    LLM_REQUESTS_TOTAL.inc(outcome='error')
+                    raise
+                LLM_REQUESTS_TOTAL.inc(outcome='retried')
+                delay = self._retry_delay(e, attempt)
+                logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
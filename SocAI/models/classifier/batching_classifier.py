@@ -0,0 +1,78 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from SocAI.models.classifier.classifier_backend import ClassifierBackend
+from SocAI.utils.metrics import registry
+from SocAI.utils.micro_batcher import MicroBatcher
+
+CLASSIFICATION_BATCH_SIZE = registry.histogram('socai_classification_batch_size',
+                                               'Alerts classified by each batch request.',
+                                               buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCHED_CLASSIFICATIONS_TOTAL = registry.counter('socai_batched_classifications_total',
+                                                 'Alerts classified by the batching classifier, by outcome.',
+                                                 ('outcome',))
+
+
+class BatchingClassifier(ClassifierBackend):
+    """
+    Packs the prompts of alerts classified at the same time into shared requests of a backend able to classify
+    several prompts at once, such as ChatGPT.classify_many. The system instruction is sent once per batch instead
+    of once per alert.
+
+    Only small prompts are batched, larger ones are classified alone. An alert whose part of the answer is missing
+    or invalid is classified again alone.
+    """
+    name = 'batching'
+    batches_requests = True
+
+    def __init__(self, backend: ClassifierBackend, max_batch_size=8, max_latency=0.2, max_prompt_tokens=2000,
+                 concurrency=8):
+        """
+        Parameters:
+        - backend (ClassifierBackend): Backend with classify_many, batch_tokens(prompt, max_tokens) and
+          max_batch_tokens.
+        - max_batch_size (int): Maximum number of alerts per request.
+        - max_latency (float): Maximum seconds an alert waits for its batch to fill up.
+        - max_prompt_tokens (int): Prompts taking more tokens in a batch are classified alone.
+        - concurrency (int): Maximum number of batch requests in flight.
+        """
+        self.backend = backend
+        self.max_prompt_tokens = max_prompt_tokens
+        # Batches are bounded by the context of the model, the response of every alert included
+        self.batcher = MicroBatcher(self._send_batch, max_batch_size=max_batch_size, max_latency=max_latency,
+                                    cost_function=lambda item: item[1], max_cost=backend.max_batch_tokens(),
+                                    name='classification-batcher')
+        # Requests run here so the next batch is packed while the previous ones wait for their answer
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='classification-batch')
+
+    def classify(self, prompt):
+        tokens = self.backend.batch_tokens(prompt, self.max_prompt_tokens)
+        if tokens > self.max_prompt_tokens:
+            BATCHED_CLASSIFICATIONS_TOTAL.inc(outcome='single')
+            return self.backend.classify(prompt)
+
+        request, alert_id = self.batcher.submit((prompt, tokens)).result()
+        verdict = request.result()[alert_id]
+        if isinstance(verdict, Exception):
+            logging.warning(f"The batch answer for an alert is invalid, classifying it alone: {str(verdict)}")
+            BATCHED_CLASSIFICATIONS_TOTAL.inc(outcome='fallback')
+            return self.backend.classify(prompt)
+
+        BATCHED_CLASSIFICATIONS_TOTAL.inc(outcome='batched')
+        return verdict
+
+    def warm_up(self):
+        self.backend.warm_up()
+
+    def _send_batch(self, items):
+        # Ids only need to be unique within the request, short ones cost fewer tokens
+        prompts = {f"alert-{index}": prompt for index, (prompt, _) in enumerate(items, 1)}
+        request = self.executor.submit(self._classify_many, prompts)
+        return [(request, alert_id) for alert_id in prompts]
+
+    def _classify_many(self, prompts):
+        CLASSIFICATION_BATCH_SIZE.observe(len(prompts))
+        if len(prompts) == 1:
+            (alert_id, prompt), = prompts.items()
+            return {alert_id: self.backend.classify(prompt)}
+        return self.backend.classify_many(prompts)
@@ -0,0 +1,45 @@
+import time
+from abc import ABC, abstractmethod
+
+# Classifications the instruction asks the model for
+CLASSIFICATIONS = ('possible incident', 'possible false positive', 'standard alert')
+
+
+class ClassifierBackend(ABC):
+    """Classifies the prompt of an alert."""
+    name = 'classifier-backend'
+    # Backends packing concurrent calls into shared requests limit their requests themselves, the worker does not
+    # bound the alerts waiting in them with the llm stage
+    batches_requests = False
+
+    @abstractmethod
+    def classify(self, prompt):
+        """
+        Return the classification of the alert described by the prompt as a dict with the keys "classification",
+        "reasoning" and "next_steps". Backends that know how sure they are also return a "confidence" in [0, 1].
+        """
+        pass
+
+    def warm_up(self):
+        """Load the model or client ahead of the first alert."""
+        pass
+
+
+class FakeClassifierBackend(ClassifierBackend):
+    """Answers every prompt with the same classification after `latency` seconds, for tests and benchmarks."""
+    name = 'fake'
+
+    def __init__(self, classification='standard alert', confidence=1.0, latency=0.0):
+        self.classification = classification
+        self.confidence = confidence
+        self.latency = latency
+
+    def classify(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return {
+            "classification": self.classification,
+            "reasoning": ["Classified by the fake classifier."],
+            "next_steps": [],
+            "confidence": self.confidence,
+        }
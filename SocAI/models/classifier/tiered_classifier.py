@@ -0,0 +1,42 @@
+import logging
+import threading
+
+from SocAI.models.classifier.classifier_backend import ClassifierBackend
+
+
+class TieredClassifierBackend(ClassifierBackend):
+    """
+    Classifies every alert with a cheap local classifier first. Only its confident "standard alert" verdicts are
+    kept, every other alert escalates to the remote classifier.
+    """
+    name = 'tiered'
+
+    def __init__(self, local: ClassifierBackend, remote: ClassifierBackend, min_confidence=0.9,
+                 accepted_classifications=('standard alert',)):
+        self.local = local
+        self.remote = remote
+        self.min_confidence = min_confidence
+        self.accepted_classifications = accepted_classifications
+        self.counters = {'local': 0, 'escalated': 0}
+        self.lock = threading.Lock()
+
+    def classify(self, prompt):
+        verdict = self.local.classify(prompt)
+        accepted = (verdict['classification'] in self.accepted_classifications
+                    and verdict.get('confidence', 0) >= self.min_confidence)
+
+        with self.lock:
+            self.counters['local' if accepted else 'escalated'] += 1
+            stats = dict(self.counters)
+        logging.info(f"Local classifier answered {verdict['classification']} with a confidence of "
+                     f"{verdict.get('confidence', 0):.2f}, {'accepted' if accepted else 'escalating'}: {stats}")
+
+        return verdict if accepted else self.remote.classify(prompt)
+
+    def warm_up(self):
+        self.local.warm_up()
+        self.remote.warm_up()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
@@ -0,0 +1,56 @@
+import logging
+import threading
+
+from SocAI.models.classifier.classifier_backend import ClassifierBackend
+
+# Hypotheses the zero-shot model scores the alert against, by classification
+DEFAULT_LABELS = {
+    'standard alert': 'a routine event that requires no action',
+    'possible false positive': 'a false positive',
+    'possible incident': 'a security incident',
+}
+
+
+class TransformersClassifierBackend(ClassifierBackend):
+    """
+    Classifies alerts on the CPU with a local zero-shot (NLI) transformers model, without any remote call.
+
+    The model only chooses among the classifications, it gives no next steps. Its score for the chosen
+    classification is returned as the confidence. The model is loaded on the first classification.
+    """
+    name = 'transformers'
+
+    def __init__(self, model='typeform/distilbert-base-uncased-mnli', labels=None,
+                 hypothesis_template='This security alert is {}.', framework=None):
+        self.model = model
+        self.labels = labels or DEFAULT_LABELS
+        self.hypothesis_template = hypothesis_template
+        self.framework = framework
+        self._pipeline = None
+        # Pipelines are not thread safe, and the CPU is the bottleneck anyway
+        self._lock = threading.Lock()
+
+    def classify(self, prompt):
+        classifications = {hypothesis: classification for classification, hypothesis in self.labels.items()}
+        self.warm_up()
+        with self._lock:
+            result = self._pipeline(prompt, candidate_labels=list(classifications),
+                                    hypothesis_template=self.hypothesis_template)
+
+        classification = classifications[result['labels'][0]]
+        confidence = float(result['scores'][0])
+        return {
+            "classification": classification,
+            "reasoning": [f"Classified by the local model {self.model} with a confidence of {confidence:.2f}."],
+            "next_steps": [],
+            "confidence": confidence,
+        }
+
+    def warm_up(self):
+        with self._lock:
+            if self._pipeline is None:
+                from transformers import pipeline
+
+                logging.info(f"Loading the local classification model {self.model}")
+                self._pipeline = pipeline('zero-shot-classification', model=self.model, framework=self.framework,
+                                          device=-1)
@@ -1,13 +1,24 @@
+import json
 import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
 
 from cassandra.query import SimpleStatement
 
+# Stored alert close to a queried vector, with the verdict it received
+Neighbour = namedtuple('Neighbour', ['id', 'similarity', 'evaluation', 'ti_signature'])
+# Number of stored alerts above the similarity threshold and the closest of them
+SimilarityResult = namedtuple('SimilarityResult', ['count', 'neighbours'])
+
 
 class CassandraDBOperations:
     def __init__(self, db_engine, table):
         self.session = db_engine.session
         self.keyspace = db_engine.keyspace
         self.table = table
+        self.prepared_statements = {}
+        self.prepare_lock = threading.Lock()
 
     def create_table(self):
         try:
@@ -21,33 +32,151 @@ class CassandraDBOperations:
                         evaluation TEXT,
                         reasoning TEXT,
                         next_steps TEXT,
-                        alert_body_vector VECTOR<FLOAT, 1536>
+                        alert_body_vector VECTOR<FLOAT, 1536>,
+                        ti_signature TEXT,
+                        verdict_source TEXT,
+                        stored_at TIMESTAMP
                     );
                     """)
 
             self.session.execute(table_creation_query)
+            self._add_columns({'ti_signature': 'TEXT', 'verdict_source': 'TEXT', 'stored_at': 'TIMESTAMP'})
 
             index_creation_query = SimpleStatement(f"""
                     CREATE CUSTOM INDEX IF NOT EXISTS ann_index ON {self.keyspace}.{self.table}(alert_body_vector) USING 'StorageAttachedIndex';""")
 
             self.session.execute(index_creation_query)
 
+            # Lets the local vector index read only the recent alerts
+            stored_at_index_query = SimpleStatement(f"""
+                    CREATE CUSTOM INDEX IF NOT EXISTS stored_at_index ON {self.keyspace}.{self.table}(stored_at) USING 'StorageAttachedIndex';""")
+
+            self.session.execute(stored_at_index_query)
+
         except Exception as e:
             logging.error(f"An error occurred while creating the table: {str(e)}")
+            raise
+
+    def _add_columns(self, columns):
+        """
+        Add the columns missing in tables created by older versions.
+        """
+        for name, column_type in columns.items():
+            try:
+                self.session.execute(f"ALTER TABLE {self.keyspace}.{self.table} ADD {name} {column_type};")
+            except Exception as e:
+                # Cassandra refuses to add a column that already exists
+                logging.debug(f"The column {name} was not added: {str(e)}")
+
+    def prepare(self, query):
+        """
+        Return the prepared statement of the query, preparing it on first use.
+        """
+        statement = self.prepared_statements.get(query)
+        if statement is None:
+            with self.prepare_lock:
+                statement = self.prepared_statements.get(query)
+                if statement is None:
+                    statement = self.prepared_statements[query] = self.session.prepare(query)
+        return statement
+
+    def prepare_statements(self, fields):
+        """
+        Prepare the statements used while processing alerts, so the first alerts do not pay for it. Raises if they
+        cannot be prepared, e.g. when the table is missing.
+        """
+        try:
+            self._insert_statement(fields)
+            self._similarity_statement()
+        except Exception as e:
+            logging.error(f"An error occurred while preparing the statements: {str(e)}")
+            raise
+
+    def _insert_statement(self, fields):
+        placeholders = ', '.join(['?' for _ in fields])
+        return self.prepare(f"INSERT INTO {self.keyspace}.{self.table} ({', '.join(fields)}) VALUES ({placeholders});")
+
+    def _similarity_statement(self):
+        return self.prepare(f'SELECT id, evaluation, ti_signature, '
+                            f'similarity_cosine(alert_body_vector, ?) AS similarity '
+                            f'FROM {self.keyspace}.{self.table} ORDER BY alert_body_vector ANN OF ? LIMIT ?;')
 
     def insert_data(self, fields, values):
+        """
+        Insert a row.
+
+        Returns whether the row was written.
+        """
         try:
-            placeholders = ', '.join(['%s' for _ in values])
-            query = SimpleStatement(f"INSERT INTO {self.keyspace}.{self.table} ({', '.join(fields)}) VALUES ({placeholders});")
-            self.session.execute(query, values)
+            self.session.execute(self._insert_statement(fields), values)
+            return True
         except Exception as e:
             logging.error(f"An error occurred while inserting data: {str(e)}")
+            return False
+
+    def insert_data_async(self, fields, values):
+        """
+        Start inserting a row without waiting for it.
+
+        Returns the driver's ResponseFuture, use add_callbacks to act on the outcome.
+        """
+        return self.session.execute_async(self._insert_statement(fields), values)
+
+    def query_similar(self, value, threshold=0.9, top_k=100, neighbours=3):
+        """
+        Count the stored alerts whose similarity with the vector is at least `threshold`, among its `top_k` nearest
+        neighbours. Similarities are Astra's similarity_cosine, (1 + cosine) / 2, in [0, 1]. Only the id, verdict
+        and similarity of each neighbour are transferred.
+
+        Returns a SimilarityResult with the count and the `neighbours` most similar alerts, or None on error.
+        """
+        try:
+            rows = self.session.execute(self._similarity_statement(), (value, value, top_k))
+            similar = [Neighbour(row.id, row.similarity, row.evaluation, row.ti_signature)
+                       for row in rows if row.similarity >= threshold]
+            similar.sort(key=lambda neighbour: neighbour.similarity, reverse=True)
+            return SimilarityResult(len(similar), similar[:neighbours])
+        except Exception as e:
+            logging.error(f"An error occurred while querying similar data: {str(e)}")
+            return None
+
+    def scan_vectors(self, since=None, limit=None):
+        """
+        Yield (id, evaluation, ti_signature, vector, written_at) for at most `limit` stored alerts, page by page,
+        with written_at the WRITETIME of the verdict in seconds.
+
+        With `since`, only the alerts stored since then are read, through the index on stored_at. Alerts stored
+        before the column existed are left out.
+        """
+        query = (f'SELECT id, evaluation, ti_signature, alert_body_vector, WRITETIME(evaluation) AS written_at '
+                 f'FROM {self.keyspace}.{self.table}')
+        parameters = []
+        if since is not None:
+            query += ' WHERE stored_at >= %s'
+            parameters.append(datetime.fromtimestamp(since, timezone.utc))
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        statement = SimpleStatement(query + ';', fetch_size=5000)
+        for row in self.session.execute(statement, parameters):
+            if row.alert_body_vector is None or row.written_at is None:
+                continue
+            written_at = row.written_at / 1e6
+            if since is None or written_at >= since:
+                yield row.id, row.evaluation, row.ti_signature, row.alert_body_vector, written_at
 
-    def query_vector(self, value):
+    def get_verdict(self, id):
+        """
+        Return the verdict stored for the alert, in the format of the classification responses, or None.
+        """
         try:
-            statement = f'SELECT * FROM {self.keyspace}.{self.table} ORDER BY alert_body_vector ANN OF %s LIMIT 1000;'
-            result_set = self.session.execute(statement, (value,))
-            return result_set.all()
+            statement = self.prepare(f'SELECT evaluation, reasoning, next_steps FROM {self.keyspace}.{self.table} '
+                                     f'WHERE id = ?;')
+            row = self.session.execute(statement, (id,)).one()
+            if row is None or row.evaluation is None:
+                return None
+            return {'classification': row.evaluation,
+                    'reasoning': json.loads(row.reasoning),
+                    'next_steps': json.loads(row.next_steps)}
         except Exception as e:
-            logging.error(f"An error occurred while querying data: {str(e)}")
+            logging.error(f"An error occurred while querying the verdict: {str(e)}")
             return None
@@ -1,27 +1,53 @@
 import logging
 
-from cassandra.cluster import Cluster
+from cassandra import ConsistencyLevel
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
 from cassandra.auth import PlainTextAuthProvider
 
 
 class CassandraDBEngine:
-    def __init__(self, secure_connect_bundle, token, keyspace):
+    def __init__(self, secure_connect_bundle, token, keyspace, connect_timeout=10, request_timeout=10,
+                 consistency_level='LOCAL_QUORUM', executor_threads=2, fetch_size=5000):
+        """
+        Connection to the Cassandra cluster.
+
+        There are no connection pool settings: with protocol v3 and later, used by Astra, the driver keeps a single
+        connection per host and multiplexes up to 32768 concurrent requests on it.
+
+        - connect_timeout: seconds to wait for a connection to a node.
+        - request_timeout: seconds to wait for the result of a request.
+        - consistency_level: name of the default consistency level, e.g. LOCAL_QUORUM or LOCAL_ONE.
+        - executor_threads: threads of the driver for connection setup and pool maintenance. Request callbacks run
+          on its event loop thread instead.
+        - fetch_size: rows fetched per page.
+        """
         self.secure_connect_bundle_path = secure_connect_bundle
         self.username = 'token'
         self.password = token
         self.keyspace = keyspace
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.consistency_level = ConsistencyLevel.name_to_value[consistency_level.upper()]
+        self.executor_threads = executor_threads
+        self.fetch_size = fetch_size
         self.session = self.get_cql_session()
 
     def get_cql_session(self):
         try:
+            profile = ExecutionProfile(request_timeout=self.request_timeout,
+                                       consistency_level=self.consistency_level)
             cluster = Cluster(
                 cloud={"secure_connect_bundle": self.secure_connect_bundle_path},
                 auth_provider=PlainTextAuthProvider(
                     self.username,
                     self.password,
                 ),
+                execution_profiles={EXEC_PROFILE_DEFAULT: profile},
+                connect_timeout=self.connect_timeout,
+                executor_threads=self.executor_threads,
             )
             session = cluster.connect()
+            session.default_fetch_size = self.fetch_size
             return session
         except Exception as e:
             logging.error(f"An error occurred while connecting to the database: {str(e)}")
@@ -31,4 +57,4 @@ class CassandraDBEngine:
         try:
             self.session.shutdown()
         except Exception as e:
-            logging.error(f"An error occurred while disconnecting: {str(e)}")
\ No newline at end of file
+            logging.error(f"An error occurred while disconnecting: {str(e)}")
@@ -0,0 +1,242 @@
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from SocAI.models.database.cassandradboperations import Neighbour, SimilarityResult
+from SocAI.utils.metrics import registry
+from SocAI.utils.micro_batcher import MicroBatcher
+
+LOCAL_INDEX_QUERIES_TOTAL = registry.counter('socai_local_vector_index_queries_total',
+                                             'Similarity queries, by tier that answered them.', ('tier',))
+LOCAL_INDEX_VECTORS = registry.gauge('socai_local_vector_index_vectors', 'Vectors held by the local vector index.')
+
+
+class LocalVectorIndex:
+    def __init__(self, dimension=1536, max_memory_bytes=1 << 30, max_age=None):
+        """
+        The most recent alert vectors with their verdicts, in a float32 matrix used as a ring buffer.
+
+        Queries are exact top-k cosine searches, computed for a whole batch of vectors with one matrix product.
+        Similarities are reported like Astra's similarity_cosine, (1 + cosine) / 2, so thresholds are the same
+        for both tiers.
+
+        Parameters:
+        - dimension (int): Dimension of the vectors.
+        - max_memory_bytes (int): Memory of the matrix, the oldest vectors are evicted once it is full.
+        - max_age (float): Seconds after which a vector is evicted. None keeps vectors until they are overwritten.
+        """
+        self.dimension = dimension
+        self.capacity = max(1, max_memory_bytes // (dimension * 4))
+        self.max_age = max_age
+
+        self.vectors = np.zeros((self.capacity, dimension), dtype=np.float32)
+        self.written_at = np.zeros(self.capacity, dtype=np.float64)
+        self.alive = np.zeros(self.capacity, dtype=bool)
+        self.ids = [None] * self.capacity
+        self.evaluations = [None] * self.capacity
+        self.ti_signatures = [None] * self.capacity
+        self.slots = {}
+        # Ring buffer of `size` slots starting at `start`, in the order they were written
+        self.start = 0
+        self.size = 0
+        self.lock = threading.Lock()
+        # Set once the index holds the recent vectors of the database
+        self.ready = False
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, id, vector, evaluation=None, ti_signature=None, written_at=None):
+        """Add a vector, replacing the one stored for the same id."""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if vector.shape != (self.dimension,) or not norm:
+            return
+        with self.lock:
+            self._append(id, vector / norm, evaluation, ti_signature, written_at or time.time())
+            LOCAL_INDEX_VECTORS.set(len(self.slots))
+
+    def load(self, rows):
+        """
+        Add the (id, evaluation, ti_signature, vector, written_at) rows of the database, keeping only the newest
+        ones that fit. Vectors added in the meantime stay the newest.
+        """
+        cutoff = time.time() - self.max_age if self.max_age else 0
+        # Vectors are kept as float32 while selecting, the selection takes at most the memory of the matrix again
+        rows = ((id, evaluation, ti_signature, np.asarray(vector, dtype=np.float32), written_at)
+                for id, evaluation, ti_signature, vector, written_at in rows if written_at >= cutoff)
+        newest = heapq.nlargest(self.capacity, rows, key=lambda row: row[4])
+        with self.lock:
+            recent = [self._entry(slot) for slot in self._ring() if self.alive[slot]]
+            self.start = self.size = 0
+            self.alive[:] = False
+            self.slots = {}
+            for id, evaluation, ti_signature, vector, written_at in reversed(newest):
+                norm = np.linalg.norm(vector)
+                if vector.shape == (self.dimension,) and norm:
+                    self._append(id, vector / norm, evaluation, ti_signature, written_at)
+            for entry in recent:
+                self._append(*entry)
+            LOCAL_INDEX_VECTORS.set(len(self.slots))
+        logging.info(f"Loaded {len(newest)} vectors in the local vector index")
+
+    def query_similar_many(self, vectors, threshold=0.9, top_k=100, neighbours=3):
+        """
+        Search the `top_k` nearest vectors of every query vector.
+
+        Returns a SimilarityResult per vector, with the number of neighbours at least `threshold` similar and the
+        `neighbours` most similar ones.
+        """
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            self._expire()
+            if not self.slots:
+                return [SimilarityResult(0, []) for _ in queries]
+
+            # Slots past the end of the ring were never written
+            high = self.capacity if self.start + self.size > self.capacity else self.start + self.size
+            similarities = (1 + queries @ self.vectors[:high].T) / 2
+            similarities[:, ~self.alive[:high]] = -np.inf
+
+            k = min(top_k, high)
+            nearest = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            results = []
+            for row, candidates in zip(similarities, nearest):
+                candidates = candidates[np.argsort(-row[candidates])]
+                similar = [slot for slot in candidates if row[slot] >= threshold]
+                results.append(SimilarityResult(len(similar), [
+                    Neighbour(self.ids[slot], float(row[slot]), self.evaluations[slot], self.ti_signatures[slot])
+                    for slot in similar[:neighbours]]))
+            return results
+
+    def _ring(self):
+        return [(self.start + offset) % self.capacity for offset in range(self.size)]
+
+    def _entry(self, slot):
+        return (self.ids[slot], self.vectors[slot].copy(), self.evaluations[slot], self.ti_signatures[slot],
+                self.written_at[slot])
+
+    def _append(self, id, vector, evaluation, ti_signature, written_at):
+        previous = self.slots.pop(id, None)
+        if previous is not None:
+            self.alive[previous] = False
+        if self.size == self.capacity:
+            self._evict_oldest()
+
+        slot = (self.start + self.size) % self.capacity
+        self.size += 1
+        self.vectors[slot] = vector
+        self.written_at[slot] = written_at
+        self.alive[slot] = True
+        self.ids[slot] = id
+        self.evaluations[slot] = evaluation
+        self.ti_signatures[slot] = ti_signature
+        self.slots[id] = slot
+
+    def _evict_oldest(self):
+        slot = self.start
+        if self.alive[slot]:
+            self.alive[slot] = False
+            del self.slots[self.ids[slot]]
+        self.ids[slot] = self.evaluations[slot] = self.ti_signatures[slot] = None
+        self.start = (self.start + 1) % self.capacity
+        self.size -= 1
+
+    def _expire(self):
+        if not self.max_age:
+            return
+        cutoff = time.time() - self.max_age
+        while self.size and self.written_at[self.start] < cutoff:
+            self._evict_oldest()
+        LOCAL_INDEX_VECTORS.set(len(self.slots))
+
+
+class LocallyIndexedDatabase:
+    def __init__(self, database, index: LocalVectorIndex, max_batch_size=64, max_latency=0.002,
+                 max_warm_up_rows=None):
+        """
+        CassandraDBOperations answering the similarity queries from a local vector index.
+
+        Every row written successfully is added to the index. Until the index is loaded with the recent rows of the
+        table, and whenever it fails, the queries go to Cassandra. Concurrent queries are batched into one matrix
+        product. Everything else is delegated to the database.
+
+        Parameters:
+        - max_warm_up_rows (int): Rows read from the table to load the index. Defaults to the capacity of the index.
+        """
+        self.database = database
+        self.index = index
+        self.max_warm_up_rows = max_warm_up_rows or index.capacity
+        # Rows written asynchronously are indexed here, the callbacks run on the event loop of the driver and must
+        # not wait for the queries holding the index lock
+        self.indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vector-indexer')
+        self.batcher = MicroBatcher(self._query_batch, max_batch_size=max_batch_size, max_latency=max_latency,
+                                    name='vector-index-batcher')
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+    def warm_up(self):
+        """Load the recent vectors of the table into the index in the background."""
+        threading.Thread(target=self._load, name='vector-index-loader', daemon=True).start()
+
+    def _load(self):
+        try:
+            since = time.time() - self.index.max_age if self.index.max_age else None
+            self.index.load(self.database.scan_vectors(since, limit=self.max_warm_up_rows))
+            self.index.ready = True
+        except Exception as e:
+            logging.error(f"An error occurred while loading the local vector index, using Cassandra: {str(e)}")
+
+    def query_similar(self, value, threshold=0.9, top_k=100, neighbours=3):
+        if self.index.ready:
+            try:
+                result = self.batcher.submit((value, threshold, top_k, neighbours)).result()
+                LOCAL_INDEX_QUERIES_TOTAL.inc(tier='local')
+                return result
+            except Exception as e:
+                logging.error(f"An error occurred while querying the local vector index: {str(e)}")
+        LOCAL_INDEX_QUERIES_TOTAL.inc(tier='cassandra')
+        return self.database.query_similar(value, threshold=threshold, top_k=top_k, neighbours=neighbours)
+
+    def _query_batch(self, queries):
+        # Queries of the same worker share their parameters, group them anyway
+        groups = {}
+        for position, (value, *parameters) in enumerate(queries):
+            groups.setdefault(tuple(parameters), []).append((position, value))
+        results = [None] * len(queries)
+        for (threshold, top_k, neighbours), group in groups.items():
+            answers = self.index.query_similar_many([value for _, value in group], threshold, top_k, neighbours)
+            for (position, _), answer in zip(group, answers):
+                results[position] = answer
+        return results
+
+    def insert_data(self, fields, values):
+        written = self.database.insert_data(fields, values)
+        if written:
+            self._index(fields, values)
+        return written
+
+    def insert_data_async(self, fields, values):
+        future = self.database.insert_data_async(fields, values)
+        future.add_callback(self._on_written, fields, values)
+        return future
+
+    def _on_written(self, _, fields, values):
+        try:
+            self.indexer.submit(self._index, fields, values)
+        except RuntimeError:
+            # The interpreter is shutting down
+            pass
+
+    def _index(self, fields, values):
+        row = dict(zip(fields, values))
+        if row.get('alert_body_vector') is not None:
+            self.index.add(row['id'], row['alert_body_vector'], row.get('evaluation'), row.get('ti_signature'))
@@ -0,0 +1,167 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from SocAI.models.threat_intelligence.threat_intelligence_system import ThreatIntelligenceSystem
+from SocAI.utils.metrics import registry
+
+THREAT_INTELLIGENCE_CACHE_TOTAL = registry.counter('socai_threat_intelligence_cache_total',
+                                                   'Threat intelligence cache lookups, by result.', ('result',))
+
+
+class CachedThreatIntelligence(ThreatIntelligenceSystem):
+    """
+    Caches the lookups of any ThreatIntelligenceSystem.
+
+    Entities found in the threat intelligence platform are kept for `hit_ttl` seconds and unknown entities for
+    `miss_ttl` seconds in a bounded LRU. Concurrent lookups of the same entity are coalesced into a single call to
+    the backend. Lookups that fail are never cached. With `persistent_path` the entries are also written to a
+    SQLite database, which survives restarts and is shared by every process using the same file.
+    """
+
+    def __init__(self, backend: ThreatIntelligenceSystem, max_entries=10000, hit_ttl=3600, miss_ttl=600,
+                 persistent_path=None):
+        super().__init__()
+        self.backend = backend
+        self.max_entries = max_entries
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.persistent_path = persistent_path
+
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'persistent_hits': 0, 'coalesced': 0}
+
+        self._local = threading.local()
+        if persistent_path:
+            self._create_table()
+
+    def check_entity(self, entity_type, entity_value):
+        key = (entity_type, entity_value)
+
+        with self.lock:
+            found, result = self._get(key)
+            if found:
+                self.counters['hits'] += 1
+                THREAT_INTELLIGENCE_CACHE_TOTAL.inc(result='hits')
+                return self._copy(result)
+
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+            else:
+                self.counters['coalesced'] += 1
+                THREAT_INTELLIGENCE_CACHE_TOTAL.inc(result='coalesced')
+
+        if not owner:
+            return self._copy(future.result())
+
+        try:
+            found, result, expires_at = self._get_persistent(key)
+            if found:
+                self._increment('persistent_hits')
+            else:
+                self._increment('misses')
+                result = self.backend.check_entity(entity_type, entity_value)
+                expires_at = time.time() + self._ttl(result)
+                self._set_persistent(key, result, expires_at)
+
+            with self.lock:
+                self._set(key, result, expires_at)
+            future.set_result(result)
+            return self._copy(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def stats(self):
+        """Return the cache counters and the number of entries held in memory."""
+        with self.lock:
+            return {**self.counters, 'size': len(self.entries)}
+
+    def _increment(self, counter):
+        THREAT_INTELLIGENCE_CACHE_TOTAL.inc(result=counter)
+        with self.lock:
+            self.counters[counter] += 1
+
+    @staticmethod
+    def _copy(result):
+        # Callers may modify the result, the cached one must stay untouched
+        return dict(result) if result else result
+
+    def _ttl(self, result):
+        return self.hit_ttl if result else self.miss_ttl
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        result, expires_at = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, result
+
+    def _set(self, key, result, expires_at):
+        self.entries[key] = (result, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.persistent_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_table(self):
+        try:
+            with self._connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS threat_intelligence_cache (
+                        entity_type TEXT,
+                        entity_value TEXT,
+                        result TEXT,
+                        expires_at REAL,
+                        PRIMARY KEY (entity_type, entity_value)
+                    )
+                ''')
+        except sqlite3.Error as e:
+            raise ValueError(f"Error creating the threat intelligence cache table") from e
+
+    def _get_persistent(self, key):
+        if not self.persistent_path:
+            return False, None, None
+        try:
+            row = self._connection().execute(
+                "SELECT result, expires_at FROM threat_intelligence_cache "
+                "WHERE entity_type = ? AND entity_value = ? AND expires_at >= ?", (*key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Error reading the threat intelligence cache: {str(e)}")
+            return False, None, None
+        if row is None:
+            return False, None, None
+        return True, json.loads(row[0]), row[1]
+
+    def _set_persistent(self, key, result, expires_at):
+        if not self.persistent_path:
+            return
+        try:
+            with self._connection() as conn:
+                conn.execute("INSERT OR REPLACE INTO threat_intelligence_cache VALUES (?, ?, ?, ?)",
+                             (*key, json.dumps(result), expires_at))
+        except sqlite3.Error as e:
+            logging.error(f"Error writing the threat intelligence cache: {str(e)}")
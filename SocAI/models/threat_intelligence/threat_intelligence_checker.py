@@ -1,16 +1,51 @@
 import logging
-from SocAI.models.threat_intelligence.threat_intelligence_system import ThreatIntelligenceSystem
+from concurrent.futures import ThreadPoolExecutor
+
+from SocAI.models.threat_intelligence.threat_intelligence_system import ThreatIntelligenceSystem, \
+    ThreatIntelligenceUnavailableError
+
+
+# Kinds of extracted entities looked up by default, private IPs are never worth a lookup
+DEFAULT_ENTITY_TYPES = ('ip', 'domain', 'email')
+# Reputation reported for an entity whose lookup failed, e.g. during an outage of the platform
+UNKNOWN_REPUTATION = 'Unknown (lookup failed)'
 
 
 class ThreatIntelligenceChecker:
-    def __init__(self, threat_intelligence_system: ThreatIntelligenceSystem):
+    def __init__(self, threat_intelligence_system: ThreatIntelligenceSystem, max_concurrency=8,
+                 entity_types=DEFAULT_ENTITY_TYPES):
         self.threat_intelligence_system = threat_intelligence_system
+        self.entity_types = entity_types
+        # Shared by every alert, bounds the number of lookups in flight at the same time
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='threat-intelligence')
 
     def check_in_threat_intelligence(self, entities):
-        blacklist = []
-        for entity_type, entity_values in entities.items():
-            for entity in entity_values:
-                result = self.threat_intelligence_system.check_entity(entity_type, entity)
-                if result:
-                    blacklist.append(result)
-        return blacklist
+        # The same entity often appears several times in an alert, look it up once
+        lookups = list(dict.fromkeys((entity_type, entity)
+                                     for entity_type, entity_values in entities.items()
+                                     if entity_type in self.entity_types
+                                     for entity in entity_values))
+
+        results = self.executor.map(lambda lookup: self._check_entity(*lookup), lookups)
+        return [result for result in results if result]
+
+    @staticmethod
+    def signature(results):
+        """
+        Summarize the results of an alert as the sorted entity types and reputations that were found, so the
+        results of alerts involving different entities can be compared. None when a lookup failed, the results
+        are then incomplete and match no other alert.
+        """
+        if any(result['reputation'] == UNKNOWN_REPUTATION for result in results):
+            return None
+        findings = {f"{entity_type}:{result['reputation']}"
+                    for result in results
+                    for entity_type in result if entity_type not in ('reputation', 'last_report', 'tags')}
+        return ','.join(sorted(findings))
+
+    def _check_entity(self, entity_type, entity):
+        try:
+            return self.threat_intelligence_system.check_entity(entity_type, entity)
+        except ThreatIntelligenceUnavailableError as e:
+            logging.error(f"The {entity_type} {entity} could not be checked: {e}")
+            return {entity_type: entity, 'reputation': UNKNOWN_REPUTATION}
@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
 
 
+class ThreatIntelligenceUnavailableError(Exception):
+    """The threat intelligence system could not answer, as opposed to not knowing the entity."""
+    pass
+
+
 class ThreatIntelligenceSystem(ABC):
     @abstractmethod
     def check_entity(self, entity_type, entity_value):
@@ -1,14 +1,25 @@
 import logging
 import requests
-from SocAI.models.threat_intelligence.threat_intelligence_system import ThreatIntelligenceSystem
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from SocAI.models.threat_intelligence.threat_intelligence_system import ThreatIntelligenceSystem, \
+    ThreatIntelligenceUnavailableError
+from SocAI.utils.metrics import registry
+
+THREAT_INTELLIGENCE_REQUESTS_TOTAL = registry.counter('socai_threat_intelligence_requests_total',
+                                                      'Requests to ThreatWinds, by outcome.', ('outcome',))
 
 
 class ThreatWinds(ThreatIntelligenceSystem):
-    def __init__(self, api_key, api_secret):
+    def __init__(self, api_key, api_secret, base_url="https://intelligence.threatwinds.com/api/search/v1/entity",
+                 pool_size=16, timeout=(3.05, 10), retries=2):
         super().__init__()
-        self.base_url = "https://intelligence.threatwinds.com/api/search/v1/entity"
+        self.base_url = base_url
         self.api_key = api_key
         self.api_secret = api_secret
+        self.timeout = timeout
+        self.session = self._create_session(pool_size, retries)
         self.scale_reputation = {-3: 'Critical',
                                  -2: 'Bad',
                                  -1: 'Poor',
@@ -17,6 +28,26 @@ class ThreatWinds(ThreatIntelligenceSystem):
                                  2: 'Good',
                                  3: 'Great'}
 
+    @staticmethod
+    def _create_session(pool_size, retries):
+        """
+        Create the session shared by every lookup, so connections are kept alive and reused between threads.
+        """
+        retry = Retry(total=retries,
+                      backoff_factor=0.3,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({'POST'}),
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
     def check_entity(self, entity_type, entity_value):
         url = self.base_url
         headers = {
@@ -27,22 +58,27 @@ class ThreatWinds(ThreatIntelligenceSystem):
         }
         data = {"type": entity_type, "value": entity_value}
         try:
-            with requests.Session() as session:
-                response = session.post(url, json=data, headers=headers)
-
-                if response.status_code == 200:
-                    entity_information = response.json()
-                    data = {entity_type: entity_value,
-                            'reputation': self.scale_reputation[entity_information['reputation']],
-                            'last_report': entity_information['@timestamp'],
-                            }
-                    if 'tags' in entity_information:
-                        data['tags'] = entity_information['tags']
-
-                    return data
-                elif response.status_code == 404:
-                    return
-                else:
-                    logging.error(f"Request failed with status code: {response.status_code}")
+            response = self.session.post(url, json=data, headers=headers, timeout=self.timeout)
+
+            if response.status_code == 200:
+                entity_information = response.json()
+                data = {entity_type: entity_value,
+                        'reputation': self.scale_reputation[entity_information['reputation']],
+                        'last_report': entity_information['@timestamp'],
+                        }
+                if 'tags' in entity_information:
+                    data['tags'] = entity_information['tags']
+
+                THREAT_INTELLIGENCE_REQUESTS_TOTAL.inc(outcome='found')
+                return data
+            elif response.status_code == 404:
+                THREAT_INTELLIGENCE_REQUESTS_TOTAL.inc(outcome='not_found')
+                return
+            else:
+                THREAT_INTELLIGENCE_REQUESTS_TOTAL.inc(outcome='error')
+                logging.error(f"Request failed with status code: {response.status_code}")
+                raise ThreatIntelligenceUnavailableError(f"ThreatWinds answered {response.status_code}")
         except requests.exceptions.RequestException as e:
+            THREAT_INTELLIGENCE_REQUESTS_TOTAL.inc(outcome='error')
             logging.error(f"An error occurred while making a POST request: {e}")
+            raise ThreatIntelligenceUnavailableError(str(e)) from e
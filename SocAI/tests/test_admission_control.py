@@ -0,0 +1,89 @@
+import pytest
+
+from SocAI.utils.admission_control import AdmissionController
+from SocAI.utils.priority import severity_priority
+from SocAI.utils.queue_manager import QueueSystem
+
+
+class FakeQueue:
+    def __init__(self, depth=0):
+        self.current_depth = depth
+        self.counts = 0
+
+    def depth(self):
+        self.counts += 1
+        return self.current_depth
+
+
+def controller(queue, high=10, low=5):
+    return AdmissionController(queue, high_watermark=high, low_watermark=low, refresh_interval=0)
+
+
+def test_admits_below_the_high_watermark():
+    assert controller(FakeQueue(9)).admit()
+
+
+def test_rejects_a_batch_that_would_cross_the_high_watermark():
+    admission = controller(FakeQueue(8))
+
+    assert not admission.admit(3)
+    assert admission.saturated
+
+
+def test_batch_larger_than_the_high_watermark_is_admitted_into_an_empty_queue():
+    queue = FakeQueue(0)
+    admission = controller(queue)
+    assert admission.admit(500)
+
+    queue.current_depth = 500
+    assert not admission.admit(500)
+
+
+def test_keeps_rejecting_until_the_low_watermark():
+    queue = FakeQueue(10)
+    admission = controller(queue)
+    assert not admission.admit()
+
+    queue.current_depth = 7
+    assert not admission.admit()
+
+    queue.current_depth = 4
+    assert admission.admit()
+
+
+def test_counts_the_admitted_alerts_until_the_next_count():
+    queue = FakeQueue(0)
+    admission = AdmissionController(queue, high_watermark=10, low_watermark=5, refresh_interval=60)
+
+    assert admission.admit(6)
+    assert not admission.admit(6)
+    assert queue.counts == 1
+
+
+def test_zero_high_watermark_disables_admission_control():
+    queue = FakeQueue(1000)
+
+    assert controller(queue, high=0, low=0).admit()
+    assert queue.counts == 0
+
+
+@pytest.mark.parametrize('alert, priority', [
+    ('{"severity": "Critical"}', 3),
+    ('{"rule": {"level": "high"}}', 2),
+    ('{"severity": 12}', 0),
+    ('plain text alert', 0),
+    ('["critical"]', 0),
+])
+def test_severity_priority(alert, priority):
+    assert severity_priority(alert) == priority
+
+
+def test_higher_priorities_are_dequeued_first(tmp_path):
+    queue = QueueSystem(str(tmp_path / 'queue.db'), priority_function=severity_priority)
+    try:
+        queue.enqueue_many(['{"severity": "low"}', '{"severity": "critical"}', '{"severity": "medium"}'])
+
+        assert [row[1] for row in queue.dequeue(limit=3)] == [
+            '{"severity": "critical"}', '{"severity": "medium"}', '{"severity": "low"}']
+    finally:
+        queue.close()
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')
+pytest.importorskip('uvicorn')
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from SocAI.utils.admission_control import AdmissionController
+from SocAI.utils.queue_manager import QueueSystem
+from SocAI.utils.results import ResultBuffer
+
+NDJSON = {'Content-Type': 'application/x-ndjson'}
+
+
+@pytest.fixture(scope='module')
+def api(tmp_path_factory):
+    # The module creates queue.db in the working directory when it is imported
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('api'))
+    try:
+        from SocAI import main
+    finally:
+        os.chdir(cwd)
+    return main
+
+
+@pytest.fixture
+def queue(api, tmp_path, monkeypatch):
+    queue = QueueSystem(str(tmp_path / 'queue.db'))
+    monkeypatch.setattr(api, 'queue', queue)
+    monkeypatch.setattr(api, 'admission_controller',
+                        AdmissionController(queue, high_watermark=10000, low_watermark=8000, refresh_interval=0))
+    monkeypatch.setattr(api, 'result_buffer', ResultBuffer())
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def client(api, queue):
+    return TestClient(api.fastapi_instance)
+
+
+class StreamedRequest:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def read_json_array(api, body, chunk_size):
+    async def read():
+        request = StreamedRequest([body[i:i + chunk_size] for i in range(0, len(body), chunk_size)])
+        return [alert async for alert in api._read_json_array(request)]
+
+    return asyncio.run(read())
+
+
+def test_batch_reports_accepted_and_duplicate_alerts(client):
+    response = client.post('/process/batch', content=json.dumps(['first', {'rule': 'second'}, 'first']))
+
+    assert response.status_code == 200
+    summary = response.json()
+    assert (summary['accepted'], summary['duplicates'], summary['invalid']) == (2, 1, 0)
+    assert [item['id'] for item in summary['items']] == [
+        QueueSystem.key('first'), QueueSystem.key('{"rule": "second"}'), QueueSystem.key('first')]
+
+
+def test_ndjson_batch_reports_invalid_lines(client, queue):
+    response = client.post('/process/batch', content='"first"\nnot json\n{"rule": "second"}\n', headers=NDJSON)
+
+    summary = response.json()
+    assert (summary['accepted'], summary['invalid']) == (2, 1)
+    assert summary['items'][1] == {'id': None, 'status': 'invalid'}
+    # Documents keep their raw line, so their key matches the one /process computes
+    assert summary['items'][2]['id'] == QueueSystem.key('{"rule": "second"}')
+    assert queue.depth() == 2
+
+
+def test_alert_has_the_same_id_on_every_path(client):
+    alert = '{"rule":"ssh", "src":  "8.8.8.8"}'
+
+    item_id = client.post('/process', params={'data': alert}).json()['id']
+    ndjson = client.post('/process/batch', content=alert + '\n', headers=NDJSON).json()
+    array = client.post('/process/batch', content=f'[ {alert} ]').json()
+
+    assert ndjson['items'] == array['items'] == [{'id': item_id, 'status': 'duplicate'}]
+
+
+def test_malformed_batch_is_rejected(client):
+    assert client.post('/process/batch', content='["first", ').status_code == 400
+    assert client.post('/process/batch', content='{"rule": "first"}').status_code == 400
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1000])
+def test_json_array_is_parsed_across_chunks(api, chunk_size):
+    alerts = ['é first', {'rule': {'level': 12}}, 42, 'last']
+    body = json.dumps(alerts, ensure_ascii=False).encode()
+
+    assert read_json_array(api, body, chunk_size) == ['é first', '{"rule": {"level": 12}}', '42', 'last']
+
+
+@pytest.mark.parametrize('body', [b'', b'[', b'["first"', b'["first", }', b'\xff'])
+def test_invalid_json_array_raises(api, body):
+    with pytest.raises(HTTPException):
+        read_json_array(api, body, 1)
+
+
+def test_process_returns_503_when_the_queue_is_full(api, client, queue, monkeypatch):
+    monkeypatch.setattr(api, 'admission_controller',
+                        AdmissionController(queue, high_watermark=1, low_watermark=1, retry_after=7,
+                                            refresh_interval=0))
+    assert client.post('/process', params={'data': 'first'}).status_code == 200
+
+    response = client.post('/process', params={'data': 'second'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_process_returns_500_when_the_enqueue_fails(client, queue, monkeypatch):
+    def fail(data):
+        raise ValueError("Error enqueuing data")
+
+    monkeypatch.setattr(queue, 'enqueue', fail)
+
+    assert client.post('/process', params={'data': 'first'}).status_code == 500
+
+
+def test_batch_is_admitted_chunk_by_chunk(api, client, queue, monkeypatch):
+    monkeypatch.setattr(api, 'BATCH_CHUNK_SIZE', 2)
+    monkeypatch.setattr(api, 'admission_controller',
+                        AdmissionController(queue, high_watermark=3, low_watermark=1, refresh_interval=0))
+
+    response = client.post('/process/batch', content=json.dumps(['first', 'second', 'third', 'fourth']))
+
+    # The first chunk is queued, the second one would cross the high watermark
+    assert response.status_code == 503
+    assert response.json()['accepted'] == 2
+    assert queue.depth() == 2
+
+
+def test_ready_waits_for_every_backend(api, client, monkeypatch):
+    monkeypatch.setattr(api, 'readiness', {'queue': True, 'worker': False})
+    assert client.get('/ready').status_code == 503
+    assert client.get('/ping').status_code == 200
+
+    monkeypatch.setitem(api.readiness, 'worker', True)
+    assert client.get('/ready').status_code == 200
+
+
+class StartedWorker:
+    def __init__(self):
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+
+def test_worker_start_is_retried(api, monkeypatch):
+    worker = StartedWorker()
+    attempts = iter([ConnectionError('Cassandra is down'), worker])
+
+    def create_queue_worker():
+        outcome = next(attempts)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(api, 'create_queue_worker', create_queue_worker)
+    monkeypatch.setattr(api, 'WORKER_START_RETRY_DELAY', 0)
+    monkeypatch.setattr(api, 'readiness', {'worker': False})
+    application = api.Application()
+
+    application.start_worker()
+
+    assert application.queue_worker is worker and worker.started
+    assert api.readiness['worker']
+
+
+def test_worker_start_gives_up_without_an_api_key(api, monkeypatch):
+    def create_queue_worker():
+        raise api.NoAPIKeyFoundError
+
+    monkeypatch.setattr(api, 'create_queue_worker', create_queue_worker)
+    application = api.Application()
+
+    application.start_worker()
+
+    assert application.queue_worker is None
+
+
+class FakeEngine:
+    def __init__(self, session):
+        self.session = session
+        self.keyspace = 'socai'
+        self.disconnected = False
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class FailingSession:
+    def execute(self, statement, parameters=None):
+        raise RuntimeError('keyspace not found')
+
+
+@pytest.mark.parametrize('session, error', [(None, ConnectionError), (FailingSession(), RuntimeError)])
+def test_worker_does_not_start_without_the_database(api, monkeypatch, session, error):
+    for module in ('backoff', 'cassandra', 'openai', 'regex', 'tiktoken'):
+        pytest.importorskip(module)
+    engine = FakeEngine(session)
+    monkeypatch.setenv('OPENAI_API_KEY', 'key')
+    monkeypatch.setattr(api, 'create_database_engine', lambda: engine)
+    monkeypatch.setattr(api, 'readiness', {'database': False})
+
+    with pytest.raises(error):
+        api.create_queue_worker()
+
+    assert not api.readiness['database']
+    assert engine.disconnected == (session is not None)
+
+
+class FakeProcess:
+    def __init__(self, pid, alive=True, exitcode=None):
+        self.pid = pid
+        self.alive = alive
+        self.exitcode = exitcode
+
+    def is_alive(self):
+        return self.alive
+
+
+class FakeEvent:
+    def __init__(self, ready):
+        self.ready = ready
+
+    def is_set(self):
+        return self.ready
+
+
+def supervised_application(api, monkeypatch, tmp_path, processes):
+    application = api.Application(worker_processes=len(processes))
+    application.metrics_directory = str(tmp_path)
+    application.processes = processes
+    spawned = []
+    monkeypatch.setattr(application, '_spawn_worker_process',
+                        lambda: spawned.append(FakeProcess(100 + len(spawned))) or (spawned[-1], FakeEvent(False)))
+    monkeypatch.setattr(api, 'readiness', {'queue': True, 'worker': False, 'database': False})
+    return application, spawned
+
+
+def test_crashed_worker_processes_are_restarted(api, monkeypatch, tmp_path):
+    (tmp_path / '2.json').write_text('{}')
+    application, spawned = supervised_application(api, monkeypatch, tmp_path, [
+        (FakeProcess(1), FakeEvent(True)), (FakeProcess(2, alive=False, exitcode=-9), FakeEvent(True))])
+
+    application._supervise_worker_processes()
+
+    assert [process.pid for process, _ in application.processes] == [1, 100]
+    assert not (tmp_path / '2.json').exists()
+    assert api.readiness == {'queue': True, 'worker': False, 'database': False}
+
+
+def test_misconfigured_worker_processes_are_not_restarted(api, monkeypatch, tmp_path):
+    application, spawned = supervised_application(api, monkeypatch, tmp_path, [
+        (FakeProcess(1, alive=False, exitcode=api.WORKER_CONFIGURATION_ERROR), FakeEvent(False))])
+
+    application._supervise_worker_processes()
+
+    assert spawned == []
+
+
+def test_ready_once_every_worker_process_is(api, monkeypatch, tmp_path):
+    application, _ = supervised_application(api, monkeypatch, tmp_path, [
+        (FakeProcess(1), FakeEvent(True)), (FakeProcess(2), FakeEvent(True))])
+
+    application._supervise_worker_processes()
+
+    assert all(api.readiness.values())
+
+
+RESULT = {'classification': 'standard alert', 'reasoning': [], 'next_steps': [], 'verdict_source': 'llm'}
+
+
+def test_results_are_paged_by_cursor(client, queue):
+    item_ids = [queue.enqueue(alert) for alert in ('first', 'second', 'third')]
+    for item_id in item_ids:
+        queue.complete(item_id, RESULT)
+
+    page = client.get('/results', params={'cursor': 0, 'limit': 2}).json()
+    last = client.get('/results', params={'cursor': page['cursor']}).json()
+
+    assert [item['id'] for item in page['results']] == item_ids[:2]
+    assert [item['id'] for item in last['results']] == item_ids[2:]
+    assert client.get('/results', params={'cursor': last['cursor']}).json() == {'results': [], 'cursor': 3}
+
+
+def test_results_are_served_from_the_buffer(api, client, queue):
+    api.result_buffer.load([{'cursor': 1, 'id': 'buffered', **RESULT}], floor=0)
+
+    assert [item['id'] for item in client.get('/results').json()['results']] == ['buffered']
+    assert client.get('/results/buffered').json()['id'] == 'buffered'
+
+
+def test_result_of_an_alert_follows_its_processing(client, queue):
+    item_id = queue.enqueue('alert')
+
+    assert client.get(f'/results/{item_id}').status_code == 202
+    queue.complete(item_id, RESULT)
+    assert client.get(f'/results/{item_id}').json()['classification'] == 'standard alert'
+    assert client.get('/results/unknown').status_code == 404
@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from SocAI.models.classifier.batching_classifier import BatchingClassifier
+from SocAI.models.classifier.classifier_backend import ClassifierBackend
+
+
+def verdict(classification):
+    return {'classification': classification, 'reasoning': [], 'next_steps': []}
+
+
+class FakeBatchBackend(ClassifierBackend):
+    """Classifies every prompt as itself, its batch answer is invalid for the prompts in `invalid`."""
+
+    def __init__(self, invalid=(), max_batch_tokens=1000):
+        self.invalid = invalid
+        self._max_batch_tokens = max_batch_tokens
+        self.single = []
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def classify(self, prompt):
+        with self.lock:
+            self.single.append(prompt)
+        return verdict(prompt)
+
+    def classify_many(self, prompts):
+        with self.lock:
+            self.batches.append(sorted(prompts.values()))
+        return {alert_id: ValueError('missing') if prompt in self.invalid else verdict(prompt)
+                for alert_id, prompt in prompts.items()}
+
+    def batch_tokens(self, prompt, max_tokens=None):
+        return len(prompt)
+
+    def max_batch_tokens(self):
+        return self._max_batch_tokens
+
+
+def classify_concurrently(classifier, prompts):
+    with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+        return list(executor.map(classifier.classify, prompts))
+
+
+def test_concurrent_prompts_share_a_request():
+    backend = FakeBatchBackend()
+    classifier = BatchingClassifier(backend, max_batch_size=4, max_latency=1)
+
+    verdicts = classify_concurrently(classifier, ['first', 'second', 'third', 'fourth'])
+
+    assert [verdict['classification'] for verdict in verdicts] == ['first', 'second', 'third', 'fourth']
+    assert backend.batches == [['first', 'fourth', 'second', 'third']]
+    assert backend.single == []
+
+
+def test_invalid_batch_answer_is_classified_alone():
+    backend = FakeBatchBackend(invalid=('second',))
+    classifier = BatchingClassifier(backend, max_batch_size=2, max_latency=1)
+
+    verdicts = classify_concurrently(classifier, ['first', 'second'])
+
+    assert [verdict['classification'] for verdict in verdicts] == ['first', 'second']
+    assert backend.single == ['second']
+
+
+def test_large_prompt_is_classified_alone():
+    backend = FakeBatchBackend()
+    classifier = BatchingClassifier(backend, max_prompt_tokens=5)
+
+    assert classifier.classify('a long prompt')['classification'] == 'a long prompt'
+    assert backend.single == ['a long prompt']
+    assert backend.batches == []
+
+
+def test_lone_prompt_is_not_sent_as_a_batch():
+    backend = FakeBatchBackend()
+    classifier = BatchingClassifier(backend, max_latency=0)
+
+    classifier.classify('alone')
+
+    assert backend.single == ['alone']
+    assert backend.batches == []
+
+
+def test_batches_fit_in_the_context_of_the_model():
+    backend = FakeBatchBackend(max_batch_tokens=10)
+    classifier = BatchingClassifier(backend, max_batch_size=4, max_latency=1)
+
+    classify_concurrently(classifier, ['aaaa', 'bbbb', 'cccc', 'dddd'])
+
+    assert all(sum(map(len, batch)) <= 10 for batch in backend.batches)
+    assert sorted(backend.single + [prompt for batch in backend.batches for prompt in batch]) == \
+        ['aaaa', 'bbbb', 'cccc', 'dddd']
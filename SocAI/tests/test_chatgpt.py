@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+for module in ('backoff', 'openai', 'regex', 'tiktoken'):
+    pytest.importorskip(module)
+
+from SocAI.models.chatgpt import chatgpt
+from SocAI.models.chatgpt.chatgpt import ChatGPTResponseParsingError, batch_question, count_tokens, get_encoding, \
+    parse_batch_response, truncated_string
+
+
+def no_encoding(model):
+    raise AssertionError('The string should not be tokenized')
+
+
+def test_encoding_is_loaded_once():
+    assert get_encoding('gpt-3.5-turbo') is get_encoding('gpt-3.5-turbo')
+
+
+def test_short_string_is_not_tokenized(monkeypatch):
+    monkeypatch.setattr(chatgpt, 'get_encoding', no_encoding)
+
+    assert truncated_string('short alert', 100) == 'short alert'
+
+
+def test_string_within_the_budget_is_kept():
+    text = 'word ' * 40
+
+    assert truncated_string(text, 100) == text
+
+
+def test_long_string_keeps_its_head():
+    text = 'word ' * 1000
+
+    truncated = truncated_string(text, 50)
+
+    assert text.startswith(truncated)
+    assert count_tokens(truncated) <= 50
+
+
+VERDICT = {'classification': 'standard alert', 'reasoning': ['Routine.'], 'next_steps': []}
+
+
+def test_batch_response_is_split_by_alert():
+    response = 'Here you go: {"alert-1": %s, "alert-2": {"classification": "standard alert"}}' % json.dumps(VERDICT)
+
+    verdicts = parse_batch_response(response, ['alert-1', 'alert-2', 'alert-3'])
+
+    assert verdicts['alert-1'] == VERDICT
+    assert isinstance(verdicts['alert-2'], ChatGPTResponseParsingError)
+    assert isinstance(verdicts['alert-3'], ChatGPTResponseParsingError)
+
+
+def test_unparsable_batch_response_fails_every_alert():
+    verdicts = parse_batch_response('I cannot answer that.', ['alert-1', 'alert-2'])
+
+    assert all(isinstance(verdict, ChatGPTResponseParsingError) for verdict in verdicts.values())
+    assert list(verdicts) == ['alert-1', 'alert-2']
+
+
+def test_batch_question_has_a_section_per_alert():
+    assert batch_question({'alert-1': 'first', 'alert-2': 'second'}) == \
+        '### Alert alert-1\nfirst\n\n### Alert alert-2\nsecond'
+
+
+def test_count_tokens_stops_past_the_limit():
+    assert count_tokens('word ' * 1000, limit=10) == 11
+    assert count_tokens('word ' * 5, limit=10) == count_tokens('word ' * 5)
@@ -0,0 +1,45 @@
+import pytest
+
+from SocAI.models.classifier.classifier_backend import FakeClassifierBackend
+from SocAI.models.classifier.tiered_classifier import TieredClassifierBackend
+from SocAI.models.classifier.transformers_classifier import TransformersClassifierBackend
+
+
+class RecordingClassifier(FakeClassifierBackend):
+    def __init__(self, classification='possible incident', confidence=1.0):
+        super().__init__(classification, confidence)
+        self.prompts = []
+
+    def classify(self, prompt):
+        self.prompts.append(prompt)
+        return super().classify(prompt)
+
+
+def test_confident_standard_alerts_stay_local():
+    remote = RecordingClassifier()
+    tiered = TieredClassifierBackend(FakeClassifierBackend('standard alert', confidence=0.95), remote)
+
+    assert tiered.classify('alert')['classification'] == 'standard alert'
+    assert remote.prompts == []
+    assert tiered.stats() == {'local': 1, 'escalated': 0}
+
+
+@pytest.mark.parametrize('classification, confidence', [('standard alert', 0.5), ('possible incident', 1.0)])
+def test_other_verdicts_escalate(classification, confidence):
+    remote = RecordingClassifier()
+    tiered = TieredClassifierBackend(FakeClassifierBackend(classification, confidence), remote)
+
+    assert tiered.classify('alert')['classification'] == 'possible incident'
+    assert remote.prompts == ['alert']
+    assert tiered.stats() == {'local': 0, 'escalated': 1}
+
+
+def test_local_model_verdict_maps_its_labels():
+    backend = TransformersClassifierBackend()
+    backend._pipeline = lambda prompt, candidate_labels, hypothesis_template: {
+        'labels': ['a false positive', 'a security incident'], 'scores': [0.8, 0.2]}
+
+    verdict = backend.classify('alert')
+
+    assert (verdict['classification'], verdict['confidence']) == ('possible false positive', 0.8)
+    assert verdict['next_steps'] == []
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from SocAI.utils.compactor import AlertCompactor, AlertSchema, collapse_templated_lines, load_schemas, project, \
+    summarize_threat_intelligence
+from SocAI.utils.normalizer import AlertNormalizer
+
+WAZUH_ALERT = {'timestamp': '2024-05-01T10:00:00', 'rule': {'description': 'sshd: authentication failed', 'level': 5,
+                                                            'id': '5716', 'firedtimes': 12},
+               'agent': {'name': 'web-01', 'ip': '', 'id': '004'}, 'decoder': {'name': 'sshd'},
+               'data': {'srcip': '8.8.8.8', 'srcuser': None, 'srcport': '51234'}, 'manager': {'name': 'wazuh'}}
+
+
+def test_known_schema_keeps_its_fields_only():
+    result = AlertCompactor().compact(json.dumps(WAZUH_ALERT))
+
+    assert result.schema == 'wazuh'
+    assert json.loads(result.text) == {'timestamp': '2024-05-01T10:00:00',
+                                       'rule': {'description': 'sshd: authentication failed', 'level': 5},
+                                       'agent': {'name': 'web-01'}, 'data': {'srcip': '8.8.8.8'}}
+
+
+def test_unknown_schema_only_drops_empty_fields():
+    result = AlertCompactor().compact(json.dumps({'source': 'edr', 'host': '', 'tags': [], 'details': {'pid': None},
+                                                  'severity': 0}))
+
+    assert result.schema is None
+    assert json.loads(result.text) == {'source': 'edr', 'severity': 0}
+
+
+def test_project_follows_the_dotted_paths():
+    document = {'a': {'b': 1, 'c': 2}, 'd': 3}
+
+    assert project(document, ('a.b', 'd', 'a.missing', 'd.e')) == {'a': {'b': 1}, 'd': 3}
+
+
+def test_templated_lines_are_collapsed_in_order():
+    text = '\n'.join(['sshd[101]: failed login from 10.0.0.1 port 4000',
+                      'kernel: segfault',
+                      'sshd[102]: failed login from 10.0.0.1 port 4001',
+                      'sshd[103]: failed login from 10.0.0.2 port 4002',
+                      'sshd[104]: failed login from 10.0.0.1 port 4003'])
+
+    assert collapse_templated_lines(text) == '\n'.join(['sshd[101]: failed login from 10.0.0.1 port 4000 '
+                                                        '[3 similar lines]',
+                                                        'kernel: segfault',
+                                                        'sshd[103]: failed login from 10.0.0.2 port 4002'])
+
+
+def test_text_alert_lines_are_collapsed_unless_disabled():
+    text = 'retry 1 failed\nretry 2 failed'
+
+    assert AlertCompactor().compact(text).text == 'retry 1 failed [2 similar lines]'
+    assert AlertCompactor(collapse_lines=False).compact(text).text == text
+
+
+def test_multi_line_values_are_collapsed():
+    alert = {'message': 'worker 1 died\nworker 2 died'}
+
+    assert json.loads(AlertCompactor().compact(json.dumps(alert)).text) == {'message': 'worker 1 died [2 similar lines]'}
+
+
+def test_compacted_alert_is_normalized():
+    result = AlertCompactor(normalizer=AlertNormalizer()).compact(json.dumps(WAZUH_ALERT))
+
+    assert '"timestamp":"<TIMESTAMP>"' in result.text
+    assert 'firedtimes' not in result.text
+
+
+def test_non_ascii_text_survives_compaction():
+    result = AlertCompactor(normalizer=AlertNormalizer()).compact('{"message": "Connexion refusée pour José"}')
+
+    assert json.loads(result.text) == {'message': 'Connexion refusée pour José'}
+
+
+def test_tokens_are_counted_before_and_after():
+    text = json.dumps(WAZUH_ALERT)
+
+    result = AlertCompactor(token_counter=len).compact(text, original='x' * 1000)
+
+    assert (result.original_tokens, result.compacted_tokens) == (1000, len(result.text))
+    assert AlertCompactor().compact(text).original_tokens is None
+
+
+def test_schemas_are_loaded_from_a_file(tmp_path):
+    path = tmp_path / 'schemas.json'
+    path.write_text(json.dumps({'edr': {'detect': ['sensor'], 'fields': ['sensor', 'process.name']}}))
+
+    assert load_schemas(str(path)) == (AlertSchema('edr', ('sensor',), ('sensor', 'process.name')),)
+
+
+def test_invalid_schemas_file_is_rejected(tmp_path):
+    path = tmp_path / 'schemas.json'
+    path.write_text(json.dumps({'edr': {'detect': ['sensor']}}))
+
+    with pytest.raises(ValueError):
+        load_schemas(str(path))
+
+
+def test_threat_intelligence_is_summarized_one_line_per_entity():
+    results = [{'ip': '8.8.8.8', 'reputation': 'Malicious', 'last_report': '2024-05-01T10:00:00', 'tags': ['c2']},
+               {'domain': 'evil.com', 'reputation': 'Suspicious', 'tags': 'phishing'}]
+
+    assert summarize_threat_intelligence(results) == ('- ip 8.8.8.8: reputation Malicious; last reported 2024-05-01; '
+                                                      'tags c2\n'
+                                                      '- domain evil.com: reputation Suspicious; tags phishing')
@@ -0,0 +1,98 @@
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('cassandra')
+
+from SocAI.models.database.cassandradboperations import CassandraDBOperations, Neighbour
+
+SimilarityRow = namedtuple('SimilarityRow', ['id', 'similarity', 'evaluation', 'ti_signature'])
+
+
+class Rows(list):
+    def one(self):
+        return self[0] if self else None
+
+
+class FakeSession:
+    def __init__(self, rows=(), error=None):
+        self.rows = rows
+        self.error = error
+        self.executed = []
+        self.prepared = []
+
+    def prepare(self, query):
+        self.prepared.append(query)
+        return query
+
+    def execute(self, statement, parameters=None):
+        self.executed.append((statement, parameters))
+        if self.error:
+            raise self.error
+        return Rows(self.rows)
+
+
+def database(session):
+    return CassandraDBOperations(SimpleNamespace(session=session, keyspace='socai'), 'alerts')
+
+
+def test_query_similar_counts_the_neighbours_above_the_threshold():
+    session = FakeSession([SimilarityRow('a', 0.91, 'false positive', ''),
+                           SimilarityRow('b', 0.97, 'standard alert', 'ip:Malicious'),
+                           SimilarityRow('c', 0.5, 'standard alert', '')])
+
+    result = database(session).query_similar([0.1, 0.2], threshold=0.9, top_k=10, neighbours=1)
+
+    assert result.count == 2
+    assert result.neighbours == [Neighbour('b', 0.97, 'standard alert', 'ip:Malicious')]
+    assert session.executed[0][1] == ([0.1, 0.2], [0.1, 0.2], 10)
+
+
+def test_query_similar_returns_none_on_error():
+    assert database(FakeSession(error=RuntimeError('timeout'))).query_similar([0.1, 0.2]) is None
+
+
+def test_statements_are_prepared_once():
+    session = FakeSession()
+    operations = database(session)
+
+    operations.insert_data(('id', 'evaluation'), ('a', 'standard alert'))
+    operations.insert_data(('id', 'evaluation'), ('b', 'false positive'))
+
+    assert session.prepared == ["INSERT INTO socai.alerts (id, evaluation) VALUES (?, ?);"]
+
+
+def test_insert_data_async_returns_the_driver_future():
+    future = object()
+    session = FakeSession()
+    session.execute_async = lambda statement, values: future
+
+    assert database(session).insert_data_async(('id',), ('a',)) is future
+
+
+def test_scan_vectors_reads_the_recent_rows_only():
+    session = FakeSession([SimpleNamespace(id='a', evaluation='standard alert', ti_signature='',
+                                           alert_body_vector=[0.1], written_at=2_000_000_000_000_000),
+                           SimpleNamespace(id='b', evaluation='standard alert', ti_signature='',
+                                           alert_body_vector=None, written_at=2_000_000_000_000_000)])
+
+    rows = list(database(session).scan_vectors(since=1_000_000_000, limit=100))
+
+    statement, parameters = session.executed[0]
+    assert statement.query_string.endswith('WHERE stored_at >= %s LIMIT 100;')
+    assert parameters[0].timestamp() == 1_000_000_000
+    assert rows == [('a', 'standard alert', '', [0.1], 2_000_000_000)]
+
+
+def test_table_creation_failure_is_raised():
+    with pytest.raises(RuntimeError):
+        database(FakeSession(error=RuntimeError('keyspace not found'))).create_table()
+
+
+def test_statement_preparation_failure_is_raised():
+    session = FakeSession()
+    session.prepare = lambda query: (_ for _ in ()).throw(RuntimeError('table not found'))
+
+    with pytest.raises(RuntimeError):
+        database(session).prepare_statements(('id',))
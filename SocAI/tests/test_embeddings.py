@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from SocAI.utils.embedings import EmbeddingCache, EmbeddingService, FakeEmbeddingBackend, create_vector
+from SocAI.utils.micro_batcher import MicroBatcher
+
+
+class RecordingBackend(FakeEmbeddingBackend):
+    def __init__(self, dimension=8):
+        super().__init__(dimension)
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+
+class FailingBackend(FakeEmbeddingBackend):
+    def embed_documents(self, texts):
+        raise RuntimeError('embeddings unavailable')
+
+
+def test_vectors_are_cached():
+    backend = RecordingBackend()
+    service = EmbeddingService(backend, max_latency=0)
+
+    first = service.embed('alert')
+    second = service.embed('alert')
+
+    assert second == pytest.approx(first)
+    assert backend.batches == [['alert']]
+
+
+def test_concurrent_texts_share_a_batch():
+    backend = RecordingBackend()
+    service = EmbeddingService(backend, max_batch_size=4, max_latency=1)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        vectors = list(executor.map(service.embed, ['first', 'second', 'first', 'third']))
+
+    # Identical texts of a batch are embedded once
+    assert [sorted(batch) for batch in backend.batches] == [['first', 'second', 'third']]
+    assert vectors[0] == pytest.approx(vectors[2])
+
+
+def test_vectors_survive_in_the_cache_file(tmp_path):
+    path = str(tmp_path / 'embeddings.db')
+    EmbeddingService(RecordingBackend(), EmbeddingCache(path), max_latency=0).embed('alert')
+    backend = RecordingBackend()
+
+    EmbeddingService(backend, EmbeddingCache(path), max_latency=0).embed('alert')
+
+    assert backend.batches == []
+
+
+def test_memory_cache_is_bounded():
+    cache = EmbeddingCache(max_memory_entries=2)
+    for key in ('first', 'second', 'third'):
+        cache.put(key, [1.0])
+
+    assert cache.get('first') is None
+    assert cache.get('third') == [1.0]
+
+
+def test_failed_embedding_returns_no_vector():
+    assert create_vector('alert', EmbeddingService(FailingBackend(), max_latency=0)) is None
+
+
+def test_batcher_splits_batches_by_cost():
+    batches = []
+
+    def handler(items):
+        batches.append(items)
+        return items
+
+    batcher = MicroBatcher(handler, max_batch_size=10, max_latency=0.2, cost_function=len, max_cost=5)
+    futures = [batcher.submit(item) for item in ('abc', 'de', 'fgh', 'i')]
+
+    assert [future.result(5) for future in futures] == ['abc', 'de', 'fgh', 'i']
+    assert batches == [['abc', 'de'], ['fgh', 'i']]
@@ -0,0 +1,52 @@
+import pytest
+
+from SocAI.utils.entity_extractor import default_extractor
+
+
+def test_entities_are_extracted_once():
+    entities = default_extractor.extract('admin@evil.com from 8.8.8.8 and 8.8.8.8 via 10.0.0.1 '
+                                         'http://evil.com/payload 2001:4860:4860::8888')
+
+    assert entities['email'] == ['admin@evil.com']
+    assert entities['ip'] == ['8.8.8.8', '2001:4860:4860::8888']
+    assert entities['private_ip'] == ['10.0.0.1']
+    assert entities['url'] == ['http://evil.com/payload']
+    assert entities['domain'] == ['evil.com']
+
+
+def test_hashes_are_classified_by_length():
+    entities = default_extractor.extract(f"md5 {'a' * 32} sha1 {'b' * 40} sha256 {'c' * 64}")
+
+    assert (entities['md5'], entities['sha1'], entities['sha256']) == (['a' * 32], ['b' * 40], ['c' * 64])
+
+
+@pytest.mark.parametrize('text', ['import os.path', 'svchost.exe started', 'see README.md', 'host.name=web01',
+                                  'event.id 4625', 'self.config.update()', 'version 1.2.3.4.5'])
+def test_identifiers_are_not_domains(text):
+    assert default_extractor.extract(text)['domain'] == []
+
+
+@pytest.mark.parametrize('text, domain', [('visit Mail.Google.COM now', 'Mail.Google.COM'),
+                                          ('dns query a.b.co.uk', 'a.b.co.uk'),
+                                          ('dns query xn--e1afmkfd.xn--p1ai', 'xn--e1afmkfd.xn--p1ai')])
+def test_domains_need_a_known_top_level_domain(text, domain):
+    assert default_extractor.extract(text)['domain'] == [domain]
+
+
+def test_invalid_ips_are_ignored():
+    assert default_extractor.extract('999.1.1.1')['ip'] == []
+
+
+@pytest.mark.parametrize('text', ['cafe:: opened', 'std::string', 'Face::beef()', 'dead::beef::cafe'])
+def test_words_before_a_double_colon_are_not_ips(text):
+    entities = default_extractor.extract(text)
+
+    assert entities['ip'] == entities['private_ip'] == []
+
+
+@pytest.mark.parametrize('text, ip', [('from fe80::1', 'fe80::1'), ('from 2001:db8::', '2001:db8::'),
+                                      ('to ::ffff:8.8.8.8', '::ffff:8.8.8.8')])
+def test_compressed_ipv6_addresses_are_extracted(text, ip):
+    entities = default_extractor.extract(text)
+
+    assert ip in entities['ip'] + entities['private_ip']
@@ -0,0 +1,66 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('cassandra')
+
+from SocAI.benchmarks.fakes.fake_database import FakeResponseFuture, InMemoryCassandraDBOperations
+
+FIELDS = ('id', 'evaluation', 'reasoning', 'next_steps', 'alert_body_vector', 'ti_signature', 'stored_at')
+
+
+def row(id, vector, stored_at=None):
+    return (id, 'standard alert', '[]', '[]', vector, '', stored_at or datetime.now(timezone.utc))
+
+
+def test_future_runs_once_and_calls_every_callback():
+    calls = []
+    done = threading.Event()
+    future = FakeResponseFuture(lambda: calls.append('write') or 'result', latency=0.01)
+    future.add_callbacks(lambda result: done.set(), lambda error: None)
+
+    assert done.wait(5)
+    outcomes = []
+    future.add_callback(lambda result, tag: outcomes.append((result, tag)), 'late')
+
+    assert calls == ['write']
+    assert outcomes == [('result', 'late')]
+
+
+def test_future_hands_errors_to_errbacks():
+    errors = []
+    done = threading.Event()
+
+    def fail():
+        raise RuntimeError('write timeout')
+
+    FakeResponseFuture(fail, latency=0).add_callbacks(lambda result: None,
+                                                      lambda error: errors.append(error) or done.set())
+
+    assert done.wait(5)
+    assert str(errors[0]) == 'write timeout'
+
+
+def test_similar_vectors_are_found():
+    database = InMemoryCassandraDBOperations(latency=0)
+    database.insert_data(FIELDS, row('same', [1.0, 0.0]))
+    database.insert_data(FIELDS, row('opposite', [-1.0, 0.0]))
+
+    result = database.query_similar([1.0, 0.0], threshold=0.9)
+
+    assert result.count == 1
+    assert result.neighbours[0].id == 'same'
+    assert database.get_verdict('same')['classification'] == 'standard alert'
+
+
+def test_scan_is_bounded_by_time_and_size():
+    database = InMemoryCassandraDBOperations(latency=0)
+    now = datetime.now(timezone.utc)
+    database.insert_data(FIELDS, row('old', [1.0, 0.0], now - timedelta(hours=2)))
+    for id in ('first', 'second'):
+        database.insert_data(FIELDS, row(id, [0.0, 1.0], now))
+
+    assert [scanned[0] for scanned in database.scan_vectors(since=(now - timedelta(hours=1)).timestamp())] == [
+        'first', 'second']
+    assert len(list(database.scan_vectors(limit=2))) == 2
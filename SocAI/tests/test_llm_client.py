@@ -0,0 +1,80 @@
+import pytest
+
+openai = pytest.importorskip('openai')
+
+from SocAI.models.chatgpt import llm_client
+from SocAI.models.chatgpt.llm_client import RateLimitedChatClient, TokenBucket
+
+MESSAGES = [{'role': 'user', 'content': 'alert'}]
+RESPONSE = {'choices': [{'message': {'content': '{}'}}],
+            'usage': {'prompt_tokens': 40, 'completion_tokens': 10, 'total_tokens': 50}}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm_client.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def fake_create(monkeypatch, *outcomes):
+    calls = []
+
+    def create(**arguments):
+        calls.append(arguments)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(openai.ChatCompletion, 'create', create)
+    return calls
+
+
+def test_bucket_goes_into_debt_instead_of_refusing():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+
+    assert bucket.reserve(2) == 0
+    assert bucket.reserve(1) == pytest.approx(1, abs=0.05)
+
+
+def test_transient_errors_are_retried(monkeypatch, sleeps):
+    calls = fake_create(monkeypatch, openai.error.RateLimitError('slow down'), RESPONSE)
+    client = RateLimitedChatClient('key', base_delay=0)
+
+    assert client.complete(MESSAGES, 'gpt-3.5-turbo', 100, 10) is RESPONSE
+    assert len(calls) == 2
+    assert calls[0]['max_tokens'] == 100
+
+
+def test_retry_after_header_is_honored(monkeypatch, sleeps):
+    fake_create(monkeypatch, openai.error.RateLimitError('slow down', headers={'retry-after': '7'}), RESPONSE)
+
+    RateLimitedChatClient('key', base_delay=0).complete(MESSAGES, 'gpt-3.5-turbo', 100, 10)
+
+    assert 7 in sleeps
+
+
+def test_other_errors_are_not_retried(monkeypatch, sleeps):
+    calls = fake_create(monkeypatch, openai.error.InvalidRequestError('too long', None), RESPONSE)
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        RateLimitedChatClient('key').complete(MESSAGES, 'gpt-3.5-turbo', 100, 10)
+    assert len(calls) == 1
+
+
+def test_retries_are_bounded(monkeypatch, sleeps):
+    calls = fake_create(monkeypatch, *[openai.error.Timeout('timeout')] * 3)
+
+    with pytest.raises(openai.error.Timeout):
+        RateLimitedChatClient('key', max_retries=2, base_delay=0).complete(MESSAGES, 'gpt-3.5-turbo', 100, 10)
+    assert len(calls) == 3
+
+
+def test_reservation_is_corrected_with_the_usage(monkeypatch, sleeps):
+    fake_create(monkeypatch, RESPONSE)
+    client = RateLimitedChatClient('key', tokens_per_minute=1000)
+
+    client.complete(MESSAGES, 'gpt-3.5-turbo', 100, 10)
+
+    assert client.tokens_bucket.tokens == pytest.approx(950, abs=1)
@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('cassandra')
+
+from SocAI.benchmarks.fakes.fake_database import FakeResponseFuture
+from SocAI.models.database.local_vector_index import LocallyIndexedDatabase, LocalVectorIndex
+
+
+class FakeDatabase:
+    def __init__(self, written=True, rows=()):
+        self.written = written
+        self.rows = rows
+        self.scans = []
+
+    def insert_data(self, fields, values):
+        return self.written
+
+    def insert_data_async(self, fields, values):
+        written = self.written
+
+        def write():
+            if not written:
+                raise RuntimeError('write timeout')
+
+        return FakeResponseFuture(write, latency=0)
+
+    def scan_vectors(self, since=None, limit=None):
+        self.scans.append((since, limit))
+        return iter(self.rows)
+
+
+FIELDS = ('id', 'evaluation', 'ti_signature', 'alert_body_vector')
+
+
+def index(capacity=3, max_age=None):
+    return LocalVectorIndex(dimension=2, max_memory_bytes=capacity * 2 * 4, max_age=max_age)
+
+
+def ids(result):
+    return [neighbour.id for neighbour in result.neighbours]
+
+
+def test_nearest_vectors_are_found_with_astra_similarities():
+    vectors = index()
+    vectors.add('same', [2.0, 0.0], 'standard alert', 'ip:Clean')
+    vectors.add('orthogonal', [0.0, 1.0])
+    vectors.add('opposite', [-1.0, 0.0])
+
+    result, = vectors.query_similar_many([[1.0, 0.0]], threshold=0.5, neighbours=3)
+
+    assert result.count == 2
+    assert ids(result) == ['same', 'orthogonal']
+    assert result.neighbours[0].similarity == pytest.approx(1.0)
+    assert result.neighbours[1].similarity == pytest.approx(0.5)
+    assert (result.neighbours[0].evaluation, result.neighbours[0].ti_signature) == ('standard alert', 'ip:Clean')
+
+
+def test_empty_index_has_no_neighbours():
+    assert [result.count for result in index().query_similar_many([[1.0, 0.0], [0.0, 1.0]])] == [0, 0]
+
+
+def test_oldest_vectors_are_evicted_once_full():
+    vectors = index(capacity=2)
+    for id in ('first', 'second', 'third'):
+        vectors.add(id, [1.0, 0.0])
+
+    result, = vectors.query_similar_many([[1.0, 0.0]])
+
+    assert len(vectors) == 2
+    assert sorted(ids(result)) == ['second', 'third']
+
+
+def test_vector_of_an_id_is_replaced():
+    vectors = index()
+    vectors.add('alert', [1.0, 0.0], 'standard alert')
+    vectors.add('alert', [1.0, 0.0], 'possible false positive')
+
+    result, = vectors.query_similar_many([[1.0, 0.0]])
+
+    assert len(vectors) == 1
+    assert [neighbour.evaluation for neighbour in result.neighbours] == ['possible false positive']
+
+
+def test_expired_vectors_are_not_returned():
+    vectors = index(max_age=60)
+    vectors.add('old', [1.0, 0.0], written_at=time.time() - 120)
+    vectors.add('recent', [1.0, 0.0])
+
+    result, = vectors.query_similar_many([[1.0, 0.0]])
+
+    assert ids(result) == ['recent']
+
+
+def test_load_keeps_the_newest_rows_and_the_vectors_added_meanwhile():
+    vectors = index(capacity=3)
+    vectors.add('added', [1.0, 0.0])
+    now = time.time()
+
+    vectors.load([('oldest', None, None, [1.0, 0.0], now - 30),
+                  ('newest', None, None, [1.0, 0.0], now - 10),
+                  ('older', None, None, [1.0, 0.0], now - 20)])
+    result, = vectors.query_similar_many([[1.0, 0.0]])
+
+    assert sorted(ids(result)) == ['added', 'newest', 'older']
+
+
+def test_only_written_rows_are_indexed():
+    database = LocallyIndexedDatabase(FakeDatabase(written=False), index())
+
+    assert not database.insert_data(FIELDS, ('alert', 'standard alert', '', [1.0, 0.0]))
+    database.database.written = True
+    assert database.insert_data(FIELDS, ('stored', 'standard alert', '', [1.0, 0.0]))
+
+    assert list(database.index.slots) == ['stored']
+
+
+def test_rows_written_asynchronously_are_indexed_once_stored():
+    database = LocallyIndexedDatabase(FakeDatabase(), index())
+    written = threading.Event()
+
+    database.insert_data_async(FIELDS, ('stored', 'standard alert', '', [1.0, 0.0])).add_callbacks(
+        lambda result: written.set(), lambda error: None)
+    database.database.written = False
+    failed = threading.Event()
+    database.insert_data_async(FIELDS, ('lost', 'standard alert', '', [0.0, 1.0])).add_callbacks(
+        lambda result: None, lambda error: failed.set())
+
+    assert written.wait(5) and failed.wait(5)
+    database.indexer.shutdown(wait=True)
+    assert list(database.index.slots) == ['stored']
+
+
+def test_warm_up_reads_the_recent_rows_and_answers_locally():
+    rows = [('stored', 'standard alert', '', [1.0, 0.0], time.time())]
+    database = LocallyIndexedDatabase(FakeDatabase(rows=rows), index(max_age=3600), max_warm_up_rows=10)
+
+    database._load()
+    result = database.query_similar([1.0, 0.0])
+
+    since, limit = database.database.scans[0]
+    assert since == pytest.approx(time.time() - 3600, abs=5)
+    assert limit == 10
+    assert database.index.ready
+    assert ids(result) == ['stored']
@@ -0,0 +1,55 @@
+import pytest
+
+from SocAI.utils.metrics import MetricsRegistry
+
+
+def test_counter_is_rendered_by_label():
+    registry = MetricsRegistry()
+    counter = registry.counter('socai_test_total', 'Test counter.', ('outcome',))
+    counter.inc(outcome='stored')
+    counter.inc(2, outcome='stored')
+    counter.inc(outcome='say "hi"')
+
+    assert registry.render().splitlines() == [
+        '# HELP socai_test_total Test counter.',
+        '# TYPE socai_test_total counter',
+        'socai_test_total{outcome="say \\"hi\\""} 1',
+        'socai_test_total{outcome="stored"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('socai_test_seconds', 'Test histogram.', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'socai_test_seconds_bucket{le="0.1"} 1',
+        'socai_test_seconds_bucket{le="1"} 2',
+        'socai_test_seconds_bucket{le="+Inf"} 3',
+        'socai_test_seconds_sum 5.55',
+        'socai_test_seconds_count 3',
+    ]
+
+
+def test_labels_must_match_the_declaration():
+    counter = MetricsRegistry().counter('socai_test_total', 'Test counter.', ('outcome',))
+
+    with pytest.raises(ValueError):
+        counter.inc(stage='classify')
+
+
+def test_snapshots_of_other_processes_are_added(tmp_path):
+    worker = MetricsRegistry()
+    worker.counter('socai_test_total', 'Test counter.').inc(2)
+    worker.gauge('socai_test_depth', 'Shared gauge.', function=lambda: 7)
+    worker.write_snapshot(str(tmp_path))
+    api = MetricsRegistry()
+    api.counter('socai_test_total', 'Test counter.').inc(1)
+    api.gauge('socai_test_depth', 'Shared gauge.', function=lambda: 7)
+
+    lines = api.render(str(tmp_path)).splitlines()
+
+    assert 'socai_test_total 3' in lines
+    assert lines.count('socai_test_depth 7') == 1
@@ -0,0 +1,36 @@
+from SocAI.utils.normalizer import AlertNormalizer, collapse_repeated_lines
+
+
+def test_variable_fields_are_replaced_by_placeholders():
+    alert = ('{"src_port": 51234, "timestamp": "2024-01-02T10:11:12Z", '
+             '"id": "123e4567-e89b-12d3-a456-426614174000", "msg": "from 10.0.0.1:4444"}')
+
+    assert AlertNormalizer().normalize(alert) == \
+        '{"id":"<UUID>","msg":"from 10.0.0.1:<PORT>","src_port":<NUM>,"timestamp":"<TIMESTAMP>"}'
+
+
+def test_alerts_of_the_same_template_share_their_fingerprint():
+    normalizer = AlertNormalizer()
+    first = '{"rule": "ssh brute force", "pid": 101, "time": "2024-01-02 10:11:12"}'
+    second = '{"time": "2024-03-04 08:00:00", "pid": 202, "rule": "ssh brute force"}'
+    other = '{"rule": "port scan", "pid": 101, "time": "2024-01-02 10:11:12"}'
+
+    assert normalizer.fingerprint(first) == normalizer.fingerprint(second)
+    assert normalizer.fingerprint(first) != normalizer.fingerprint(other)
+
+
+def test_ip_addresses_are_kept():
+    normalizer = AlertNormalizer()
+
+    assert normalizer.fingerprint('login from 10.0.0.1') != normalizer.fingerprint('login from 10.0.0.2')
+
+
+def test_repeated_lines_are_collapsed():
+    assert collapse_repeated_lines('start\nfailed\nfailed\nfailed\nend') == \
+        'start\nfailed [repeated 3 times]\nend'
+
+
+def test_non_ascii_text_is_kept():
+    normalized = AlertNormalizer().normalize('{"user": "Jos\\u00e9", "file": "文件.txt"}')
+
+    assert normalized == '{"file":"文件.txt","user":"José"}'
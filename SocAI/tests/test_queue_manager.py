@@ -0,0 +1,196 @@
+import sqlite3
+
+import pytest
+
+from SocAI.utils.normalizer import AlertNormalizer
+from SocAI.utils.queue_manager import QueueSystem
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = QueueSystem(str(tmp_path / 'queue.db'), lease_seconds=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def expire_leases(queue):
+    with queue._transaction() as conn:
+        conn.execute("UPDATE queue SET lease_until = 0 WHERE lease_until IS NOT NULL")
+
+
+def test_dequeue_leases_items_to_a_single_consumer(queue):
+    item_id = queue.enqueue('alert')
+
+    assert queue.dequeue(consumer='first') == [(item_id, 'alert', 1)]
+    assert queue.dequeue(consumer='second') == []
+
+
+def test_expired_lease_is_delivered_again(queue):
+    item_id = queue.enqueue('alert')
+    queue.dequeue(consumer='crashed')
+    expire_leases(queue)
+
+    assert [row[0] for row in queue.dequeue(consumer='second')] == [item_id]
+
+
+def test_released_item_is_delivered_again(queue):
+    item_id = queue.enqueue('alert')
+    queue.dequeue()
+    queue.release([item_id], error='timeout')
+
+    assert [row[0] for row in queue.dequeue()] == [item_id]
+
+
+def test_delayed_release_hides_the_item(queue):
+    item_id = queue.enqueue('alert')
+    queue.dequeue()
+    queue.release([item_id], delay=60)
+
+    assert queue.dequeue() == []
+
+
+def test_exhausted_item_is_dead_lettered_with_its_last_error(queue):
+    item_id = queue.enqueue('alert')
+    for _ in range(2):
+        queue.dequeue()
+        queue.release([item_id], error='classification failed')
+
+    assert queue.dequeue() == []
+    assert queue.stats()['dead_letter'] == 1
+    row = queue._connection().execute("SELECT id, attempts, last_error FROM dead_letter").fetchone()
+    assert row == (item_id, 2, 'classification failed')
+
+
+def test_refunded_attempt_does_not_count(queue):
+    item_id = queue.enqueue('alert')
+    for _ in range(3):
+        queue.dequeue()
+        queue.release([item_id], refund_attempt=True)
+
+    assert [row[0] for row in queue.dequeue()] == [item_id]
+
+
+def test_expired_consumer_cannot_release_the_new_claim(queue):
+    item_id = queue.enqueue('alert')
+    queue.dequeue(consumer='slow')
+    expire_leases(queue)
+    queue.dequeue(consumer='second')
+
+    queue.release([item_id], consumer='slow')
+    queue.delete_processed([item_id], consumer='slow')
+
+    assert queue.dequeue(consumer='third') == []
+    assert queue.depth() == 1
+
+
+def test_expired_consumer_does_not_record_its_result(queue):
+    item_id = queue.enqueue('alert')
+    queue.dequeue(consumer='slow')
+    expire_leases(queue)
+    queue.dequeue(consumer='second')
+    verdict = {'classification': 'standard alert', 'reasoning': [], 'next_steps': [], 'verdict_source': 'llm'}
+
+    assert not queue.complete(item_id, verdict, consumer='slow')
+    assert queue.is_queued(item_id)
+    assert queue.complete(item_id, verdict, consumer='second')
+    assert queue.last_result_cursor() == 1
+
+
+def test_extended_lease_keeps_the_item_claimed(queue):
+    lost, kept = queue.enqueue('lost'), queue.enqueue('kept')
+    queue.dequeue(limit=2, consumer='first')
+    expire_leases(queue)
+    queue.dequeue(consumer='second')
+
+    assert queue.extend_lease([kept, lost], 'first') == {lost}
+    assert queue.dequeue(consumer='third') == []
+
+
+def test_deleted_item_is_not_delivered(queue):
+    item_id = queue.enqueue('alert')
+    queue.dequeue()
+    queue.delete_processed([item_id])
+
+    assert queue.depth() == 0
+
+
+def test_older_queue_gains_the_lease_columns(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE queue (id TEXT PRIMARY KEY, data TEXT)")
+    conn.execute("INSERT INTO queue VALUES ('old', 'alert')")
+    conn.commit()
+    conn.close()
+
+    queue = QueueSystem(path)
+    try:
+        assert queue.dequeue() == [('old', 'alert', 1)]
+    finally:
+        queue.close()
+
+
+def test_enqueue_many_reports_duplicates(queue):
+    results = queue.enqueue_many(['first', 'second', 'first'])
+
+    assert [status for _, status in results] == ['accepted', 'accepted', 'duplicate']
+    assert results[0][0] == results[2][0] == QueueSystem.key('first')
+    assert queue.depth() == 2
+
+
+def test_enqueue_many_is_dequeued_in_order(queue):
+    queue.enqueue_many(['first', 'second', 'third'])
+
+    assert [row[1] for row in queue.dequeue(limit=3)] == ['first', 'second', 'third']
+
+
+def test_connection_is_reused_by_its_thread(queue):
+    assert queue._connection() is queue._connection()
+    assert queue._connection().execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_failed_enqueue_raises(queue):
+    with queue._transaction() as conn:
+        conn.execute("DROP TABLE queue")
+
+    with pytest.raises(ValueError):
+        queue.enqueue('alert')
+
+
+def coalescing_queue(tmp_path, window=60):
+    return QueueSystem(str(tmp_path / 'coalescing.db'), normalizer=AlertNormalizer(), coalesce_window=window)
+
+
+def test_alerts_of_the_same_template_are_coalesced(tmp_path):
+    queue = coalescing_queue(tmp_path)
+    try:
+        results = queue.enqueue_many(['{"rule": "ssh brute force", "pid": 101}',
+                                      '{"rule": "ssh brute force", "pid": 202}',
+                                      '{"rule": "port scan", "pid": 101}'])
+
+        assert [status for _, status in results] == ['accepted', 'coalesced', 'accepted']
+        assert results[1][0] == results[0][0]
+        assert [row[2] for row in queue.dequeue(limit=2)] == [2, 1]
+    finally:
+        queue.close()
+
+
+def test_claimed_alerts_are_not_coalesced(tmp_path):
+    queue = coalescing_queue(tmp_path)
+    try:
+        queue.enqueue('{"rule": "ssh brute force", "pid": 101}')
+        queue.dequeue()
+
+        assert queue.enqueue_many(['{"rule": "ssh brute force", "pid": 202}'])[0][1] == 'accepted'
+    finally:
+        queue.close()
+
+
+def test_coalescing_is_disabled_without_a_window(tmp_path):
+    queue = coalescing_queue(tmp_path, window=0)
+    try:
+        results = queue.enqueue_many(['{"rule": "ssh brute force", "pid": 101}',
+                                      '{"rule": "ssh brute force", "pid": 202}'])
+
+        assert [status for _, status in results] == ['accepted', 'accepted']
+    finally:
+        queue.close()
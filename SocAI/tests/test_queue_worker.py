@@ -0,0 +1,161 @@
+import threading
+import time
+
+import pytest
+
+for module in ('backoff', 'cassandra', 'faker', 'openai', 'regex', 'tiktoken'):
+    pytest.importorskip(module)
+
+from SocAI.benchmarks.fakes.fake_database import InMemoryCassandraDBOperations
+from SocAI.controllers.queue_worker import QueueWorker
+from SocAI.models.classifier.classifier_backend import FakeClassifierBackend
+from SocAI.models.database.cassandradboperations import Neighbour, SimilarityResult
+from SocAI.models.threat_intelligence.threat_intelligence_checker import ThreatIntelligenceChecker
+from SocAI.models.threat_intelligence.threat_intelligence_system import ThreatIntelligenceSystem
+from SocAI.utils.embedings import EmbeddingService, FakeEmbeddingBackend
+from SocAI.utils.queue_manager import QueueSystem
+
+
+class UnknownEntities(ThreatIntelligenceSystem):
+    def check_entity(self, entity_type, entity_value):
+        return None
+
+
+class ConcurrencyRecordingClassifier(FakeClassifierBackend):
+    def __init__(self):
+        super().__init__(latency=0.05)
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def classify(self, prompt):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            return super().classify(prompt)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class VerdictDatabase:
+    def __init__(self, verdicts):
+        self.verdicts = verdicts
+        self.requested = []
+
+    def get_verdict(self, id):
+        self.requested.append(id)
+        return self.verdicts.get(id)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = QueueSystem(str(tmp_path / 'queue.db'))
+    yield queue
+    queue.close()
+
+
+def pipeline_worker(queue, classifier, **options):
+    return QueueWorker(queue, InMemoryCassandraDBOperations(latency=0), ThreatIntelligenceChecker(UnknownEntities()),
+                       classifier, poll_interval=0.05, retry_delay=0,
+                       embedding_service=EmbeddingService(FakeEmbeddingBackend(), max_latency=0), **options)
+
+
+def wait_for_results(queue, item_ids, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(queue.result(item_id) for item_id in item_ids):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_alerts_are_classified_concurrently_and_acknowledged(queue):
+    classifier = ConcurrencyRecordingClassifier()
+    worker = pipeline_worker(queue, classifier, max_workers=4, stage_limits={'llm': 2})
+    item_ids = [queue.enqueue(f'{{"alert": "login failed for user {index} from 8.8.8.8"}}') for index in range(6)]
+
+    worker.start()
+    try:
+        assert wait_for_results(queue, item_ids)
+    finally:
+        assert worker.stop(timeout=5)
+
+    assert 1 < classifier.max_active <= 2
+    assert queue.depth() == 0
+    assert {queue.result(item_id)['classification'] for item_id in item_ids} == {'standard alert'}
+
+
+def test_unfinished_alerts_are_released_on_stop(queue):
+    worker = pipeline_worker(queue, FakeClassifierBackend(latency=2))
+    item_id = queue.enqueue('{"alert": "port scan"}')
+
+    worker.start()
+    while not worker.in_flight:
+        time.sleep(0.01)
+
+    assert not worker.stop(timeout=0.1)
+    assert [row[0] for row in queue.dequeue()] == [item_id]
+
+
+def test_leases_of_slow_alerts_are_renewed(tmp_path):
+    queue = QueueSystem(str(tmp_path / 'queue.db'), lease_seconds=0.3)
+    worker = pipeline_worker(queue, FakeClassifierBackend(latency=1))
+    item_id = queue.enqueue('{"alert": "port scan"}')
+
+    worker.start()
+    try:
+        while not worker.in_flight:
+            time.sleep(0.01)
+        time.sleep(0.6)
+        assert queue.dequeue(consumer='other') == []
+        assert wait_for_results(queue, [item_id])
+        assert queue.last_result_cursor() == 1
+    finally:
+        worker.stop(timeout=5)
+        queue.close()
+
+
+def verdict_cache_worker(database, threshold=0.95):
+    return QueueWorker(None, database, None, None, verdict_cache_threshold=threshold)
+
+
+def similarity(*neighbours):
+    return SimilarityResult(len(neighbours), list(neighbours))
+
+
+VERDICT = {'classification': 'possible false positive', 'reasoning': ['Seen before.'], 'next_steps': []}
+
+
+def test_verdict_of_a_near_duplicate_is_reused():
+    worker = verdict_cache_worker(VerdictDatabase({'stored': VERDICT}))
+
+    verdict = worker._cached_verdict(similarity(Neighbour('stored', 0.99, 'possible false positive', 'ip:Clean')),
+                                     'ip:Clean')
+
+    assert verdict == VERDICT
+    assert worker.verdict_cache_stats['hits'] == 1
+
+
+@pytest.mark.parametrize('neighbours, ti_signature, outcome', [
+    ((), 'ip:Clean', 'no_neighbour'),
+    ((Neighbour('stored', 0.9, 'standard alert', 'ip:Clean'),), 'ip:Clean', 'below_threshold'),
+    ((Neighbour('stored', 0.99, 'standard alert', 'ip:Clean'),), 'ip:Malicious', 'threat_intelligence_mismatch'),
+    ((Neighbour('stored', 0.99, 'standard alert', None),), '', 'threat_intelligence_mismatch'),
+    ((Neighbour('stored', 0.99, 'standard alert', 'ip:Clean'),), None, 'threat_intelligence_unavailable'),
+    ((Neighbour('missing', 0.99, 'standard alert', 'ip:Clean'),), 'ip:Clean', 'verdict_not_found'),
+])
+def test_verdict_is_not_reused(neighbours, ti_signature, outcome):
+    worker = verdict_cache_worker(VerdictDatabase({'stored': VERDICT}))
+
+    assert worker._cached_verdict(similarity(*neighbours), ti_signature) is None
+    assert worker.verdict_cache_stats[outcome] == 1
+
+
+def test_disabled_verdict_cache_never_reads_verdicts():
+    database = VerdictDatabase({'stored': VERDICT})
+    worker = verdict_cache_worker(database, threshold=None)
+
+    assert worker._cached_verdict(similarity(Neighbour('stored', 1.0, 'standard alert', '')), '') is None
+    assert database.requested == []
@@ -0,0 +1,57 @@
+import importlib
+import json
+
+import pytest
+
+pytest.importorskip('faker')
+
+from SocAI.utils import redactron
+from SocAI.utils.redactron import RedactionEngine, extract_sensitive_information, replace_with_fake_elements, \
+    restore_original_values, substitute
+
+ALERT = {'message': 'admin@evil.com logged in from 8.8.8.8 to evil.com via 10.0.0.1',
+         'hosts': ['evil.com', {'8.8.8.8': 'source'}]}
+
+
+def test_redaction_round_trip():
+    sensitive_information = extract_sensitive_information(json.dumps(ALERT))
+
+    redacted, replaces = replace_with_fake_elements(ALERT, sensitive_information)
+
+    text = json.dumps(redacted)
+    for original in ('admin@evil.com', 'evil.com', '8.8.8.8', '10.0.0.1'):
+        assert original not in text
+    assert restore_original_values(redacted, replaces) == ALERT
+
+
+def test_longest_value_wins():
+    mapping = {'evil.com': 'fake.org', 'admin@evil.com': 'user@example.net'}
+
+    assert substitute('admin@evil.com and evil.com', mapping) == 'user@example.net and fake.org'
+
+
+def test_seeded_engines_agree():
+    sensitive_information = {'ip': ['8.8.8.8'], 'domain': ['evil.com'], 'email': ['admin@evil.com']}
+
+    first = RedactionEngine(seed='secret').replacements(sensitive_information)
+
+    assert RedactionEngine(seed='secret').replacements(sensitive_information) == first
+    assert RedactionEngine(seed='other').replacements(sensitive_information) != first
+
+
+def test_fake_values_are_unique():
+    sensitive_information = {'ip': [f'8.8.8.{index}' for index in range(50)]}
+
+    replaces = RedactionEngine(seed='secret').replacements(sensitive_information)
+
+    assert len(set(replaces.values())) == 50
+    assert not set(replaces.values()) & set(replaces)
+
+
+def test_fake_values_are_random_without_a_seed(monkeypatch):
+    monkeypatch.delenv('REDACTION_SEED', raising=False)
+    sensitive_information = {'ip': ['8.8.8.8'], 'domain': ['evil.com'], 'email': ['admin@evil.com']}
+
+    assert importlib.reload(redactron)._default_engine.seed is None
+    assert RedactionEngine().replacements(sensitive_information) != \
+        RedactionEngine().replacements(sensitive_information)
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from SocAI.utils.queue_manager import QueueSystem
+from SocAI.utils.results import ResultBuffer, ResultPoller
+
+VERDICT = {'classification': 'standard alert', 'reasoning': ['Routine.'], 'next_steps': [], 'verdict_source': 'llm'}
+
+
+def result(cursor, id=None):
+    return {'cursor': cursor, 'id': id or f'alert-{cursor}'}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = QueueSystem(str(tmp_path / 'queue.db'))
+    yield queue
+    queue.close()
+
+
+def complete(queue, *alerts):
+    item_ids = [queue.enqueue(alert) for alert in alerts]
+    for item_id in item_ids:
+        queue.complete(item_id, VERDICT)
+    return item_ids
+
+
+def test_unloaded_buffer_has_no_results():
+    assert ResultBuffer().since(0) is None
+
+
+def test_results_after_the_cursor_are_returned_oldest_first():
+    buffer = ResultBuffer()
+    buffer.load([result(11), result(12)], floor=10)
+    buffer.extend([result(13)])
+
+    assert [item['cursor'] for item in buffer.since(11)] == [12, 13]
+    assert [item['cursor'] for item in buffer.since(10, limit=2)] == [11, 12]
+    assert buffer.since(13) == []
+    assert buffer.cursor == 13
+
+
+def test_evicted_results_have_to_be_read_from_the_queue():
+    buffer = ResultBuffer(capacity=2)
+    buffer.load([], floor=0)
+    buffer.extend([result(1), result(2), result(3)])
+
+    assert buffer.since(0) is None
+    assert [item['cursor'] for item in buffer.since(1)] == [2, 3]
+    assert buffer.get('alert-1') is None
+
+
+def test_latest_result_of_an_item_is_kept():
+    buffer = ResultBuffer(capacity=2)
+    buffer.load([], floor=0)
+    buffer.extend([result(1, 'alert'), result(2, 'other'), result(3, 'alert')])
+    buffer.extend([result(4, 'other')])
+
+    assert buffer.get('alert')['cursor'] == 3
+
+
+def test_queue_results_follow_their_cursor(queue):
+    first, second, third = complete(queue, 'first', 'second', 'third')
+
+    assert queue.last_result_cursor() == 3
+    assert [item['id'] for item in queue.results_since(1)] == [second, third]
+    assert [item['id'] for item in queue.latest_results(2)] == [second, third]
+    assert queue.result(first)['reasoning'] == ['Routine.']
+    assert not queue.is_queued(first)
+
+
+def test_expired_results_are_pruned(queue):
+    item_id, = complete(queue, 'first')
+
+    queue.prune_results(time.time() + 1)
+
+    assert queue.result(item_id) is None
+    assert queue.last_result_cursor() == 0
+
+
+def test_poller_copies_the_results_recorded_by_the_workers(queue):
+    complete(queue, 'first', 'second')
+    buffer = ResultBuffer(capacity=1)
+    poller = ResultPoller(queue, buffer, interval=0.01, retention=0)
+    poller.start()
+    try:
+        new, = complete(queue, 'third')
+        deadline = time.monotonic() + 5
+        while buffer.get(new) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        poller.stop()
+        poller.join(5)
+
+    assert buffer.get(new)['cursor'] == 3
+    # Older results were left out of the buffer, they are read from the queue
+    assert buffer.since(1) is None
+    assert [item['cursor'] for item in buffer.since(2)] == [3]
@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from SocAI.models.threat_intelligence.cached_threat_intelligence import CachedThreatIntelligence
+from SocAI.models.threat_intelligence.threat_intelligence_checker import UNKNOWN_REPUTATION, \
+    ThreatIntelligenceChecker
+from SocAI.models.threat_intelligence.threat_intelligence_system import ThreatIntelligenceSystem, \
+    ThreatIntelligenceUnavailableError
+
+
+class FakeThreatIntelligence(ThreatIntelligenceSystem):
+    def __init__(self, known=None, error=None, release=None):
+        self.known = known or {}
+        self.error = error
+        self.release = release
+        self.calls = []
+
+    def check_entity(self, entity_type, entity_value):
+        self.calls.append((entity_type, entity_value))
+        if self.release:
+            self.release.wait(5)
+        if self.error:
+            raise self.error
+        reputation = self.known.get(entity_value)
+        return {entity_type: entity_value, 'reputation': reputation} if reputation else None
+
+
+def test_results_are_cached():
+    backend = FakeThreatIntelligence({'1.2.3.4': 'Malicious'})
+    cache = CachedThreatIntelligence(backend)
+
+    for _ in range(3):
+        assert cache.check_entity('ip', '1.2.3.4') == {'ip': '1.2.3.4', 'reputation': 'Malicious'}
+    assert cache.check_entity('ip', '5.6.7.8') is None
+    assert cache.check_entity('ip', '5.6.7.8') is None
+
+    assert len(backend.calls) == 2
+    assert cache.stats()['hits'] == 3
+
+
+def test_unknown_entities_expire_after_the_miss_ttl():
+    backend = FakeThreatIntelligence()
+    cache = CachedThreatIntelligence(backend, miss_ttl=-1)
+
+    cache.check_entity('ip', '5.6.7.8')
+    cache.check_entity('ip', '5.6.7.8')
+
+    assert len(backend.calls) == 2
+
+
+def test_cached_result_is_a_copy():
+    cache = CachedThreatIntelligence(FakeThreatIntelligence({'1.2.3.4': 'Malicious'}))
+
+    cache.check_entity('ip', '1.2.3.4')['reputation'] = 'Changed'
+
+    assert cache.check_entity('ip', '1.2.3.4')['reputation'] == 'Malicious'
+
+
+def test_failed_lookups_are_not_cached():
+    backend = FakeThreatIntelligence(error=ThreatIntelligenceUnavailableError('timeout'))
+    cache = CachedThreatIntelligence(backend)
+
+    for _ in range(2):
+        with pytest.raises(ThreatIntelligenceUnavailableError):
+            cache.check_entity('ip', '1.2.3.4')
+    assert len(backend.calls) == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    backend = FakeThreatIntelligence()
+    cache = CachedThreatIntelligence(backend, max_entries=2)
+
+    for entity in ('a.com', 'b.com', 'a.com', 'c.com', 'a.com', 'b.com'):
+        cache.check_entity('domain', entity)
+
+    assert backend.calls == [('domain', 'a.com'), ('domain', 'b.com'), ('domain', 'c.com'), ('domain', 'b.com')]
+
+
+def test_concurrent_lookups_are_coalesced():
+    release = threading.Event()
+    backend = FakeThreatIntelligence({'1.2.3.4': 'Malicious'}, release=release)
+    cache = CachedThreatIntelligence(backend)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.check_entity('ip', '1.2.3.4')))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert backend.calls == [('ip', '1.2.3.4')]
+    assert results == [{'ip': '1.2.3.4', 'reputation': 'Malicious'}] * 4
+
+
+def test_persistent_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'threat_intelligence.db')
+    CachedThreatIntelligence(FakeThreatIntelligence({'1.2.3.4': 'Malicious'}), persistent_path=path) \
+        .check_entity('ip', '1.2.3.4')
+    backend = FakeThreatIntelligence()
+    cache = CachedThreatIntelligence(backend, persistent_path=path)
+
+    assert cache.check_entity('ip', '1.2.3.4') == {'ip': '1.2.3.4', 'reputation': 'Malicious'}
+    assert backend.calls == []
+    assert cache.stats()['persistent_hits'] == 1
+
+
+def test_checker_looks_up_each_entity_once():
+    backend = FakeThreatIntelligence({'1.2.3.4': 'Malicious', 'evil.com': 'Suspicious'})
+    checker = ThreatIntelligenceChecker(backend)
+
+    results = checker.check_in_threat_intelligence({'ip': ['1.2.3.4', '5.6.7.8', '1.2.3.4'],
+                                                    'domain': ['evil.com'], 'private_ip': ['10.0.0.1']})
+
+    assert results == [{'ip': '1.2.3.4', 'reputation': 'Malicious'},
+                       {'domain': 'evil.com', 'reputation': 'Suspicious'}]
+    assert sorted(backend.calls) == [('domain', 'evil.com'), ('ip', '1.2.3.4'), ('ip', '5.6.7.8')]
+
+
+def test_checker_only_looks_up_the_configured_entity_types():
+    backend = FakeThreatIntelligence()
+    checker = ThreatIntelligenceChecker(backend, entity_types=('domain',))
+
+    checker.check_in_threat_intelligence({'ip': ['1.2.3.4'], 'domain': ['evil.com']})
+
+    assert backend.calls == [('domain', 'evil.com')]
+
+
+def test_signature_summarizes_the_findings():
+    results = [{'ip': '1.2.3.4', 'reputation': 'Malicious', 'tags': ['c2']},
+               {'domain': 'evil.com', 'reputation': 'Suspicious'},
+               {'ip': '5.6.7.8', 'reputation': 'Malicious'}]
+
+    assert ThreatIntelligenceChecker.signature(results) == 'domain:Suspicious,ip:Malicious'
+
+
+def test_failed_lookup_is_reported_and_has_no_signature():
+    checker = ThreatIntelligenceChecker(FakeThreatIntelligence(error=ThreatIntelligenceUnavailableError('timeout')))
+
+    results = checker.check_in_threat_intelligence({'ip': ['1.2.3.4']})
+
+    assert results == [{'ip': '1.2.3.4', 'reputation': UNKNOWN_REPUTATION}]
+    assert ThreatIntelligenceChecker.signature(results) is None
@@ -0,0 +1,63 @@
+import logging
+import threading
+import time
+
+
+class AdmissionController:
+    def __init__(self, queue, high_watermark, low_watermark, retry_after=30, refresh_interval=1):
+        """
+        Decide whether new alerts are admitted based on the depth of the queue.
+
+        Once the depth reaches the high watermark new alerts are rejected until the queue drains below the low
+        watermark, so the API does not flap around a single threshold.
+
+        Parameters:
+        - queue (QueueSystem): The queue whose depth is watched.
+        - high_watermark (int): Depth at which alerts start being rejected. 0 disables admission control.
+        - low_watermark (int): Depth below which alerts are admitted again.
+        - retry_after (int): Seconds clients are asked to wait before retrying.
+        - refresh_interval (float): Seconds the last known depth is reused before counting the queue again.
+        """
+        self.queue = queue
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.retry_after = retry_after
+        self.refresh_interval = refresh_interval
+
+        self.saturated = False
+        self._depth = 0
+        self._depth_checked_at = 0
+        self._lock = threading.Lock()
+
+    def depth(self):
+        """
+        Return the depth of the queue, counted at most once per refresh_interval.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._depth_checked_at >= self.refresh_interval:
+                self._depth = self.queue.depth()
+                self._depth_checked_at = now
+            return self._depth
+
+    def admit(self, count=1):
+        """
+        Return True if `count` new alerts can be accepted. A batch larger than the high watermark is admitted into
+        an empty queue, as if it only filled it up to the watermark.
+        """
+        if not self.high_watermark:
+            return True
+
+        depth = self.depth()
+        with self._lock:
+            if self.saturated and depth < self.low_watermark:
+                self.saturated = False
+                logging.info(f"Queue depth {depth} is below the low watermark, accepting alerts again")
+            elif not self.saturated and depth + min(count, self.high_watermark) > self.high_watermark:
+                self.saturated = True
+                logging.warning(f"Queue depth {depth} reached the high watermark, rejecting alerts")
+
+            if not self.saturated:
+                # Account for the admitted alerts until the next count
+                self._depth += count
+            return not self.saturated
@@ -0,0 +1,171 @@
+import json
+import logging
+import re
+from collections import namedtuple
+
+# A JSON alert having every `detect` key belongs to the schema, only its `fields` (dotted paths) are kept
+AlertSchema = namedtuple('AlertSchema', ['name', 'detect', 'fields'])
+
+# Compaction of an alert and its size in tokens before and after, None without a token counter
+CompactionResult = namedtuple('CompactionResult', ['text', 'schema', 'original_tokens', 'compacted_tokens'])
+
+DEFAULT_SCHEMAS = (
+    AlertSchema('wazuh', ('rule', 'agent', 'decoder'), (
+        'timestamp', 'rule.description', 'rule.level', 'rule.groups', 'rule.mitre', 'agent.name', 'agent.ip',
+        'data.srcip', 'data.srcuser', 'data.dstuser', 'data.url', 'data.win.system.eventID', 'data.win.eventdata',
+        'syscheck.path', 'syscheck.event', 'full_log', 'location')),
+    AlertSchema('suricata', ('event_type', 'alert', 'src_ip'), (
+        'timestamp', 'alert.signature', 'alert.category', 'alert.severity', 'alert.action', 'src_ip', 'src_port',
+        'dest_ip', 'dest_port', 'proto', 'app_proto', 'http.hostname', 'http.url', 'http.http_user_agent',
+        'http.status', 'dns.rrname', 'tls.sni', 'payload_printable')),
+    AlertSchema('ecs', ('@timestamp', 'event'), (
+        '@timestamp', 'message', 'event.action', 'event.category', 'event.outcome', 'event.severity', 'rule.name',
+        'rule.description', 'host.name', 'user.name', 'source.ip', 'source.port', 'destination.ip',
+        'destination.port', 'url.full', 'process.name', 'process.command_line', 'process.parent.name', 'file.path',
+        'file.hash.sha256', 'dns.question.name', 'threat.indicator')),
+)
+
+# Numbers that are not part of an IP address or a version, e.g. pids, ports, durations
+VARIABLE_NUMBER = re.compile(r'(?<![\d.])\d+(?![\d.])')
+
+# Characters tokenized to report the savings of an alert, longer texts are extrapolated
+MAX_COUNTED_CHARS = 65536
+
+
+class AlertCompactor:
+    def __init__(self, schemas=DEFAULT_SCHEMAS, collapse_lines=True, normalizer=None, token_counter=None):
+        """
+        Shrink an alert before it is put in the prompt.
+
+        JSON alerts of a known schema keep only the fields of its allowlist, empty fields are dropped, and lines
+        of multi-line values that only differ in their numbers are collapsed into the first one with a count.
+
+        Parameters:
+        - schemas (iterable): The AlertSchema recognized, the first matching one applies.
+        - collapse_lines (bool): Collapse lines that only differ in their numbers.
+        - normalizer (AlertNormalizer): Applied to the compacted alert, as the worker does to the alerts it prompts.
+        - token_counter (callable): Returns the number of tokens of a text, to report the savings.
+        """
+        self.schemas = tuple(schemas)
+        self.collapse_lines = collapse_lines
+        self.normalizer = normalizer
+        self.token_counter = token_counter
+
+    def compact(self, text, original=None):
+        """
+        Parameters:
+        - text (str): The raw alert.
+        - original (str): The alert prompted without compaction, to count the savings. Defaults to `text`.
+
+        Returns:
+        - result (CompactionResult): The compacted alert, the name of its schema (or None) and its tokens before
+          and after.
+        """
+        try:
+            document = json.loads(text)
+        except (TypeError, ValueError):
+            document = None
+
+        schema = None
+        if isinstance(document, dict):
+            schema = self.schema(document)
+            if schema:
+                document = project(document, schema.fields)
+            compacted = json.dumps(self._compact_value(document), ensure_ascii=False, separators=(',', ':'))
+        else:
+            compacted = collapse_templated_lines(text) if self.collapse_lines else text
+        if self.normalizer:
+            compacted = self.normalizer.normalize(compacted)
+
+        return CompactionResult(compacted, schema.name if schema else None,
+                                self._count(text if original is None else original), self._count(compacted))
+
+    def schema(self, document):
+        for schema in self.schemas:
+            if all(key in document for key in schema.detect):
+                return schema
+        return None
+
+    def _compact_value(self, value):
+        if isinstance(value, dict):
+            value = {key: self._compact_value(item) for key, item in value.items()}
+            return {key: item for key, item in value.items() if item not in (None, '', [], {})}
+        if isinstance(value, list):
+            return [item for item in map(self._compact_value, value) if item not in (None, '', [], {})]
+        if isinstance(value, str) and self.collapse_lines and '\n' in value:
+            return collapse_templated_lines(value)
+        return value
+
+    def _count(self, text):
+        if not self.token_counter:
+            return None
+        if len(text) <= MAX_COUNTED_CHARS:
+            return self.token_counter(text)
+        return round(self.token_counter(text[:MAX_COUNTED_CHARS]) * len(text) / MAX_COUNTED_CHARS)
+
+
+def project(document, fields):
+    """Keep only the dotted paths of `fields` of the document, in the nesting of the document."""
+    projected = {}
+    for field in fields:
+        value, found = document, True
+        for key in field.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                found = False
+                break
+            value = value[key]
+        if not found:
+            continue
+        target = projected
+        *parents, leaf = field.split('.')
+        for key in parents:
+            target = target.setdefault(key, {})
+        target[leaf] = value
+    return projected
+
+
+def collapse_templated_lines(text):
+    """
+    Replace lines that only differ in their numbers (pids, ports, counters) by the first of them followed by
+    their count, in the order they first appeared. IP addresses are kept apart.
+    """
+    lines = text.split('\n')
+    if len(lines) < 2:
+        return text
+
+    groups = {}
+    for line in lines:
+        groups.setdefault(VARIABLE_NUMBER.sub('#', line), [line, 0])[1] += 1
+    return '\n'.join(line if count == 1 else f"{line} [{count} similar lines]" for line, count in groups.values())
+
+
+def summarize_threat_intelligence(results):
+    """
+    One line per entity found in the threat intelligence platform, instead of the JSON of its results.
+    """
+    lines = []
+    for result in results:
+        entity = ', '.join(f"{key} {value}" for key, value in result.items()
+                           if key not in ('reputation', 'last_report', 'tags'))
+        details = [f"reputation {result.get('reputation')}"]
+        if result.get('last_report'):
+            details.append(f"last reported {str(result['last_report'])[:10]}")
+        if result.get('tags'):
+            tags = result['tags'] if isinstance(result['tags'], list) else [result['tags']]
+            details.append(f"tags {', '.join(map(str, tags))}")
+        lines.append(f"- {entity}: {'; '.join(details)}")
+    return '\n'.join(lines)
+
+
+def load_schemas(path):
+    """
+    Read alert schemas from a JSON file of the form {"name": {"detect": [keys], "fields": [dotted paths]}}.
+    """
+    try:
+        with open(path) as file:
+            definitions = json.load(file)
+        return tuple(AlertSchema(name, tuple(definition['detect']), tuple(definition['fields']))
+                     for name, definition in definitions.items())
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error(f"Error loading the alert schemas from {path}: {str(e)}")
+        raise ValueError(f"Invalid alert schemas file {path}") from e
@@ -1,15 +1,182 @@
+import hashlib
 import logging
 import os
-from langchain.embeddings import OpenAIEmbeddings
+import random
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
 
+from SocAI.utils.metrics import registry
+from SocAI.utils.micro_batcher import MicroBatcher
 
-def create_vector(text):
-    try:
-        embeddings = OpenAIEmbeddings()
+EMBEDDING_CACHE_TOTAL = registry.counter('socai_embedding_cache_total', 'Embedding cache lookups, by result.',
+                                         ('result',))
+
+
+class EmbeddingBackend(ABC):
+    # Vectors of different backends are not comparable, the name keeps them apart in the cache
+    name = 'embedding-backend'
+
+    @abstractmethod
+    def embed_documents(self, texts):
+        """Return one vector per text, in order."""
+        pass
+
+    def warm_up(self):
+        """Load the client ahead of the first alert."""
+        pass
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    name = 'openai'
+
+    def __init__(self):
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        self.warm_up()
+        return self._embeddings.embed_documents(texts)
+
+    def warm_up(self):
+        with self._lock:
+            if self._embeddings is None:
+                from langchain.embeddings import OpenAIEmbeddings
+                self._embeddings = OpenAIEmbeddings()
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """Deterministic vectors derived from the text, for tests and benchmarks."""
+    name = 'fake'
+
+    def __init__(self, dimension=1536):
+        self.dimension = dimension
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            generator = random.Random(hashlib.sha256(text.encode()).digest())
+            vector = [generator.gauss(0, 1) for _ in range(self.dimension)]
+            norm = sum(value * value for value in vector) ** 0.5
+            vectors.append([value / norm for value in vector])
+        return vectors
+
+
+class EmbeddingCache:
+    def __init__(self, path=None, max_memory_entries=10000):
+        """
+        Vectors keyed by the hash of their text, kept in a bounded in-memory LRU and optionally in a SQLite file
+        as float32 arrays.
+        """
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0}
+        self._local = threading.local()
+        if path:
+            with self._connection() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
 
-        doc_result = embeddings.embed_documents([text])
+    def get(self, key):
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+        if vector is None and self.path:
+            row = self._connection().execute("SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                vector = array('f')
+                vector.frombytes(row[0])
+                self._remember(key, vector)
 
-        return doc_result[0]
+        EMBEDDING_CACHE_TOTAL.inc(result='hits' if vector is not None else 'misses')
+        with self.lock:
+            self.counters['hits' if vector is not None else 'misses'] += 1
+        return vector.tolist() if vector is not None else None
+
+    def put(self, key, vector):
+        vector = array('f', vector)
+        self._remember(key, vector)
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    conn.execute("INSERT OR REPLACE INTO embedding_cache VALUES (?, ?)", (key, vector.tobytes()))
+            except sqlite3.Error as e:
+                logging.error(f"An error has occurred while caching the vector: {e}")
+
+    def _remember(self, key, vector):
+        with self.lock:
+            self.entries[key] = vector
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_memory_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'size': len(self.entries)}
+
+
+class EmbeddingService:
+    def __init__(self, backend: EmbeddingBackend, cache: EmbeddingCache = None, max_batch_size=64,
+                 max_latency=0.05):
+        """
+        Embed texts through a backend, batching the texts of concurrent callers into one call and caching the
+        vectors by the hash of the text.
+        """
+        self.backend = backend
+        self.cache = cache or EmbeddingCache()
+        self.batcher = MicroBatcher(self._embed_batch, max_batch_size=max_batch_size, max_latency=max_latency,
+                                    name='embedding-batcher')
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.backend.name}\n{text}".encode()).hexdigest()
+
+    def embed(self, text):
+        key = self.key(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.batcher.submit(text).result()
+            self.cache.put(key, vector)
+        return vector
+
+    def warm_up(self):
+        self.backend.warm_up()
+
+    def _embed_batch(self, texts):
+        # Identical texts waiting in the same batch are embedded once
+        unique_texts = list(dict.fromkeys(texts))
+        vectors = dict(zip(unique_texts, self.backend.embed_documents(unique_texts)))
+        return [vectors[text] for text in texts]
+
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+def default_embedding_service():
+    global _default_service
+    with _default_service_lock:
+        if _default_service is None:
+            _default_service = EmbeddingService(OpenAIEmbeddingBackend(),
+                                                EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH")))
+        return _default_service
+
+
+def create_vector(text, service: EmbeddingService = None):
+    try:
+        return (service or default_embedding_service()).embed(text)
     except Exception as e:
         logging.error(f"An error has occurred while creating the vector: {e}")
         return None
@@ -0,0 +1,106 @@
+import ipaddress
+import re
+
+IPV4_PATTERN = re.compile(r'(?<![\w.])(?:\d{1,3}\.){3}\d{1,3}(?![\w]|\.\d)')
+# The IPv4 tail of mapped addresses (::ffff:8.8.8.8) is tried first, its first number would pass for a group
+IPV6_PATTERN = re.compile(r'(?<![\w:.])(?:[0-9A-Fa-f]{0,4}:){2,7}(?:(?:\d{1,3}\.){3}\d{1,3}|[0-9A-Fa-f]{1,4})?'
+                          r'(?![\w:])')
+URL_PATTERN = re.compile(r'\b(?:https?|ftp)://[^\s"\'<>\\]+', re.IGNORECASE)
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,63}\b')
+DOMAIN_PATTERN = re.compile(r'(?<![\w@.-])(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+'
+                            r'(?:[A-Za-z]{2,63}|xn--[A-Za-z0-9]{1,59})\b(?![\w-]|\.\w)')
+HASH_PATTERNS = {
+    'md5': re.compile(r'\b[0-9A-Fa-f]{32}\b'),
+    'sha1': re.compile(r'\b[0-9A-Fa-f]{40}\b'),
+    'sha256': re.compile(r'\b[0-9A-Fa-f]{64}\b'),
+}
+
+# Country code TLDs. `id` (Indonesia) is left out, it mostly matches fields such as event.id or user.id
+COUNTRY_CODE_TLDS = frozenset('''
+    ac ad ae af ag ai al am ao aq ar as at au aw ax az ba bb bd be bf bg bh bi bj bm bn bo bq br bs bt bw by bz ca cc
+    cd cf cg ch ci ck cl cm cn co cr cu cv cw cx cy cz de dj dk dm do dz ec ee eg er es et eu fi fj fk fm fo fr ga gd
+    ge gf gg gh gi gl gm gn gp gq gr gs gt gu gw gy hk hm hn hr ht hu ie il im in io iq ir is it je jm jo jp ke kg kh
+    ki km kn kp kr kw ky kz la lb lc li lk lr ls lt lu lv ly ma mc md me mg mh mk ml mm mn mo mp mq mr ms mt mu mv mw
+    mx my mz na nc ne nf ng ni nl no np nr nu nz om pa pe pf pg ph pk pl pm pn pr ps pt pw py qa re ro rs ru rw sa sb
+    sc sd se sg sh si sk sl sm sn so sr ss st su sv sx sy sz tc td tf tg th tj tk tl tm tn to tr tt tv tw tz ua ug uk
+    us uy uz va vc ve vg vi vn vu wf ws ye yt za zm zw
+'''.split())
+
+# Generic TLDs, the original ones and the new ones common in alerts. `name` is left out, it mostly matches
+# fields such as host.name or user.name
+GENERIC_TLDS = frozenset('''
+    com net org edu gov mil int info biz pro aero asia cat coop jobs mobi museum post tel travel xxx arpa
+    academy agency app art bank bar best bet bid blog blue buzz cam capital casino center cfd chat click cloud club
+    company consulting cool cyou date dating design dev digital download email exchange faith finance fit fun game
+    games global group guru host icu inc insurance link live llc lol love ltd market marketing media men money
+    monster network news ninja one online page party photo pics pink press quest racing red rest review rocks run
+    sbs science security services shop site social software solutions space store stream studio support systems
+    team tech today tools top trade tube uno ventures video vip webcam website wiki win work world xyz zone
+'''.split())
+
+# Extensions of file names that look like domains, e.g. svchost.exe or access.log
+FILE_EXTENSIONS = frozenset({
+    'bat', 'bin', 'cfg', 'conf', 'cpp', 'csv', 'dat', 'db', 'dll', 'doc', 'docx', 'exe', 'gif', 'gz', 'htm',
+    'html', 'ini', 'jar', 'java', 'jpeg', 'jpg', 'js', 'json', 'log', 'md', 'msi', 'pdf', 'php', 'png', 'ps1', 'py',
+    'rar', 'sh', 'so', 'sql', 'sys', 'tar', 'tmp', 'txt', 'vbs', 'xls', 'xlsx', 'xml', 'yaml', 'yml', 'zip',
+})
+
+
+class EntityExtractor:
+    """
+    Extracts the entities of an alert with precompiled patterns.
+
+    Each kind of entity is deduplicated, keeping the order of first appearance. Public IP addresses are reported
+    under 'ip' and private, loopback, link-local and reserved ones under 'private_ip': only the former are worth
+    a threat intelligence lookup, but both must be redacted.
+    """
+
+    def extract(self, data: str):
+        public_ips, private_ips = self._ips(data)
+        entities = {
+            'ip': public_ips,
+            'private_ip': private_ips,
+            'domain': self._domains(data),
+            'email': _unique(EMAIL_PATTERN.findall(data)),
+            'url': _unique(url.rstrip('.,;)]}') for url in URL_PATTERN.findall(data)),
+        }
+        for hash_type, pattern in HASH_PATTERNS.items():
+            entities[hash_type] = _unique(pattern.findall(data))
+        return entities
+
+    def extract_many(self, alerts):
+        """Extract the entities of every alert, in order."""
+        return [self.extract(alert) for alert in alerts]
+
+    @staticmethod
+    def _ips(data):
+        public_ips, private_ips = {}, {}
+        for candidate in IPV4_PATTERN.findall(data) + IPV6_PATTERN.findall(data):
+            # Words followed by :: (cafe::, a::b in code) parse as compressed IPv6, real addresses have a digit
+            if '::' in candidate and not any(character.isdigit() for character in candidate):
+                continue
+            try:
+                address = ipaddress.ip_address(candidate)
+            except ValueError:
+                continue
+            (public_ips if address.is_global else private_ips)[candidate] = None
+        return list(public_ips), list(private_ips)
+
+    @staticmethod
+    def _domains(data):
+        # Code and paths are full of dotted identifiers (os.path, foo.exe), only known TLDs make a domain
+        return _unique(domain for domain in DOMAIN_PATTERN.findall(data) if is_domain_tld(domain.rsplit('.', 1)[1]))
+
+
+def is_domain_tld(label):
+    label = label.lower()
+    if label in FILE_EXTENSIONS:
+        return False
+    return label in COUNTRY_CODE_TLDS or label in GENERIC_TLDS or label.startswith('xn--')
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+default_extractor = EntityExtractor()
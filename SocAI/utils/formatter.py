@@ -1,24 +1,41 @@
 import json
 import logging
 
+from SocAI.utils.compactor import summarize_threat_intelligence
 from SocAI.utils.redactron import replace_with_fake_elements
 
 
-def summarize(alert_info, sensitive_info, vector_count):
+def summarize(alert_info, sensitive_info, vector_count, previous_verdicts=None, occurrences=1,
+              compact_threat_intelligence=False):
     try:
         cleaned_alert_info, replacements = replace_with_fake_elements(alert_info, sensitive_info)
         cleaned_log_info = cleaned_alert_info['data']
 
         threat_intel_info = cleaned_alert_info.get('ti_result')
-        if threat_intel_info:
+        if threat_intel_info and compact_threat_intelligence:
+            threat_intel_info_text = f"The obtained results from querying the threat intelligence platform for IP " \
+                                     f"addresses, domains, and email information are:\n" \
+                                     f"{summarize_threat_intelligence(threat_intel_info)}"
+        elif threat_intel_info:
             threat_intel_info_text = f"The obtained results from querying the threat intelligence platform for IP " \
                                      f"addresses, domains, and email information are presented in" \
                                      f" JSON format as follows: {json.dumps(threat_intel_info)}"
         else:
             threat_intel_info_text = ""
 
+        if previous_verdicts:
+            previous_verdicts_text = f"The most similar of them were classified as: {', '.join(previous_verdicts)}."
+        else:
+            previous_verdicts_text = ""
+
+        if occurrences > 1:
+            occurrences_text = f"This alert was received {occurrences} times with only timestamps, identifiers, " \
+                               f"counters or ports changing."
+        else:
+            occurrences_text = ""
+
         payload = f"""{threat_intel_info_text}
-        There were {vector_count} similar records in the past.
+        There were {vector_count} similar records in the past. {previous_verdicts_text} {occurrences_text}
         Log or Alert Information:
         {cleaned_log_info}
         """
@@ -0,0 +1,267 @@
+import bisect
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a regex over a small alert to a ChatGPT request with retries
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        A metric in the Prometheus text format, with one sample per combination of label values.
+
+        Parameters:
+        - name (str): Name of the metric.
+        - documentation (str): HELP line of the metric.
+        - labelnames (tuple): Names of the labels, their values are given as keyword arguments.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """Return the samples as [label values, value] pairs, JSON serializable."""
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, samples):
+        """Add the samples of the same metric from another process."""
+        with self.lock:
+            for key, value in samples:
+                self.values[tuple(key)] = self._add(self.values.get(tuple(key)), value)
+
+    @staticmethod
+    def _add(current, value):
+        return value if current is None else current + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(self.snapshot()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{self._labels(key)} {_format(value)}"]
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        """A value that goes up and down. With `function` the value is read from it at every scrape."""
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self):
+        if self.function:
+            try:
+                self.set(self.function())
+            except Exception as e:
+                logging.error(f"Error reading the {self.name} gauge: {str(e)}")
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # Counts per bucket (not cumulative), then the +Inf bucket, the sum and the count
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            sample = self.values.get(key)
+            if sample is None:
+                sample = self.values[key] = [0] * (len(self.buckets) + 3)
+            sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), list(value)] for key, value in self.values.items()]
+
+    @staticmethod
+    def _add(current, value):
+        return list(value) if current is None else [a + b for a, b in zip(current, value)]
+
+    def _render_sample(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), value):
+            cumulative += count
+            le = '+Inf' if bound == math.inf else _format(bound)
+            lines.append(f"{self.name}_bucket{self._labels(key, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {_format(value[-2])}")
+        lines.append(f"{self.name}_count{self._labels(key)} {value[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        The metrics of the process, rendered in the Prometheus text format.
+
+        Worker processes periodically write a snapshot of their metrics to a shared directory, the API process
+        adds them to its own metrics when rendering.
+        """
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            # Modules may be imported twice (e.g. as __main__), keep the first definition
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """Return the definition and the samples of every metric, JSON serializable."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: {'type': metric.type, 'help': metric.documentation,
+                              'labelnames': list(metric.labelnames), 'buckets': list(getattr(metric, 'buckets', ())),
+                              # Gauges read at scrape time describe shared state (e.g. the queue), every process
+                              # would report the same value
+                              'samples': [] if getattr(metric, 'function', None) else metric.snapshot()}
+                for metric in metrics}
+
+    def write_snapshot(self, directory):
+        """Write the metrics of this process to `directory`, replacing its previous snapshot."""
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f"{path}.tmp", path)
+
+    def render(self, directory=None):
+        """
+        Return the metrics in the Prometheus text format, adding the snapshots written to `directory` by other
+        processes.
+        """
+        snapshots = [self.snapshot()]
+        for path in glob.glob(os.path.join(directory, '*.json')) if directory else []:
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError) as e:
+                logging.error(f"Error reading the metrics snapshot {path}: {str(e)}")
+
+        with self.lock:
+            metrics = list(self.metrics.values())
+        # The gauges read at scrape time are rendered as they are, the other metrics are added up
+        merged = {metric.name: metric for metric in metrics if getattr(metric, 'function', None)}
+        for snapshot in snapshots:
+            for name, definition in snapshot.items():
+                if name not in merged:
+                    kind = METRIC_TYPES[definition['type']]
+                    merged[name] = kind(name, definition['help'], definition['labelnames'])
+                    if kind is Histogram:
+                        merged[name].buckets = tuple(definition['buckets'])
+                if not getattr(merged[name], 'function', None):
+                    merged[name].merge(definition['samples'])
+        return '\n'.join(line for metric in merged.values() for line in metric.render()) + '\n'
+
+
+class SnapshotWriter(threading.Thread):
+    def __init__(self, registry, directory, interval=5):
+        """Write the snapshot of the registry to `directory` every `interval` seconds."""
+        super().__init__(daemon=True, name='metrics-snapshot')
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.registry.write_snapshot(self.directory)
+        except OSError as e:
+            logging.error(f"Error writing the metrics snapshot: {str(e)}")
+
+    def stop(self):
+        self.stopping.set()
+        self.write()
+
+
+def _format(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+METRIC_TYPES = {kind.type: kind for kind in (Counter, Gauge, Histogram)}
+
+# Registry of the process, metrics are declared by the modules they measure
+registry = MetricsRegistry()
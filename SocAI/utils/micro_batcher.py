@@ -0,0 +1,85 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    def __init__(self, handler, max_batch_size=64, max_latency=0.05, cost_function=None, max_cost=None,
+                 name='micro-batcher'):
+        """
+        Group items submitted by many threads into batches handled by a single call.
+
+        A batch is handed over when it holds `max_batch_size` items, when adding the next item would exceed
+        `max_cost`, or `max_latency` seconds after its first item arrived, whichever comes first.
+
+        Parameters:
+        - handler (callable): Receives a list of items and returns a list with one result per item, in order.
+        - max_batch_size (int): Maximum number of items per batch.
+        - max_latency (float): Maximum seconds an item waits for the batch to fill up.
+        - cost_function (callable): Optional function returning the cost of an item, e.g. its number of tokens.
+        - max_cost (float): Maximum total cost of a batch. Only used together with cost_function.
+        - name (str): Name of the background thread.
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.cost_function = cost_function
+        self.max_cost = max_cost
+
+        self.pending = queue.Queue()
+        # Item that did not fit in the previous batch because of its cost
+        self.carry_over = None
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """
+        Add an item to the next batch.
+
+        Returns:
+        - future (Future): Resolved with the result of the item, or the exception raised by the handler.
+        """
+        future = Future()
+        self.pending.put((item, future))
+        return future
+
+    def _cost(self, item):
+        return self.cost_function(item) if self.cost_function else 0
+
+    def _next_batch(self):
+        batch = [self.carry_over] if self.carry_over else [self.pending.get()]
+        self.carry_over = None
+        cost = self._cost(batch[0][0])
+        deadline = time.monotonic() + self.max_latency
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if self.max_cost is not None and cost + self._cost(entry[0]) > self.max_cost:
+                self.carry_over = entry
+                break
+            batch.append(entry)
+            cost += self._cost(entry[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            futures = [future for _, future in batch]
+            try:
+                results = self.handler([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"The handler returned {len(results)} results for {len(batch)} items")
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            except Exception as e:
+                logging.error(f"An error has occurred while handling a batch of {len(batch)} items: {e}")
+                for future in futures:
+                    future.set_exception(e)
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import re
+from collections import namedtuple
+
+# A rule replaces every match of its pattern, rules run in order
+NormalizationRule = namedtuple('NormalizationRule', ['name', 'pattern', 'replacement'])
+
+COUNTER_KEYS = r'(?:src_?port|dst_?port|source_?port|destination_?port|sport|dport|spt|dpt|port|event_?id|' \
+               r'record_?id|seq|sequence|count|counter|ppid|pid)'
+
+DEFAULT_RULES = (
+    NormalizationRule('timestamp', re.compile(
+        r'\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?\b'
+        r'|\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) {1,2}\d{1,2} \d{2}:\d{2}:\d{2}\b'
+        r'|\b1\d{9}(?:\d{3})?\b'), '<TIMESTAMP>'),
+    NormalizationRule('uuid', re.compile(
+        r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    NormalizationRule('counter', re.compile(
+        rf'(?i)(\b{COUNTER_KEYS}"?\s*[:=]\s*)"?\d+"?'), r'\1<NUM>'),
+    NormalizationRule('ip_port', re.compile(r'(\b(?:\d{1,3}\.){3}\d{1,3}):\d{1,5}\b'), r'\1:<PORT>'),
+)
+
+
+class AlertNormalizer:
+    def __init__(self, rules=DEFAULT_RULES, collapse_repeated_lines=True):
+        """
+        Reduce an alert to its template, so alerts that only differ in timestamps, identifiers, counters or ports
+        share the same normalized text and fingerprint.
+
+        Parameters:
+        - rules (iterable): The NormalizationRule applied, in order. Extend DEFAULT_RULES to add rules.
+        - collapse_repeated_lines (bool): Replace consecutive identical lines by one line and their count.
+        """
+        self.rules = tuple(rules)
+        self.collapse_repeated_lines = collapse_repeated_lines
+
+    @staticmethod
+    def canonicalize(text):
+        """
+        Serialize JSON alerts with sorted keys and no whitespace, other alerts are returned unchanged. Non-ASCII
+        characters are kept as they are, the prompts strip the backslashes of \\u escapes.
+        """
+        try:
+            return json.dumps(json.loads(text), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        except (TypeError, ValueError):
+            return text
+
+    def normalize(self, text):
+        normalized = self.canonicalize(text)
+        for rule in self.rules:
+            normalized = rule.pattern.sub(rule.replacement, normalized)
+        if self.collapse_repeated_lines:
+            normalized = collapse_repeated_lines(normalized)
+        return normalized
+
+    def fingerprint(self, text):
+        """
+        Return the sha256 of the normalized alert.
+        """
+        return hashlib.sha256(self.normalize(text).encode()).hexdigest()
+
+
+def collapse_repeated_lines(text):
+    """
+    Replace runs of identical consecutive lines by a single line followed by the number of repetitions.
+    """
+    lines = text.split('\n')
+    if len(lines) < 2:
+        return text
+
+    collapsed = []
+    previous, count = lines[0], 1
+    for line in lines[1:] + [None]:
+        if line == previous:
+            count += 1
+            continue
+        collapsed.append(previous if count == 1 else f"{previous} [repeated {count} times]")
+        previous, count = line, 1
+    return '\n'.join(collapsed)
@@ -0,0 +1,36 @@
+import json
+
+SEVERITY_PRIORITIES = {
+    'critical': 3,
+    'high': 2,
+    'medium': 1,
+    'moderate': 1,
+    'low': 0,
+    'informational': 0,
+    'info': 0,
+}
+
+SEVERITY_KEYS = ('severity', 'severity_label', 'priority', 'level')
+
+
+def severity_priority(data: str):
+    """
+    Returns the queue priority of an alert from the severity found in its payload.
+
+    The severity is looked up in the top level of the JSON document and one level below it (e.g. rule.severity).
+    Alerts that are not JSON or have no known severity get priority 0.
+    """
+    try:
+        alert = json.loads(data)
+    except (TypeError, ValueError):
+        return 0
+    if not isinstance(alert, dict):
+        return 0
+
+    candidates = [alert] + [value for value in alert.values() if isinstance(value, dict)]
+    for candidate in candidates:
+        for key in SEVERITY_KEYS:
+            value = candidate.get(key)
+            if isinstance(value, str) and value.strip().lower() in SEVERITY_PRIORITIES:
+                return SEVERITY_PRIORITIES[value.strip().lower()]
+    return 0
@@ -1,26 +1,104 @@
 import hashlib
+import json
 import logging
 import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Columns of the 'results' table read back, see _result
+RESULT_COLUMNS = "seq, id, classification, reasoning, next_steps, verdict_source, completed_at"
 
 
 class QueueSystem:
-    def __init__(self, path):
+    def __init__(self, path, lease_seconds=300, max_attempts=5, busy_timeout=5000, priority_function=None,
+                 normalizer=None, coalesce_window=0):
         """
         Initialize the QueueSystem with the specified SQLite database file.
 
         Parameters:
         - db_file (str): The path to the SQLite database file.
+        - lease_seconds (int): How long a dequeued item stays invisible to other consumers before it is
+          delivered again.
+        - max_attempts (int): Number of deliveries after which a failing item is moved to the dead-letter table.
+        - busy_timeout (int): Milliseconds a connection waits for the write lock before failing.
+        - priority_function (callable): Optional function returning the priority of the data, higher priorities
+          are dequeued first. All data has priority 0 if omitted.
+        - normalizer (AlertNormalizer): Optional normalizer computing the template fingerprint of the data.
+        - coalesce_window (int): Seconds during which data with the fingerprint of a waiting item is merged into
+          it, increasing its occurrence count, instead of being enqueued. 0 disables coalescing.
         """
         self.db_file = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.busy_timeout = busy_timeout
+        self.priority_function = priority_function
+        self.normalizer = normalizer
+        self.coalesce_window = coalesce_window
+
+        # One long-lived connection per thread, sqlite3 connections must not be shared between threads
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
 
         self.create_table()
 
+    def _connection(self):
+        """
+        Return the connection of the calling thread, opening it on first use.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Transactions are handled explicitly by _transaction
+            conn = sqlite3.connect(self.db_file, isolation_level=None, timeout=self.busy_timeout / 1000)
+            # WAL lets the API enqueue while a worker reads, NORMAL only fsyncs at checkpoints
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        """
+        Run the enclosed statements in a single transaction of the calling thread's connection.
+
+        Parameters:
+        - immediate (bool): Take the write lock when the transaction starts instead of on the first write.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """
+        Close every connection opened by this QueueSystem.
+        """
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    # Connections can only be closed from the thread that opened them
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
     def create_table(self):
         """
-        Create the 'queue' table in the database if it doesn't exist.
+        Create the 'queue', 'dead_letter' and 'results' tables in the database if they don't exist.
         """
         try:
-            with sqlite3.connect(self.db_file) as conn:
+            with self._transaction() as conn:
                 # Create the 'queue' table if it doesn't exist
                 conn.execute('''
                     CREATE TABLE IF NOT EXISTS queue (
@@ -28,64 +106,348 @@ class QueueSystem:
                         data TEXT
                     )
                 ''')
+                # Queues created by older versions only have the id and data columns
+                self._add_missing_columns(conn, 'queue', {
+                    'enqueued_at': 'REAL',
+                    'claimed_by': 'TEXT',
+                    'lease_until': 'REAL',
+                    'attempts': 'INTEGER NOT NULL DEFAULT 0',
+                    'last_error': 'TEXT',
+                    'priority': 'INTEGER NOT NULL DEFAULT 0',
+                    'fingerprint': 'TEXT',
+                    'occurrences': 'INTEGER NOT NULL DEFAULT 1',
+                })
+                conn.execute('CREATE INDEX IF NOT EXISTS queue_lease_until ON queue (lease_until)')
+                conn.execute('CREATE INDEX IF NOT EXISTS queue_priority ON queue (priority DESC, enqueued_at)')
+                conn.execute('CREATE INDEX IF NOT EXISTS queue_fingerprint ON queue (fingerprint, enqueued_at)')
+
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS dead_letter (
+                        id TEXT PRIMARY KEY,
+                        data TEXT,
+                        attempts INTEGER,
+                        last_error TEXT,
+                        failed_at REAL
+                    )
+                ''')
+
+                # Verdicts of the processed items, the sequence number is the cursor of the results feed
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS results (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id TEXT,
+                        classification TEXT,
+                        reasoning TEXT,
+                        next_steps TEXT,
+                        verdict_source TEXT,
+                        completed_at REAL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS results_id ON results (id, seq)')
+                conn.execute('CREATE INDEX IF NOT EXISTS results_completed_at ON results (completed_at)')
         except sqlite3.Error as e:
             raise ValueError(f"Error creating table") from e
 
+    @staticmethod
+    def _add_missing_columns(conn, table, columns):
+        existing_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, definition in columns.items():
+            if name not in existing_columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    @staticmethod
+    def key(data):
+        """
+        Return the deduplication key of the data, the sha256 of its content.
+        """
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _priority(self, data):
+        return self.priority_function(data) if self.priority_function else 0
+
     def enqueue(self, data):
         """
         Enqueue data into the 'queue' table.
 
         Parameters:
         - data: The data to be enqueued.
+
+        Returns:
+        - id (str): The key of the enqueued data, or of the waiting item it was coalesced into. A ValueError is
+          raised if the data could not be written.
         """
         try:
-            with sqlite3.connect(self.db_file) as conn:
-                # Insert data into the 'queue' table
-                conn.execute("INSERT INTO queue (id, data) VALUES (?, ?)",
-                             (hashlib.sha256(data.encode()).hexdigest(), data,))
-
-        except sqlite3.IntegrityError:
+            with self._transaction() as conn:
+                item_id, status = self._insert(conn, data, time.time())
+        except sqlite3.Error as e:
+            raise ValueError("Error enqueuing data") from e
+        if status == 'duplicate':
             logging.info(f"The element already exists in the queue")
+        return item_id
+
+    def enqueue_many(self, data_list):
+        """
+        Enqueue a batch of data into the 'queue' table using a single transaction.
+
+        Parameters:
+        - data_list (list): The data to be enqueued.
+
+        Returns:
+        - results (list): One (id, status) tuple per element of data_list. The status is 'accepted', 'duplicate'
+          when the same data is already queued, or 'coalesced' when it was merged into a waiting item.
+        """
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                return [self._insert(conn, data, now) for data in data_list]
         except sqlite3.Error as e:
-            logging.info(f"Error enqueuing data:{str(e)}")
+            raise ValueError("Error enqueuing data") from e
+
+    def _insert(self, conn, data, now):
+        fingerprint = self.normalizer.fingerprint(data) if self.normalizer else None
 
-    def dequeue(self, limit=1):
+        if fingerprint and self.coalesce_window:
+            row = conn.execute("SELECT id FROM queue WHERE fingerprint = ? AND enqueued_at >= ? "
+                               "AND claimed_by IS NULL LIMIT 1", (fingerprint, now - self.coalesce_window)).fetchone()
+            if row:
+                conn.execute("UPDATE queue SET occurrences = occurrences + 1 WHERE id = ?", (row[0],))
+                return row[0], 'coalesced'
+
+        item_id = self.key(data)
+        cursor = conn.execute("INSERT OR IGNORE INTO queue (id, data, enqueued_at, priority, fingerprint) "
+                              "VALUES (?, ?, ?, ?, ?)", (item_id, data, now, self._priority(data), fingerprint))
+        return item_id, 'accepted' if cursor.rowcount == 1 else 'duplicate'
+
+    def dequeue(self, limit=1, consumer=None):
         """
-        Dequeue data from the 'queue' table.
+        Claim data from the 'queue' table.
+
+        The selected rows are leased to the consumer inside a single write transaction, so concurrent consumers
+        never receive the same row. A row whose lease expired (e.g. its consumer crashed) is delivered again. Rows
+        that were already delivered `max_attempts` times are moved to the 'dead_letter' table instead. Rows with a
+        higher priority are dequeued first, rows with the same priority in the order they were enqueued.
 
         Parameters:
         - limit (int): The maximum number of items to dequeue. Defaults to 1.
+        - consumer (str): Identifier of the consumer claiming the rows. A random one is used if omitted.
 
         Returns:
-        - rows (list): The dequeued rows from the 'queue' table.
+        - rows (list): The dequeued (id, data, occurrences) rows from the 'queue' table.
         """
+        consumer = consumer or uuid.uuid4().hex
+        now = time.time()
         try:
-            with sqlite3.connect(self.db_file) as conn:
-                cursor = conn.cursor()
-                # Select the specified number of rows from the 'queue' table
-                cursor.execute("SELECT id, data FROM queue LIMIT ?", (limit,))
+            # Take the write lock up front so the select and the claim are atomic
+            with self._transaction(immediate=True) as conn:
+                self._dead_letter_exhausted(conn, now)
+
+                cursor = conn.execute(
+                    "SELECT id, data, occurrences FROM queue WHERE lease_until IS NULL OR lease_until < ? "
+                    "ORDER BY priority DESC, enqueued_at LIMIT ?",
+                    (now, limit))
                 rows = cursor.fetchall()
-                # Get the IDs from the selected rows
+
                 ids = [row[0] for row in rows]
-                conn.commit()
+                if ids:
+                    placeholders = ', '.join('?' * len(ids))
+                    conn.execute(f"UPDATE queue SET claimed_by = ?, lease_until = ?, attempts = attempts + 1 "
+                                 f"WHERE id IN ({placeholders})", (consumer, now + self.lease_seconds, *ids))
                 return rows
         except sqlite3.Error as e:
             raise ValueError("Error dequeuing data") from e
 
-    def delete_processed(self, id_list):
+    def depth(self):
+        """
+        Return the number of items in the 'queue' table, including the ones being processed.
+        """
+        try:
+            return self._connection().execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+        except sqlite3.Error as e:
+            raise ValueError("Error counting the queue") from e
+
+    def stats(self):
+        """
+        Return the depth of the 'queue' table, the age in seconds of its oldest item and the depth of the
+        'dead_letter' table.
+        """
+        try:
+            conn = self._connection()
+            depth, oldest = conn.execute("SELECT COUNT(*), MIN(enqueued_at) FROM queue").fetchone()
+            dead_letter = conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+        except sqlite3.Error as e:
+            raise ValueError("Error reading the queue statistics") from e
+        return {'depth': depth, 'oldest_age': time.time() - oldest if oldest else 0, 'dead_letter': dead_letter}
+
+    def _dead_letter_exhausted(self, conn, now):
+        """Move available rows that have used up all their attempts to the 'dead_letter' table."""
+        condition = "attempts >= ? AND (lease_until IS NULL OR lease_until < ?)"
+        conn.execute(f"INSERT OR REPLACE INTO dead_letter (id, data, attempts, last_error, failed_at) "
+                     f"SELECT id, data, attempts, last_error, ? FROM queue WHERE {condition}",
+                     (now, self.max_attempts, now))
+        cursor = conn.execute(f"DELETE FROM queue WHERE {condition}", (self.max_attempts, now))
+        if cursor.rowcount:
+            logging.error(f"{cursor.rowcount} element(s) exceeded {self.max_attempts} attempts and were moved "
+                          f"to the dead-letter table")
+
+    def release(self, id_list, error=None, delay=0, refund_attempt=False, consumer=None):
+        """
+        Return claimed data to the 'queue' table so it can be delivered again.
+
+        Parameters:
+        - id_list (list): A list of IDs whose lease is released.
+        - error (str): Optional description of the failure, kept for the dead-letter table.
+        - delay (int): Seconds to wait before the data becomes visible again. Defaults to 0.
+        - refund_attempt (bool): Do not count the delivery, e.g. when the consumer shuts down. Defaults to False.
+        - consumer (str): Only release the rows still leased to this consumer. Any claim is released if omitted.
+        """
+        try:
+            with self._transaction() as conn:
+                condition, parameters = self._claimed(id_list, consumer)
+                conn.execute(f"UPDATE queue SET claimed_by = NULL, lease_until = ?, "
+                             f"last_error = COALESCE(?, last_error), attempts = MAX(attempts - ?, 0) "
+                             f"WHERE {condition}",
+                             (time.time() + delay if delay else None, error, int(refund_attempt), *parameters))
+        except sqlite3.Error as e:
+            logging.info(f"Error releasing data: {str(e)}")
+
+    def extend_lease(self, id_list, consumer):
+        """
+        Push back the end of the leases the consumer still holds, for items that take longer than a lease to
+        process.
+
+        Parameters:
+        - id_list (list): A list of IDs being processed by the consumer.
+        - consumer (str): Identifier the rows were dequeued with.
+
+        Returns:
+        - lost (set): The IDs that are not leased to the consumer anymore.
+        """
+        try:
+            with self._transaction() as conn:
+                condition, parameters = self._claimed(id_list, consumer)
+                conn.execute(f"UPDATE queue SET lease_until = ? WHERE {condition}",
+                             (time.time() + self.lease_seconds, *parameters))
+                held = conn.execute(f"SELECT id FROM queue WHERE {condition}", parameters).fetchall()
+        except sqlite3.Error as e:
+            raise ValueError("Error extending the leases") from e
+        return set(id_list) - {row[0] for row in held}
+
+    def delete_processed(self, id_list, consumer=None):
         """
         Delete processed data from the 'queue' table.
 
         Parameters:
         - id_list (list): A list of IDs to be deleted from the 'queue' table.
+        - consumer (str): Only delete the rows still leased to this consumer. Any row is deleted if omitted.
         """
         try:
-            with sqlite3.connect(self.db_file) as conn:
-                cursor = conn.cursor()
-                placeholders = ', '.join('?' * len(id_list))
-                query = f"DELETE FROM queue WHERE id IN ({placeholders})"
+            with self._transaction() as conn:
+                condition, parameters = self._claimed(id_list, consumer)
                 # Delete the rows with the specified IDs
-                cursor.execute(query, id_list)
-                conn.commit()
+                conn.execute(f"DELETE FROM queue WHERE {condition}", parameters)
         except sqlite3.Error as e:
             logging.info(f"Error deleting processed data: {str(e)}")
+
+    def complete(self, item_id, result, consumer=None):
+        """
+        Delete a processed item from the 'queue' table and record its result, in a single transaction.
+
+        Parameters:
+        - item_id (str): The ID of the processed item.
+        - result (dict): Its verdict, with the keys classification, reasoning, next_steps and verdict_source.
+        - consumer (str): Only complete the item if it is still leased to this consumer. The consumer that claimed
+          it since records its own result.
+
+        Returns:
+        - completed (bool): Whether the result was recorded.
+        """
+        try:
+            with self._transaction() as conn:
+                condition, parameters = self._claimed([item_id], consumer)
+                if not conn.execute(f"DELETE FROM queue WHERE {condition}", parameters).rowcount and consumer:
+                    logging.warning(f"The lease of {item_id} expired and was claimed again, its result is not "
+                                    f"recorded")
+                    return False
+                conn.execute("INSERT INTO results (id, classification, reasoning, next_steps, verdict_source, "
+                             "completed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                             (item_id, result['classification'], json.dumps(result['reasoning']),
+                              json.dumps(result['next_steps']), result['verdict_source'], time.time()))
+                return True
+        except sqlite3.Error as e:
+            logging.info(f"Error completing processed data: {str(e)}")
+            return False
+
+    @staticmethod
+    def _claimed(id_list, consumer):
+        """WHERE condition and parameters of the rows of the list, leased to the consumer when one is given."""
+        condition = f"id IN ({', '.join('?' * len(id_list))})"
+        if consumer is None:
+            return condition, tuple(id_list)
+        return condition + " AND claimed_by = ?", (*id_list, consumer)
+
+    def is_queued(self, item_id):
+        """
+        Return whether the item is waiting or being processed in the 'queue' table.
+        """
+        try:
+            return self._connection().execute("SELECT 1 FROM queue WHERE id = ?", (item_id,)).fetchone() is not None
+        except sqlite3.Error as e:
+            raise ValueError("Error reading the queue") from e
+
+    def result(self, item_id):
+        """
+        Return the latest result of the item, or None if it has none.
+        """
+        try:
+            row = self._connection().execute(f"SELECT {RESULT_COLUMNS} FROM results WHERE id = ? "
+                                             f"ORDER BY seq DESC LIMIT 1", (item_id,)).fetchone()
+        except sqlite3.Error as e:
+            raise ValueError("Error reading the results") from e
+        return _result(row) if row else None
+
+    def results_since(self, cursor, limit=100):
+        """
+        Return the results recorded after the cursor, the sequence number of a previous result, oldest first.
+        """
+        try:
+            rows = self._connection().execute(f"SELECT {RESULT_COLUMNS} FROM results WHERE seq > ? ORDER BY seq "
+                                              f"LIMIT ?", (cursor, limit)).fetchall()
+        except sqlite3.Error as e:
+            raise ValueError("Error reading the results") from e
+        return [_result(row) for row in rows]
+
+    def latest_results(self, limit):
+        """
+        Return the `limit` most recent results, oldest first.
+        """
+        try:
+            rows = self._connection().execute(f"SELECT {RESULT_COLUMNS} FROM results ORDER BY seq DESC LIMIT ?",
+                                              (limit,)).fetchall()
+        except sqlite3.Error as e:
+            raise ValueError("Error reading the results") from e
+        return [_result(row) for row in reversed(rows)]
+
+    def last_result_cursor(self):
+        """
+        Return the sequence number of the latest result, 0 if there is none.
+        """
+        try:
+            return self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM results").fetchone()[0]
+        except sqlite3.Error as e:
+            raise ValueError("Error reading the results") from e
+
+    def prune_results(self, before):
+        """
+        Delete the results recorded before the given time.
+        """
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM results WHERE completed_at < ?", (before,))
+        except sqlite3.Error as e:
+            logging.info(f"Error pruning results: {str(e)}")
+
+
+def _result(row):
+    seq, item_id, classification, reasoning, next_steps, verdict_source, completed_at = row
+    return {'cursor': seq, 'id': item_id, 'classification': classification, 'reasoning': json.loads(reasoning),
+            'next_steps': json.loads(next_steps), 'verdict_source': verdict_source, 'completed_at': completed_at}
@@ -1,53 +1,157 @@
-import json
+import hashlib
+import hmac
 import logging
+import os
 import re
+import threading
+
 from faker import Faker
 
+from SocAI.utils.entity_extractor import default_extractor
+
 
 def extract_sensitive_information(data: str):
     """
-    Scans the values in a dictionary using regular expressions to find email addresses, public IP addresses and domains.
+    Scans the data to find email addresses, IP addresses, domains, URLs and file hashes.
+    """
+    return default_extractor.extract(data)
+
+
+class RedactionEngine:
     """
-    ip_pattern = r"\b(?:\d{1,3}\.){3}\d{1,3}\b"
-    domain_pattern = r"/^(?:https?:)?(?:\/\/)?(?:[^@\n]+@)?(?:www\.)?([^:\/\n]+)/im"
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+    Replaces sensitive values by fake ones and back, in a single pass over the data.
 
-    ips = re.findall(ip_pattern, data)
-    domains = re.findall(domain_pattern, data)
-    emails = re.findall(email_pattern, data)
+    All the values of an alert are compiled into one trie-shaped regular expression, so the data is scanned once
+    whatever the number of entities, and a value that is a substring of another one (e.g. a domain inside an
+    email) never replaces part of the longer value: at each position the longest value wins.
+    """
 
-    return {
-        'ip': ips,
-        'domain': domains,
-        'email': emails
+    # Generates the fake value of each kind of sensitive information from a Faker and the original value
+    fake_generators = {
+        'ip': lambda fake, value: fake.ipv6() if ':' in value else fake.ipv4_public(),
+        'private_ip': lambda fake, value: fake.ipv6() if ':' in value else fake.ipv4_private(),
+        'email': lambda fake, value: fake.safe_email(),
+        'domain': lambda fake, value: fake.domain_name(),
     }
 
+    def __init__(self, seed=None):
+        """
+        Parameters:
+        - seed (str): Secret key of the fake values, derived from it and the original value with an HMAC, so a
+          value gets the same fake one in every alert, thread and process. None draws them at random.
+        """
+        self.seed = seed
+        # Faker instances are expensive to build and not thread-safe, keep one per thread
+        self._local = threading.local()
+
+    def _faker(self):
+        fake = getattr(self._local, 'faker', None)
+        if fake is None:
+            fake = self._local.faker = Faker()
+        return fake
+
+    def replacements(self, sensitive_information):
+        """
+        Return a {original: fake} mapping for the sensitive information. Fake values are unique and never equal
+        to an original value, so the mapping can be reversed.
+        """
+        fake = self._faker()
+        originals = {value for kind in self.fake_generators for value in sensitive_information.get(kind, [])}
+        replaces = {}
+        used = set()
+        for kind, generator in self.fake_generators.items():
+            for original in sensitive_information.get(kind, []):
+                if original in replaces:
+                    continue
+                if self.seed is not None:
+                    fake.seed_instance(hmac.new(self.seed.encode(), f"{kind}:{original}".encode(),
+                                                hashlib.sha256).hexdigest())
+                value = generator(fake, original)
+                attempts = 1
+                while value in used or value in originals:
+                    value = generator(fake, original)
+                    attempts += 1
+                    if attempts > 10:
+                        value = f"{attempts}{value}"
+                replaces[original] = value
+                used.add(value)
+        return replaces
 
-def replace_with_fake_elements(data_dict: [dict, list], sensitive_information):
+    def redact(self, data, replaces):
+        """Replace the keys of `replaces` by their values everywhere in data (strings, lists and dicts)."""
+        return substitute(data, replaces)
+
+    def restore(self, data, replaces):
+        """Replace the fake values produced by `redact` by the original ones."""
+        return substitute(data, {fake: original for original, fake in replaces.items()})
+
+
+def compile_values(values):
     """
-    Replaces them with an autogenerated value while preserving the original format.
+    Compile literal values into one regular expression shaped like a trie of the values. Optional suffixes are
+    greedy, so the longest value matches at each position.
     """
-    replaces = {}
-    try:
-        fake = Faker()
+    trie = {}
+    for value in values:
+        node = trie
+        for character in value:
+            node = node.setdefault(character, {})
+        node[''] = True
 
-        string_format = json.dumps(data_dict)
+    def build(node):
+        branches = [re.escape(character) + build(child) for character, child in node.items() if character != '']
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
 
-    # For IPs
-        for match in sensitive_information['ip']:
-            replaces[match] = fake.ipv4_public()
-    # For emails
-        for match in sensitive_information['email']:
-            replaces[match] = fake.safe_email()
+    return re.compile(build(trie))
 
-    # For domains
-        for match in sensitive_information['domain']:
-            replaces[match] = fake.domain_name()
 
-        for key, value in replaces.items():
-            string_format = string_format.replace(key, value)
+def substitute(data, mapping):
+    """
+    Replace every key of mapping by its value in a single pass over each string of data. Dicts and lists are
+    walked recursively, keys included.
+    """
+    if not mapping:
+        return data
+    pattern = compile_values(mapping)
 
-        return json.loads(string_format), replaces
+    def replace(match):
+        return mapping[match.group(0)]
+
+    def walk(value):
+        if isinstance(value, str):
+            return pattern.sub(replace, value)
+        if isinstance(value, dict):
+            return {walk(key): walk(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [walk(item) for item in value]
+        return value
+
+    return walk(data)
+
+
+# Fake values are random unless a secret REDACTION_SEED is configured, anyone knowing the seed can check whether a
+# fake value stands for a guessed original one
+_default_engine = RedactionEngine(seed=os.getenv("REDACTION_SEED") or None)
+
+
+def replace_with_fake_elements(data_dict: [dict, list], sensitive_information, engine: RedactionEngine = None):
+    """
+    Replaces them with an autogenerated value while preserving the original format.
+    """
+    engine = engine or _default_engine
+    try:
+        replaces = engine.replacements(sensitive_information)
+        return engine.redact(data_dict, replaces), replaces
 
     except Exception as e:
         logging.error(e)
+
+
+def restore_original_values(data, replaces, engine: RedactionEngine = None):
+    """
+    Replaces the autogenerated values of replace_with_fake_elements by the original ones.
+    """
+    return (engine or _default_engine).restore(data, replaces)
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from collections import deque
+
+
+class ResultBuffer:
+    def __init__(self, capacity=10000):
+        """
+        The most recent results in memory, in the order they were recorded, with an index by item id.
+
+        Results are dicts with a 'cursor', the sequence number of the result in the 'results' table of the queue.
+        Every result recorded after `floor` is in the buffer, older ones have to be read from the queue.
+
+        Parameters:
+        - capacity (int): Number of results kept, the oldest ones are evicted first.
+        """
+        self.results = deque(maxlen=capacity)
+        self.by_id = {}
+        self.lock = threading.Lock()
+        # None until the buffer is loaded, then the cursor of the last result that is not in the buffer
+        self.floor = None
+        self.cursor = 0
+
+    def load(self, results, floor):
+        """Replace the content of the buffer by the results recorded after `floor`, oldest first."""
+        with self.lock:
+            self.results.clear()
+            self.by_id = {}
+            self.floor = self.cursor = floor
+            self._extend(results)
+
+    def extend(self, results):
+        """Add newly recorded results, oldest first."""
+        with self.lock:
+            self._extend(results)
+
+    def _extend(self, results):
+        for result in results:
+            if len(self.results) == self.results.maxlen:
+                evicted = self.results[0]
+                if self.by_id.get(evicted['id']) is evicted:
+                    del self.by_id[evicted['id']]
+                self.floor = evicted['cursor']
+            self.results.append(result)
+            self.by_id[result['id']] = result
+            self.cursor = result['cursor']
+
+    def get(self, item_id):
+        """Return the latest result of the item, or None if it is not in the buffer."""
+        with self.lock:
+            return self.by_id.get(item_id)
+
+    def since(self, cursor, limit=100):
+        """
+        Return at most `limit` results recorded after the cursor, oldest first. None when some of them are not in
+        the buffer anymore, or not yet loaded.
+        """
+        with self.lock:
+            if self.floor is None or cursor < self.floor:
+                return None
+            # Consumers usually follow the feed closely, the results they miss are at the end
+            newer = []
+            for result in reversed(self.results):
+                if result['cursor'] <= cursor:
+                    break
+                newer.append(result)
+        return newer[::-1][:limit]
+
+
+class ResultPoller(threading.Thread):
+    def __init__(self, queue, buffer: ResultBuffer, interval=0.1, retention=86400, prune_interval=60):
+        """
+        Copy the results recorded by the workers, in this process or others, from the queue to the buffer.
+
+        Parameters:
+        - queue (QueueSystem): The queue the workers record their results in.
+        - buffer (ResultBuffer): The buffer to fill.
+        - interval (float): Seconds between two reads of the new results.
+        - retention (float): Seconds results are kept in the queue. 0 keeps them forever.
+        - prune_interval (float): Seconds between two deletions of the expired results.
+        """
+        super().__init__(daemon=True, name='result-poller')
+        self.queue = queue
+        self.buffer = buffer
+        self.interval = interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        pruned_at = 0
+        while not self.stopping.is_set():
+            try:
+                if self.buffer.floor is None:
+                    self._load()
+                else:
+                    self._poll()
+                if self.retention and time.monotonic() - pruned_at > self.prune_interval:
+                    self.queue.prune_results(time.time() - self.retention)
+                    pruned_at = time.monotonic()
+            except Exception as e:
+                logging.error(f"An error occurred while reading the results: {str(e)}")
+            self.stopping.wait(self.interval)
+
+    def _load(self):
+        cursor = self.queue.last_result_cursor()
+        results = self.queue.latest_results(self.buffer.results.maxlen)
+        # Results recorded between the two reads are picked up by the next poll
+        results = [result for result in results if result['cursor'] <= cursor]
+        self.buffer.load(results, results[0]['cursor'] - 1 if results else cursor)
+
+    def _poll(self):
+        # A page at a time, so a backlog of results does not delay the stop
+        while not self.stopping.is_set():
+            results = self.queue.results_since(self.buffer.cursor, self.buffer.results.maxlen)
+            self.buffer.extend(results)
+            if len(results) < self.buffer.results.maxlen:
+                return
+
+    def stop(self):
+        self.stopping.set()